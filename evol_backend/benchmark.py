@@ -0,0 +1,379 @@
+"""
+Recommendation Engine Benchmark
+Drives CelebrityProductRecommender on synthetic catalogs (80 → 1M products) without a model download
+"""
+
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from catalog import parse_price
+from instrumentation import RequestTrace, activate_trace, deactivate_trace
+from quantization import QUANTIZATION_MODES
+from recommender_engine import CelebrityProductRecommender, HashingEncoder
+from style_taxonomy import OCCASION_COMPATIBILITY, PRICE_TIERS
+
+DEFAULT_SIZES = [80, 1000, 10000, 100000]
+
+# Fragments combined into synthetic user vibe texts
+QUERY_STYLES = [
+    "Elegant and sophisticated - Refined with subtle luxury",
+    "Modern and minimal - Clean lines and understated elegance",
+    "Bold and statement-making - I want to stand out",
+    "Romantic and delicate - Soft, feminine designs",
+    "Classic and timeless - Heirloom-worthy pieces",
+]
+QUERY_TYPES = [
+    "Solitaire diamonds - Simple and stunning",
+    "Geometric designs - Modern and architectural",
+    "Multi-stone pieces - Intricate and detailed",
+    "Nature-inspired - Floral, organic motifs",
+]
+QUERY_EXTRAS = [
+    "Prefer white gold or platinum", "Rose gold preferred", "Love layered looks",
+    "Pear diamonds", "Something I can wear every day", "",
+]
+
+
+# ==================== Synthetic Data ====================
+
+class CatalogProfile:
+    """Tag, occasion, category and price distributions taken from the real catalog"""
+
+    def __init__(self, products: List[Dict], celebrities: List[Dict]):
+        self.categories = self._distribution(p['category'] for p in products)
+        self.primary_tags = self._distribution(t for p in products for t in p.get('primary_style_tags', []))
+        self.secondary_tags = self._distribution(t for p in products for t in p.get('secondary_style_tags', []))
+        self.occasions = self._distribution(o for p in products for o in p.get('occasions', []))
+        self.n_primary = self._distribution(len(p.get('primary_style_tags', [])) for p in products)
+        self.n_secondary = self._distribution(len(p.get('secondary_style_tags', [])) for p in products)
+        self.n_occasions = self._distribution(len(p.get('occasions', [])) for p in products)
+
+        log_prices = np.log([parse_price(p.get('price')) or 1.0 for p in products])
+        self.log_price_mean = float(log_prices.mean())
+        self.log_price_std = float(log_prices.std())
+
+        self.celeb_primary = self._distribution(t for c in celebrities for t in c.get('primary_vibe_tags', []))
+        self.celeb_secondary = self._distribution(t for c in celebrities for t in c.get('secondary_vibe_tags', []))
+        self.n_celeb_primary = self._distribution(len(c.get('primary_vibe_tags', [])) for c in celebrities)
+        self.n_celeb_secondary = self._distribution(len(c.get('secondary_vibe_tags', [])) for c in celebrities)
+
+    @staticmethod
+    def _distribution(values) -> Tuple[list, np.ndarray]:
+        counts = Counter(values)
+        keys = list(counts)
+        probs = np.array([counts[k] for k in keys], dtype=np.float64)
+        return keys, probs / probs.sum()
+
+    @classmethod
+    def from_files(cls, products_path: str = 'products.json',
+                   celebrities_path: str = 'celebrities.json') -> 'CatalogProfile':
+        with open(products_path, 'r', encoding='utf-8') as f:
+            products = json.load(f)
+        with open(celebrities_path, 'r', encoding='utf-8') as f:
+            celebrities = json.load(f)
+        return cls(products, celebrities)
+
+
+def _sample_tags(rng: np.random.Generator, dist: Tuple[list, np.ndarray], count: int) -> List[str]:
+    keys, probs = dist
+    count = min(count, len(keys))
+    return [keys[i] for i in rng.choice(len(keys), size=count, replace=False, p=probs)]
+
+
+def _random_embeddings(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    embeddings = rng.standard_normal((n, dim), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def generate_products(profile: CatalogProfile, n: int, rng: np.random.Generator) -> List[Dict]:
+    """Generate n synthetic products following the real catalog's distributions"""
+    cat_keys, cat_probs = profile.categories
+    categories = rng.choice(len(cat_keys), size=n, p=cat_probs)
+    n_primary = rng.choice(profile.n_primary[0], size=n, p=profile.n_primary[1])
+    n_secondary = rng.choice(profile.n_secondary[0], size=n, p=profile.n_secondary[1])
+    n_occasions = rng.choice(profile.n_occasions[0], size=n, p=profile.n_occasions[1])
+    prices = np.exp(rng.normal(profile.log_price_mean, profile.log_price_std, size=n))
+
+    products = []
+    for i in range(n):
+        category = cat_keys[categories[i]]
+        products.append({
+            'id': i + 1,
+            'name': f"Synthetic {category.split('-')[0].rstrip('s').title()} {i + 1}",
+            'description': "Diamond: EF VVS Round Diamond Setting Type: Prong (18KT Gold)",
+            'price': f"{int(prices[i]):,} INR",
+            'category': category,
+            'material': None,
+            'image_url': '',
+            'primary_style_tags': _sample_tags(rng, profile.primary_tags, int(n_primary[i])),
+            'secondary_style_tags': _sample_tags(rng, profile.secondary_tags, int(n_secondary[i])),
+            'occasions': _sample_tags(rng, profile.occasions, int(n_occasions[i])),
+            'vibe_description': "A synthetic benchmark piece."
+        })
+    return products
+
+
+def generate_celebrities(profile: CatalogProfile, n: int, rng: np.random.Generator) -> List[Dict]:
+    """Generate n synthetic celebrities following the real vibe tag distributions"""
+    celebrities = []
+    for i in range(n):
+        n_primary = int(rng.choice(profile.n_celeb_primary[0], p=profile.n_celeb_primary[1]))
+        n_secondary = int(rng.choice(profile.n_celeb_secondary[0], p=profile.n_celeb_secondary[1]))
+        celebrities.append({
+            'id': f"synthetic_{i + 1:03d}",
+            'name': f"Synthetic Celebrity {i + 1}",
+            'description': '',
+            'image_url': None,
+            'primary_vibe_tags': _sample_tags(rng, profile.celeb_primary, n_primary),
+            'secondary_vibe_tags': _sample_tags(rng, profile.celeb_secondary, n_secondary),
+            'vibe_description': "A synthetic benchmark celebrity."
+        })
+    return celebrities
+
+
+def generate_queries(n: int, rng: np.random.Generator) -> List[Dict]:
+    """Generate n synthetic requests (vibe text, occasions, budget tier)"""
+    occasions = list(OCCASION_COMPATIBILITY)
+    tiers = list(PRICE_TIERS)
+    queries = []
+    for i in range(n):
+        chosen = [occasions[j] for j in rng.choice(len(occasions), size=int(rng.integers(1, 4)), replace=False)]
+        text = (
+            f"Overall Style Preference: {QUERY_STYLES[rng.integers(len(QUERY_STYLES))]}\n"
+            f"Jewelry Type Preference: {QUERY_TYPES[rng.integers(len(QUERY_TYPES))]}\n"
+            f"Shopping For: {', '.join(chosen)}\n"
+            f"Additional Preferences: {QUERY_EXTRAS[rng.integers(len(QUERY_EXTRAS))]} (#{i})"
+        )
+        queries.append({
+            'user_vibe_text': text,
+            'user_occasions': chosen,
+            'user_budget': tiers[rng.integers(len(tiers))]
+        })
+    return queries
+
+
+def build_recommender(profile: CatalogProfile, n_products: int, n_celebrities: int,
+                      dim: int, seed: int) -> CelebrityProductRecommender:
+    """Build an in-memory recommender over a synthetic catalog"""
+    rng = np.random.default_rng(seed)
+    products = generate_products(profile, n_products, rng)
+    celebrities = generate_celebrities(profile, n_celebrities, rng)
+    return CelebrityProductRecommender.from_data(
+        celebrities=celebrities,
+        celebrity_embeddings=_random_embeddings(rng, n_celebrities, dim),
+        products=products,
+        product_embeddings=_random_embeddings(rng, n_products, dim),
+        encoder=HashingEncoder(dim)
+    )
+
+
+# ==================== Measurement ====================
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    return {
+        'mean_ms': round(float(np.mean(values)), 3) if values else 0.0,
+        'p50_ms': round(_percentile(values, 50), 3),
+        'p99_ms': round(_percentile(values, 99), 3),
+        'max_ms': round(max(values), 3) if values else 0.0
+    }
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def run_size(profile: CatalogProfile, n_products: int, args) -> Dict:
+    """Benchmark one catalog size"""
+    print(f"\n--- {n_products:,} products ---")
+    build_start = time.perf_counter()
+    recommender = build_recommender(profile, n_products, args.celebrities, args.dim, args.seed)
+    if args.quantization:
+        recommender = recommender.with_quantization(args.quantization, args.rescore_depth)
+    build_seconds = time.perf_counter() - build_start
+    print(f"Built synthetic catalog in {build_seconds:.2f}s")
+
+    queries = generate_queries(args.requests + args.warmup, np.random.default_rng(args.seed + 1))
+    for query in queries[:args.warmup]:
+        recommender.recommend_products(top_n=args.top_n, **query)
+
+    latencies: List[float] = []
+    stage_times: Dict[str, List[float]] = {}
+    loop_start = time.perf_counter()
+    for query in queries[args.warmup:]:
+        trace = RequestTrace()
+        token = activate_trace(trace)
+        start = time.perf_counter()
+        try:
+            recommender.recommend_products(top_n=args.top_n, **query)
+        finally:
+            deactivate_trace(token)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        for stage in trace.stages:
+            stage_times.setdefault(stage['stage'], []).append(stage['wall_ms'])
+        if time.perf_counter() - loop_start > args.time_budget:
+            break
+    loop_seconds = time.perf_counter() - loop_start
+
+    # Allocation peak for a single request (tracemalloc slows execution, so measured separately)
+    tracemalloc.start()
+    recommender.recommend_products(top_n=args.top_n, **queries[-1])
+    _, request_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'n_products': n_products,
+        'n_celebrities': args.celebrities,
+        'requests': len(latencies),
+        'build_seconds': round(build_seconds, 3),
+        'throughput_rps': round(len(latencies) / loop_seconds, 3) if loop_seconds > 0 else 0.0,
+        'latency': _summary(latencies),
+        'stages': {stage: _summary(times) for stage, times in stage_times.items()},
+        'request_peak_alloc_mb': round(request_peak / (1024 * 1024), 2),
+        'peak_rss_mb': _peak_rss_mb()
+    }
+    print(f"{result['requests']} requests: p50 {result['latency']['p50_ms']:.2f} ms, "
+          f"p99 {result['latency']['p99_ms']:.2f} ms, {result['throughput_rps']:.2f} req/s, "
+          f"peak RSS {result['peak_rss_mb']:.0f} MB")
+    for stage, summary in result['stages'].items():
+        print(f"  - {stage:<22} p50 {summary['p50_ms']:>10.3f} ms   p99 {summary['p99_ms']:>10.3f} ms")
+    return result
+
+
+# ==================== Baseline Comparison ====================
+
+def compare_to_baseline(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Print per-size deltas against a previous run
+
+    Returns:
+        List of regression descriptions (p50/p99 slower or throughput lower than threshold)
+    """
+    regressions = []
+    baseline_by_size = {r['n_products']: r for r in baseline.get('results', [])}
+    print("\n" + "=" * 60)
+    print(f"Comparison against baseline ({baseline.get('meta', {}).get('timestamp', 'unknown')})")
+    print("=" * 60)
+
+    for result in current['results']:
+        base = baseline_by_size.get(result['n_products'])
+        if base is None:
+            print(f"{result['n_products']:>9,} products: no baseline")
+            continue
+        checks = [
+            ('p50', base['latency']['p50_ms'], result['latency']['p50_ms'], True),
+            ('p99', base['latency']['p99_ms'], result['latency']['p99_ms'], True),
+            ('throughput', base['throughput_rps'], result['throughput_rps'], False),
+        ]
+        parts = []
+        for name, old, new, lower_is_better in checks:
+            change = (new - old) / old if old else 0.0
+            parts.append(f"{name} {old:.2f} → {new:.2f} ({change:+.1%})")
+            worse = change > threshold if lower_is_better else change < -threshold
+            if worse:
+                regressions.append(f"{result['n_products']:,} products: {name} {change:+.1%}")
+        print(f"{result['n_products']:>9,} products: " + ", ".join(parts))
+
+        for stage, summary in result['stages'].items():
+            old_stage = base.get('stages', {}).get(stage)
+            if old_stage and old_stage['p50_ms']:
+                change = (summary['p50_ms'] - old_stage['p50_ms']) / old_stage['p50_ms']
+                print(f"    {stage:<22} p50 {old_stage['p50_ms']:.3f} → {summary['p50_ms']:.3f} ms ({change:+.1%})")
+    return regressions
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Benchmark CelebrityProductRecommender on synthetic catalogs")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated catalog sizes (e.g. 80,1000,10000,100000,1000000)")
+    parser.add_argument('--celebrities', type=int, default=10, help="Number of synthetic celebrities")
+    parser.add_argument('--requests', type=int, default=50, help="Timed requests per catalog size")
+    parser.add_argument('--warmup', type=int, default=3, help="Untimed warm-up requests per size")
+    parser.add_argument('--time-budget', type=float, default=120.0,
+                        help="Stop issuing requests for a size after this many seconds")
+    parser.add_argument('--top-n', type=int, default=10, help="Recommendations per request")
+    parser.add_argument('--dim', type=int, default=384, help="Embedding dimension")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed")
+    parser.add_argument('--quantization', choices=QUANTIZATION_MODES, default=None,
+                        help="Score on quantized product embeddings (default: float32)")
+    parser.add_argument('--rescore-depth', type=int, default=100,
+                        help="Exact re-score depth with --quantization (0 = off)")
+    parser.add_argument('--products', default='products.json', help="Real catalog used for distributions")
+    parser.add_argument('--celebrities-file', default='celebrities.json', help="Real celebrities used for distributions")
+    parser.add_argument('--output', default=None, help="Result JSON path (default: benchmark_results/bench-<timestamp>.json)")
+    parser.add_argument('--baseline', default=None, help="Previous result JSON to compare against")
+    parser.add_argument('--regression-threshold', type=float, default=0.10,
+                        help="Relative slowdown that counts as a regression (exit code 1)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Recommendation Engine Benchmark")
+    print("=" * 60)
+
+    profile = CatalogProfile.from_files(args.products, args.celebrities_file)
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+
+    results = [run_size(profile, size, args) for size in sizes]
+
+    timestamp = datetime.utcnow().isoformat()
+    report = {
+        'meta': {
+            'timestamp': timestamp,
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'args': vars(args)
+        },
+        'results': results
+    }
+
+    output = Path(args.output) if args.output else \
+        Path('benchmark_results') / f"bench-{timestamp.replace(':', '').replace('-', '').split('.')[0]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Saved results to: {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.regression_threshold)
+        if regressions:
+            print("\n❌ Regressions:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\n✓ No regressions beyond threshold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,922 @@
+"""
+Catalog Ingestion
+Streaming readers for JSON / JSONL product feeds and the columnar index used for vectorized scoring
+"""
+
+import copy
+import json
+import logging
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from instrumentation import record_cache_lookup
+from lexical import LexicalIndex
+from style_taxonomy import STYLE_TAXONOMY, OCCASION_COMPATIBILITY, PRICE_TIERS, get_style_affinity_score
+
+logger = logging.getLogger(__name__)
+
+# Fields produced by the vector generation scripts; embeddings are loaded from the .npy store instead
+VECTOR_FIELDS = ('style_vector', 'style_text')
+
+_READ_SIZE = 1 << 16
+
+# Disjoint price bands for hard filters and facets, one per survey budget option: (name, low, high), low <= price < high
+PRICE_BANDS = (
+    ('affordable', 0.0, 50000.0),
+    ('moderate', 50000.0, 150000.0),
+    ('luxury', 150000.0, 300000.0),
+    ('ultra-luxury', 300000.0, float('inf')),
+)
+
+
+class CatalogError(ValueError):
+    """A catalog record is malformed or missing a field needed for scoring"""
+
+
+# ==================== Readers ====================
+
+def iter_json_array(fp: TextIO, read_size: int = _READ_SIZE) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array without parsing the whole file
+
+    Only one buffered chunk plus the element being decoded is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = fp.read(read_size)
+    pos = 0
+    eof = not buf
+
+    def refill(keep_from: int):
+        nonlocal buf, pos, eof
+        more = fp.read(read_size)
+        if not more:
+            eof = True
+        buf = buf[keep_from:] + more
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            refill(pos)
+
+    skip_whitespace()
+    if pos >= len(buf) or buf[pos] != '[':
+        raise CatalogError("Expected a JSON array of products")
+    pos += 1
+
+    expect_separator = False
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            raise CatalogError("Unterminated JSON array")
+        char = buf[pos]
+        if char == ']':
+            return
+        if expect_separator:
+            if char != ',':
+                raise CatalogError(f"Expected ',' between array elements, found {char!r}")
+            pos += 1
+            expect_separator = False
+            continue
+        try:
+            element, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Element spans the buffer boundary: read more and retry
+            refill(pos)
+            continue
+        yield element
+        pos = end
+        expect_separator = True
+        if pos > read_size:
+            buf = buf[pos:]
+            pos = 0
+
+
+def iter_jsonl(fp: TextIO) -> Iterator[Any]:
+    """Yield one JSON value per non-empty line"""
+    for line_no, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise CatalogError(f"Line {line_no}: {e}") from e
+
+
+def iter_catalog(path, strip_vectors: bool = True, on_error: str = 'raise') -> Iterator[Dict]:
+    """
+    Stream validated product records from a JSON array or JSONL file
+
+    Args:
+        path: products.json, products_with_vectors.json or a .jsonl/.ndjson feed
+              (the format is sniffed from the first character)
+        strip_vectors: Drop inline style_vector/style_text fields
+        on_error: 'raise' on the first invalid record, or 'skip' it with a warning
+
+    Yields:
+        Product dicts
+    """
+    path = Path(path)
+    skipped = 0
+    with open(path, 'r', encoding='utf-8') as fp:
+        first = ''
+        while True:
+            first = fp.read(1)
+            if not first or not first.isspace():
+                break
+        fp.seek(0)
+        records = iter_json_array(fp) if first == '[' else iter_jsonl(fp)
+
+        for position, record in enumerate(records):
+            try:
+                product = validate_product(record, position)
+            except CatalogError as e:
+                if on_error != 'skip':
+                    raise CatalogError(f"{path}: {e}") from e
+                skipped += 1
+                if skipped <= 10:
+                    logger.warning("Skipping invalid product in %s: %s", path, e)
+                continue
+            if strip_vectors:
+                for field in VECTOR_FIELDS:
+                    product.pop(field, None)
+            yield product
+    if skipped:
+        logger.warning("Skipped %d invalid products in %s", skipped, path)
+
+
+# ==================== Validation ====================
+
+def parse_price(value) -> Optional[float]:
+    """Parse '1,23,456 INR' style prices (or plain numbers); None if unparseable"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    try:
+        return float(value.replace(',', '').replace('INR', '').strip())
+    except ValueError:
+        return None
+
+
+def validate_product(record: Any, position: int = 0) -> Dict:
+    """
+    Check the fields scoring relies on
+
+    Args:
+        record: Parsed catalog element
+        position: Index in the feed (for error messages)
+
+    Returns:
+        The record (unchanged) if valid
+
+    Raises:
+        CatalogError: if the record cannot be scored
+    """
+    if not isinstance(record, dict):
+        raise CatalogError(f"record {position}: expected an object, got {type(record).__name__}")
+    if record.get('id') is None:
+        raise CatalogError(f"record {position}: missing 'id'")
+    if not isinstance(record.get('category'), str) or not record['category']:
+        raise CatalogError(f"product {record['id']}: missing 'category'")
+    if parse_price(record.get('price')) is None:
+        raise CatalogError(f"product {record['id']}: unparseable price {record.get('price')!r}")
+    for field in ('primary_style_tags', 'secondary_style_tags', 'occasions'):
+        value = record.get(field, [])
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise CatalogError(f"product {record['id']}: '{field}' must be a list of strings")
+    return record
+
+
+def product_style_text(product: Dict) -> str:
+    """
+    Text a product is embedded from
+
+    Shared by the offline vector generation and live catalog updates so
+    both produce comparable vectors.
+    """
+    # Extract all style components
+    name = product.get('name', '')
+    description = product.get('description', '')
+    vibe_description = product.get('vibe_description', '')
+    category = product.get('category', '')
+    primary_styles = ', '.join(product.get('primary_style_tags', []))
+    secondary_styles = ', '.join(product.get('secondary_style_tags', []))
+    occasions = ', '.join(product.get('occasions', []))
+    material = product.get('material', 'Diamond and Gold')
+    
+    # Extract price tier
+    price = parse_price(product.get('price', '0')) or 0.0
+    
+    if price > 300000:
+        price_tier = "ultra-luxury"
+    elif price > 150000:
+        price_tier = "luxury"
+    elif price > 50000:
+        price_tier = "premium"
+    else:
+        price_tier = "accessible luxury"
+    
+    # Create comprehensive product text
+    product_text = f"""
+Product: {name}
+
+Category: {category}
+Price Tier: {price_tier}
+
+Primary Style: {primary_styles}
+Secondary Style: {secondary_styles}
+
+Perfect For: {occasions}
+
+Description: {description}
+
+Style Essence: {vibe_description}
+
+Materials: {material if material else 'Fine diamonds and gold'}
+
+Overall Aesthetic: {primary_styles} design with {secondary_styles} elements, ideal for {occasions}.
+    """.strip()
+    
+    return product_text
+
+
+# ==================== Columnar Index ====================
+
+def price_score_vector(prices: np.ndarray, user_budget: str) -> np.ndarray:
+    """Vectorized CelebrityProductRecommender.calculate_price_score over a price column"""
+    if user_budget not in PRICE_TIERS:
+        return np.full(len(prices), 0.5)
+    min_price, max_price = PRICE_TIERS[user_budget]['range']
+    flexibility = 0.2
+    scores = np.ones(len(prices))
+
+    below = prices < min_price
+    if min_price > 0:
+        near = prices >= min_price * (1 - flexibility)
+        far = np.maximum(0.3, 0.7 - (min_price - prices) / min_price)
+        scores[below] = np.where(near, 0.7, far)[below]
+
+    if max_price != float('inf'):
+        above = prices > max_price
+        near = prices <= max_price * (1 + flexibility)
+        far = np.maximum(0.3, 0.7 - (prices - max_price) / max_price)
+        scores[above] = np.where(near, 0.7, far)[above]
+
+    scores[np.isnan(prices)] = 0.5
+    return scores
+
+
+def price_band_codes(prices: np.ndarray) -> np.ndarray:
+    """Index into PRICE_BANDS of each price (len(PRICE_BANDS) for a missing price)"""
+    edges = np.array([high for _, _, high in PRICE_BANDS[:-1]])
+    codes = np.searchsorted(edges, prices, side='right').astype(np.int8)
+    codes[np.isnan(prices)] = len(PRICE_BANDS)
+    return codes
+
+
+def merge_facet_counts(facets: Iterable[Dict[str, Dict[str, int]]]) -> Dict[str, Dict[str, int]]:
+    """Sum per-shard facet_counts() results, ordered like a single catalog's"""
+    totals: Dict[str, Counter] = {}
+    for shard_facets in facets:
+        for facet, counts in shard_facets.items():
+            totals.setdefault(facet, Counter()).update(counts)
+    merged = {}
+    for facet, counts in totals.items():
+        if facet == 'price_bands':
+            merged[facet] = {name: counts[name] for name, _, _ in PRICE_BANDS if counts[name] > 0}
+        else:
+            merged[facet] = dict(sorted(counts.items(), key=lambda entry: -entry[1]))
+    return merged
+
+
+def shard_bounds(n_rows: int, index: int, count: int) -> Tuple[int, int]:
+    """[start, stop) rows of shard `index` when n_rows are split into `count` contiguous shards"""
+    if not 0 <= index < count:
+        raise ValueError(f"shard index {index} out of range for {count} shards")
+    return n_rows * index // count, n_rows * (index + 1) // count
+
+
+def _merge_rows(column: np.ndarray, rows: np.ndarray, values: np.ndarray, size: int) -> np.ndarray:
+    """New column of `size` rows: `column` with `rows` overwritten/appended from `values`"""
+    merged = np.empty((size,) + column.shape[1:], dtype=column.dtype)
+    merged[:len(column)] = column
+    merged[rows] = values
+    return merged
+
+
+def _patch_ranking(order: np.ndarray, column: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Re-insert changed `rows` into a best-first `order` of the updated `column` without a full sort"""
+    changed = np.zeros(len(column), dtype=bool)
+    changed[rows] = True
+    kept = order[~changed[order]]
+    moved = rows[np.argsort(-column[rows], kind='stable')]
+    positions = np.searchsorted(-column[kept], -column[moved], side='right')
+    return np.insert(kept, positions, moved)
+
+
+def _merge_sparse_rows(matrix: sparse.csr_matrix, rows: np.ndarray, values: sparse.csr_matrix,
+                       size: int, n_cols: int) -> sparse.csr_matrix:
+    """Sparse counterpart of _merge_rows (the vocabulary may have grown to n_cols)"""
+    n = matrix.shape[0]
+    row_nnz = np.zeros(size, dtype=np.int64)
+    row_nnz[:n] = np.diff(matrix.indptr)
+    row_nnz[rows] = np.diff(values.indptr)
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(row_nnz, out=indptr[1:])
+    data = np.empty(indptr[-1], dtype=matrix.data.dtype)
+    indices = np.empty(indptr[-1], dtype=matrix.indices.dtype)
+
+    # Entries of rows that are not replaced keep their offset within the row
+    replaced = np.zeros(n, dtype=bool)
+    replaced[rows[rows < n]] = True
+    entry_rows = np.repeat(np.arange(n), np.diff(matrix.indptr))
+    kept = ~replaced[entry_rows]
+    kept_rows = entry_rows[kept]
+    target = indptr[kept_rows] + (np.flatnonzero(kept) - matrix.indptr[kept_rows])
+    data[target] = matrix.data[kept]
+    indices[target] = matrix.indices[kept]
+
+    value_rows = np.repeat(np.arange(len(rows)), np.diff(values.indptr))
+    target = indptr[rows[value_rows]] + (np.arange(len(value_rows)) - values.indptr[value_rows])
+    data[target] = values.data
+    indices[target] = values.indices
+    return sparse.csr_matrix((data, indices, indptr), shape=(size, n_cols))
+
+
+class CandidatePool:
+    """
+    Occasion + price part of the blended score for one (budget tier, occasions)
+    key, with its best rows materialized on demand
+
+    A pool carried over by CatalogIndex.with_changes() records the changed
+    rows and merges them the first time the column is read, so keeping many
+    pools costs nothing on the write path.
+    """
+
+    __slots__ = ('_column', '_base', '_changes', '_rows')
+
+    def __init__(self, column: Optional[np.ndarray] = None, base: Optional[np.ndarray] = None,
+                 changes: Tuple = ()):
+        self._column = column
+        self._base = base
+        self._changes = changes
+        self._rows = np.empty(0, dtype=np.int64)
+
+    @property
+    def column(self) -> np.ndarray:
+        if self._column is None:
+            column = np.empty(self._changes[-1][2])
+            column[:len(self._base)] = self._base
+            for rows, values, _ in self._changes:
+                column[rows] = values
+            self._column = column
+        return self._column
+
+    def with_rows(self, rows: np.ndarray, values: np.ndarray, size: int) -> 'CandidatePool':
+        """Pool for the next index: `rows` overwritten/appended from `values` (merged lazily)"""
+        if self._column is not None:
+            return CandidatePool(base=self._column, changes=((rows, values, size),))
+        return CandidatePool(base=self._base, changes=self._changes + ((rows, values, size),))
+
+    def top(self, count: int) -> np.ndarray:
+        """The `count` rows with the highest column values, best first (ties in any order)"""
+        if len(self._rows) < count:
+            column = self.column
+            n = len(column)
+            count = min(max(count, 2 * len(self._rows)), n)
+            rows = np.argpartition(-column, count - 1)[:count] if count < n else np.arange(n)
+            self._rows = rows[np.argsort(-column[rows], kind='stable')]
+        return self._rows[:count]
+
+
+class CatalogIndex:
+    """
+    Column-oriented catalog: one array per scored attribute instead of a dict per product
+
+    Tag and occasion lists become sparse product x vocabulary matrices,
+    and the parts of the occasion and price scores that depend only on
+    the product are precomputed. A request is then a handful of sparse
+    mat-vecs instead of a Python loop over the catalog. Product text is
+    kept as BM25 postings (see lexical.py) for free-text attribute terms.
+
+    A finalized index is never modified: with_changes() returns a new index
+    that shares whatever did not change, so readers holding the old one are
+    unaffected. Deleted products stay in place as tombstones (alive=False)
+    until compact() rebuilds the index without them.
+    """
+
+    # Candidate pools kept per index; the least recently used key is evicted first
+    pool_cache_size = 64
+
+    def __init__(self):
+        self.products: List[Dict] = []
+        self.ids: List[Any] = []
+        self.position: Dict[Any, int] = {}
+        self.tag_vocab: Dict[str, int] = {}
+        self.occasion_vocab: Dict[str, int] = {}
+        self.category_vocab: Dict[str, int] = {}
+        self._prices = array('d')
+        self._categories = array('i')
+        self._tag_indptr = array('q', [0])
+        self._tag_indices = array('i')
+        self._occasion_indptr = array('q', [0])
+        self._occasion_indices = array('i')
+        self.lexical = LexicalIndex()
+        self.finalized = False
+
+    @classmethod
+    def from_products(cls, products) -> 'CatalogIndex':
+        """Build an index from any iterable of validated product dicts"""
+        index = cls()
+        for product in products:
+            index.add(product)
+        index.finalize()
+        return index
+
+    def __len__(self) -> int:
+        """Rows, including tombstones (matches the score arrays)"""
+        return len(self.ids)
+
+    @property
+    def live_count(self) -> int:
+        return len(self.position)
+
+    @staticmethod
+    def _code(vocab: Dict[str, int], value: str) -> int:
+        code = vocab.get(value)
+        if code is None:
+            code = vocab[value] = len(vocab)
+        return code
+
+    def add(self, product: Dict):
+        """Append one product (call finalize() once all products are added)"""
+        if self.finalized:
+            raise RuntimeError("CatalogIndex is finalized")
+        if product['id'] in self.position:
+            raise CatalogError(f"duplicate product id {product['id']!r}")
+        self.position[product['id']] = len(self.ids)
+        self.ids.append(product['id'])
+        self.products.append(product)
+
+        price = parse_price(product.get('price', '0'))
+        self._prices.append(float('nan') if price is None else price)
+        self._categories.append(self._code(self.category_vocab, product['category']))
+        # Duplicates are kept: the taxonomy score averages over every tag pair
+        for tag in product.get('primary_style_tags', []) + product.get('secondary_style_tags', []):
+            self._tag_indices.append(self._code(self.tag_vocab, tag))
+        self._tag_indptr.append(len(self._tag_indices))
+        for occasion in set(product.get('occasions', [])):
+            self._occasion_indices.append(self._code(self.occasion_vocab, occasion))
+        self._occasion_indptr.append(len(self._occasion_indices))
+        self.lexical.add(product)
+
+    def finalize(self) -> 'CatalogIndex':
+        """Freeze the columns and precompute product-only score terms"""
+        n = len(self.ids)
+        self.prices = np.frombuffer(self._prices, dtype=np.float64).copy()
+        self.category_codes = np.frombuffer(self._categories, dtype=np.int32).copy()
+
+        tag_indices = np.frombuffer(self._tag_indices, dtype=np.int32)
+        self.tag_counts = sparse.csr_matrix(
+            (np.ones(len(tag_indices)), tag_indices, np.frombuffer(self._tag_indptr, dtype=np.int64)),
+            shape=(n, max(1, len(self.tag_vocab)))
+        )
+        self.tag_counts.sum_duplicates()
+        self.tag_totals = np.asarray(self.tag_counts.sum(axis=1)).ravel()
+        self.tag_presence = (self.tag_counts > 0).astype(np.float64)
+
+        occasion_indices = np.frombuffer(self._occasion_indices, dtype=np.int32)
+        self.occasion_presence = sparse.csr_matrix(
+            (np.ones(len(occasion_indices)), occasion_indices,
+             np.frombuffer(self._occasion_indptr, dtype=np.int64)),
+            shape=(n, max(1, len(self.occasion_vocab)))
+        )
+
+        # Share of each occasion's compatible styles present on the product
+        self.occasion_style_scores: Dict[str, np.ndarray] = {}
+        for occasion, data in OCCASION_COMPATIBILITY.items():
+            styles = set(data['compatible_styles'])
+            indicator = np.zeros(self.tag_presence.shape[1])
+            for style in styles:
+                if style in self.tag_vocab:
+                    indicator[self.tag_vocab[style]] = 1.0
+            matches = self.tag_presence @ indicator
+            self.occasion_style_scores[occasion] = matches / len(styles) if styles else np.zeros(n)
+
+        self.price_scores = {tier: price_score_vector(self.prices, tier) for tier in PRICE_TIERS}
+        self.price_bands = price_band_codes(self.prices)
+        self.lexical.finalize()
+        self._bitmaps: Dict[tuple, np.ndarray] = {}
+        self._affinity_rows: Dict[tuple, np.ndarray] = {}
+        self._columns: Dict[tuple, np.ndarray] = {}
+        self._rankings: Dict[tuple, np.ndarray] = {}
+        self._pools: 'OrderedDict[tuple, CandidatePool]' = OrderedDict()
+        # Requests share the snapshot from worker threads
+        self._columns_lock = threading.Lock()
+        self._pools_lock = threading.Lock()
+        self.alive = np.ones(n, dtype=bool)
+        self.tombstones = 0
+
+        # Builders are no longer needed
+        self._prices = self._categories = None
+        self._tag_indptr = self._tag_indices = None
+        self._occasion_indptr = self._occasion_indices = None
+        self.finalized = True
+        return self
+
+    def with_changes(self, upserts: List[Dict], deletes: Iterable[Any] = ()) -> Tuple['CatalogIndex', np.ndarray]:
+        """
+        Copy-on-write update: add or replace products and tombstone deleted ones
+
+        Only the changed products are parsed; every column is rebuilt with
+        vectorized copies, and the vocabularies and affinity cache are only
+        copied when a change introduces a new tag, occasion or category.
+        Cached score columns, their rankings and the candidate pool columns
+        are patched at the changed rows rather than dropped.
+
+        Args:
+            upserts: Validated products; an existing id is replaced in its row,
+                     a new id is appended
+            deletes: Ids of live products to remove
+
+        Returns:
+            (new index, row of each upsert in the new index)
+
+        Raises:
+            CatalogError: unknown id in deletes or duplicate id in upserts
+        """
+        if not self.finalized:
+            raise RuntimeError("CatalogIndex is not finalized")
+        new = copy.copy(self)
+        new.position = dict(self.position)
+        new.alive = self.alive.copy()
+        deleted = []
+        for product_id in deletes:
+            row = new.position.pop(product_id, None)
+            if row is None:
+                raise CatalogError(f"unknown product id {product_id!r}")
+            new.alive[row] = False
+            deleted.append(row)
+
+        # Parse the changed products into a small index over a shared copy of the vocabularies
+        delta = CatalogIndex()
+        delta.tag_vocab = dict(self.tag_vocab)
+        delta.occasion_vocab = dict(self.occasion_vocab)
+        delta.category_vocab = dict(self.category_vocab)
+        delta.lexical = LexicalIndex(dict(self.lexical.vocab))
+        for product in upserts:
+            delta.add(product)
+        delta.finalize()
+        if len(delta.tag_vocab) > len(self.tag_vocab):
+            new.tag_vocab = delta.tag_vocab
+            new._affinity_rows = delta._affinity_rows
+        else:
+            delta._affinity_rows = self._affinity_rows
+        if len(delta.occasion_vocab) > len(self.occasion_vocab):
+            new.occasion_vocab = delta.occasion_vocab
+        if len(delta.category_vocab) > len(self.category_vocab):
+            new.category_vocab = delta.category_vocab
+
+        n = len(self.ids)
+        rows = np.empty(len(upserts), dtype=np.int64)
+        new.ids = list(self.ids)
+        new.products = list(self.products)
+        for i, product in enumerate(upserts):
+            row = new.position.get(product['id'])
+            if row is None:
+                row = new.position[product['id']] = len(new.ids)
+                new.ids.append(product['id'])
+                new.products.append(product)
+            else:
+                new.products[row] = product
+            rows[i] = row
+        size = len(new.ids)
+        new.alive = _merge_rows(new.alive, rows, True, size)
+        new.tombstones = size - len(new.position)
+
+        new.prices = _merge_rows(self.prices, rows, delta.prices, size)
+        new.category_codes = _merge_rows(self.category_codes, rows, delta.category_codes, size)
+        new.tag_counts = _merge_sparse_rows(self.tag_counts, rows, delta.tag_counts,
+                                            size, max(1, len(new.tag_vocab)))
+        new.tag_totals = _merge_rows(self.tag_totals, rows, delta.tag_totals, size)
+        new.tag_presence = (new.tag_counts > 0).astype(np.float64)
+        new.occasion_presence = _merge_sparse_rows(self.occasion_presence, rows, delta.occasion_presence,
+                                                   size, max(1, len(new.occasion_vocab)))
+        new.occasion_style_scores = {
+            occasion: _merge_rows(scores, rows, delta.occasion_style_scores[occasion], size)
+            for occasion, scores in self.occasion_style_scores.items()
+        }
+        new.price_scores = {
+            tier: _merge_rows(scores, rows, delta.price_scores[tier], size)
+            for tier, scores in self.price_scores.items()
+        }
+        new.price_bands = _merge_rows(self.price_bands, rows, delta.price_bands, size)
+        # Filter bitmaps are rebuilt on first use (one pass over a column each)
+        new._bitmaps = {}
+        new.lexical = self.lexical.with_changes(delta.lexical, rows, np.array(deleted, dtype=np.int64),
+                                                size, len(new.position))
+        with self._columns_lock:
+            columns = dict(self._columns)
+            rankings = dict(self._rankings)
+        new._columns = {
+            key: _merge_rows(column, rows, delta._compute_column(key), size)
+            for key, column in columns.items()
+        }
+        new._rankings = {
+            key: _patch_ranking(order, new._columns[key], rows)
+            for key, order in rankings.items() if key in new._columns
+        }
+        new._columns_lock = threading.Lock()
+        with self._pools_lock:
+            pools = list(self._pools.items())
+        new._pools = OrderedDict(
+            (key, pool.with_rows(rows, delta._pool_column(key), size))
+            for key, pool in pools
+        )
+        new._pools_lock = threading.Lock()
+        return new, rows
+
+    def compact(self) -> Tuple['CatalogIndex', np.ndarray]:
+        """
+        Rebuild without tombstones
+
+        Returns:
+            (new index, old row of each new row)
+        """
+        kept = np.flatnonzero(self.alive)
+        return CatalogIndex.from_products(self.products[row] for row in kept), kept
+
+    def _affinity_terms(self, celeb_tags: List[str]) -> np.ndarray:
+        """(n_tags, 4) columns: positive sum, positive count, negative sum, negative count"""
+        key = tuple(celeb_tags)
+        terms = self._affinity_rows.get(key)
+        if terms is None:
+            terms = np.zeros((self.tag_counts.shape[1], 4))
+            for celeb_tag in celeb_tags:
+                if celeb_tag not in STYLE_TAXONOMY:
+                    continue
+                for product_tag, column in self.tag_vocab.items():
+                    score = get_style_affinity_score(celeb_tag, product_tag)
+                    if score > 0:
+                        terms[column, 0] += score
+                        terms[column, 1] += 1
+                    elif score < 0:
+                        terms[column, 2] += score
+                        terms[column, 3] += 1
+            self._affinity_rows[key] = terms
+        return terms
+
+    # ==================== Ranked Columns ====================
+
+    def column(self, key: tuple) -> np.ndarray:
+        """
+        User-independent score column, computed once per index (read-only)
+
+        Keys: ('taxonomy', celebrity tags).
+        """
+        column = self._columns.get(key)
+        record_cache_lookup('score_column', column is not None)
+        if column is None:
+            # Computed outside the lock; a column another request stored meanwhile is kept
+            computed = self._compute_column(key)
+            with self._columns_lock:
+                column = self._columns.setdefault(key, computed)
+        return column
+
+    def ranking(self, key: tuple) -> np.ndarray:
+        """Rows ordered by column(key), best first (sorted once per index)"""
+        order = self._rankings.get(key)
+        if order is None:
+            computed = np.argsort(-self.column(key), kind='stable')
+            with self._columns_lock:
+                order = self._rankings.setdefault(key, computed)
+        return order
+
+    def _compute_column(self, key: tuple) -> np.ndarray:
+        kind, value = key
+        if kind == 'taxonomy':
+            return self._taxonomy_column(list(value))
+        raise KeyError(f"unknown column {key!r}")
+
+    # ==================== Candidate Pools ====================
+
+    def candidate_pool(self,
+                       user_budget: str,
+                       user_occasions: List[str],
+                       occasion_weight: float,
+                       price_weight: float,
+                       record: bool = True) -> CandidatePool:
+        """
+        occasion_weight * occasion_base_scores + price_weight * price_scores_for,
+        built on first use per (tier, occasions, occasion_weight, price_weight)
+        and cached with LRU eviction
+
+        Occasion order does not matter, so it is not part of the key. Each
+        distinct weight pair (per-request weights, weight profiles) takes its
+        own pool entries.
+        Lookups count under evol_cache_lookups_total{cache="candidate_pool"}.
+
+        Args:
+            record: Count the lookup (False for warm-up builds)
+        """
+        key = (user_budget, tuple(sorted(user_occasions)), occasion_weight, price_weight)
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._pools.move_to_end(key)
+        if record:
+            record_cache_lookup('candidate_pool', pool is not None)
+        if pool is not None:
+            return pool
+        # Built outside the lock; if another request built the same pool meanwhile, theirs is kept
+        built = CandidatePool(self._pool_column(key))
+        with self._pools_lock:
+            pool = self._pools.setdefault(key, built)
+            self._pools.move_to_end(key)
+            while len(self._pools) > self.pool_cache_size:
+                self._pools.popitem(last=False)
+        return pool
+
+    def _pool_column(self, key: tuple) -> np.ndarray:
+        user_budget, user_occasions, occasion_weight, price_weight = key
+        return (occasion_weight * self.occasion_base_scores(list(user_occasions))
+                + price_weight * self.price_scores_for(user_budget))
+
+    def style_taxonomy_scores(self, celebrity: Dict) -> np.ndarray:
+        """Vectorized CelebrityProductRecommender.calculate_style_taxonomy_score for every product"""
+        celeb_tags = celebrity.get('primary_vibe_tags', []) + celebrity.get('secondary_vibe_tags', [])
+        return self.column(('taxonomy', tuple(celeb_tags)))
+
+    def _taxonomy_column(self, celeb_tags: List[str]) -> np.ndarray:
+        n = len(self.ids)
+        if not celeb_tags:
+            return np.zeros(n)
+        sums = self.tag_counts @ self._affinity_terms(celeb_tags)
+        pos_sum, pos_count, neg_sum, neg_count = sums[:, 0], sums[:, 1], sums[:, 2], sums[:, 3]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            positive_avg = np.where(pos_count > 0, pos_sum / pos_count, 0.0)
+            negative_avg = np.where(neg_count > 0, neg_sum / neg_count, 0.0)
+        final = 0.8 * positive_avg + 0.2 * negative_avg
+        scores = np.clip((final + 1.0) / 2.0, 0.0, 1.0)
+        # No positive pair: mean of non-positive scores, floored at 0
+        scores[pos_count == 0] = 0.0
+        scores[self.tag_totals == 0] = 0.0
+        return scores
+
+    def occasion_scores(self, user_occasions: List[str], celebrity: Dict,
+                        rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Vectorized CelebrityProductRecommender.calculate_occasion_score for every product
+
+        Args:
+            rows: Score only these rows (same values as the full column)
+        """
+        return self.occasion_base_scores(user_occasions, rows) + self.occasion_constant(user_occasions, celebrity)
+
+    def occasion_base_scores(self, user_occasions: List[str], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Celebrity-independent part of occasion_scores: occasions listed and compatible styles present"""
+        n = len(self.ids) if rows is None else len(rows)
+        if not user_occasions:
+            return np.zeros(n)
+
+        user_set = set(user_occasions)
+        indicator = np.zeros(self.occasion_presence.shape[1])
+        for occasion in user_set:
+            if occasion in self.occasion_vocab:
+                indicator[self.occasion_vocab[occasion]] = 1.0
+        presence = self.occasion_presence if rows is None else self.occasion_presence[rows]
+        direct_score = (presence @ indicator) / len(user_set)
+
+        style_total = np.zeros(n)
+        for occasion in user_occasions:
+            data = OCCASION_COMPATIBILITY.get(occasion)
+            if data is None:
+                continue
+            style_scores = self.occasion_style_scores[occasion]
+            if rows is not None:
+                style_scores = style_scores[rows]
+            style_total += style_scores * (data['weight'] / 2)
+        return 0.6 * direct_score + 0.4 * style_total / len(user_occasions)
+
+    @staticmethod
+    def occasion_constant(user_occasions: List[str], celebrity: Dict) -> float:
+        """Part of occasion_scores shared by every product: celebrity vibe fit and unknown occasions"""
+        if not user_occasions:
+            return 0.5
+        celeb_tags = set(celebrity.get('primary_vibe_tags', []) + celebrity.get('secondary_vibe_tags', []))
+        total = 0.0
+        for occasion in user_occasions:
+            data = OCCASION_COMPATIBILITY.get(occasion)
+            if data is None:
+                total += 0.5
+                continue
+            vibes = set(data['compatible_vibes'])
+            vibe_score = len(celeb_tags & vibes) / len(vibes) if vibes else 0
+            total += vibe_score * (data['weight'] / 2)
+        return 0.4 * total / len(user_occasions)
+
+    def price_scores_for(self, user_budget: str) -> np.ndarray:
+        """Precomputed price compatibility column for a budget tier"""
+        scores = self.price_scores.get(user_budget)
+        return scores if scores is not None else np.full(len(self.ids), 0.5)
+
+    # ==================== Filters and Facets ====================
+
+    def bitmap(self, kind: str, value: Any = None) -> np.ndarray:
+        """
+        Packed bitmap (np.packbits, one bit per row) of the rows with an attribute value
+
+        Kinds: 'alive', 'category', 'price_band' (a PRICE_BANDS name),
+        'style_tag' and 'occasion'. Built on first use per index and cached,
+        so filters are bitwise ANDs over n/8 bytes. Unknown values match nothing.
+        """
+        key = (kind, value)
+        packed = self._bitmaps.get(key)
+        if packed is None:
+            n = len(self.ids)
+            if kind == 'alive':
+                bits = self.alive
+            elif kind == 'category':
+                code = self.category_vocab.get(value)
+                bits = self.category_codes == code if code is not None else np.zeros(n, dtype=bool)
+            elif kind == 'price_band':
+                names = [name for name, _, _ in PRICE_BANDS]
+                bits = (self.price_bands == names.index(value) if value in names
+                        else np.zeros(n, dtype=bool))
+            elif kind in ('style_tag', 'occasion'):
+                vocab, matrix = ((self.tag_vocab, self.tag_presence) if kind == 'style_tag'
+                                 else (self.occasion_vocab, self.occasion_presence))
+                bits = np.zeros(n, dtype=bool)
+                if value in vocab:
+                    bits[matrix[:, vocab[value]].nonzero()[0]] = True
+            else:
+                raise KeyError(f"unknown bitmap kind {kind!r}")
+            packed = self._bitmaps[key] = np.packbits(bits)
+        return packed
+
+    def filter_rows(self, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        """
+        Live rows passing hard filters, in catalog order
+
+        Values within a field are alternatives (any of), fields are combined
+        with AND. A price range selects the bands it overlaps through their
+        bitmaps, then checks the exact price of the rows that are left.
+
+        Args:
+            filters: Any of categories, price_bands, style_tags, occasions (lists)
+                     and min_price / max_price (inclusive); empty or None fields are ignored
+        """
+        filters = filters or {}
+        mask = self.bitmap('alive')
+        for kind, field in (('category', 'categories'), ('price_band', 'price_bands'),
+                            ('style_tag', 'style_tags'), ('occasion', 'occasions')):
+            if filters.get(field):
+                mask = mask & np.bitwise_or.reduce([self.bitmap(kind, value) for value in filters[field]])
+        min_price, max_price = filters.get('min_price'), filters.get('max_price')
+        if min_price is not None or max_price is not None:
+            low = -np.inf if min_price is None else min_price
+            high = np.inf if max_price is None else max_price
+            bands = [name for name, band_low, band_high in PRICE_BANDS if band_low <= high and band_high > low]
+            mask = mask & np.bitwise_or.reduce(
+                [self.bitmap('price_band', name) for name in bands] or [np.zeros_like(mask)])
+        rows = np.flatnonzero(np.unpackbits(mask, count=len(self.ids)))
+        if min_price is not None or max_price is not None:
+            prices = self.prices[rows]
+            rows = rows[(prices >= low) & (prices <= high)]
+        return rows
+
+    def facet_counts(self, rows: np.ndarray) -> Dict[str, Dict[str, int]]:
+        """
+        Products per category, price band, style tag and occasion among `rows`
+
+        One bincount or sparse column sum per facet over the given rows only.
+        Values with no product are left out; the others are listed most frequent first.
+        """
+        def named(vocab: Dict[str, int], counts: np.ndarray) -> Dict[str, int]:
+            present = [(name, int(counts[code])) for name, code in vocab.items() if counts[code] > 0]
+            return dict(sorted(present, key=lambda entry: -entry[1]))
+
+        band_counts = np.bincount(self.price_bands[rows], minlength=len(PRICE_BANDS) + 1)
+        return {
+            'categories': named(self.category_vocab,
+                                np.bincount(self.category_codes[rows], minlength=len(self.category_vocab))),
+            'price_bands': {name: int(band_counts[code]) for code, (name, _, _) in enumerate(PRICE_BANDS)
+                            if band_counts[code] > 0},
+            'style_tags': named(self.tag_vocab, np.asarray(self.tag_presence[rows].sum(axis=0)).ravel()),
+            'occasions': named(self.occasion_vocab, np.asarray(self.occasion_presence[rows].sum(axis=0)).ravel())
+        }
@@ -0,0 +1,196 @@
+"""
+Catalog Change Log
+Append-only JSONL log of live product changes, replayed on top of the data files and compacted periodically
+"""
+
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from catalog import VECTOR_FIELDS, validate_product
+from instrumentation import CATALOG_MUTATIONS
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogChangeLog:
+    """
+    Durable record of product upserts and deletes made through the API
+
+    Each line is one change with a monotonically increasing `seq`. Upserts
+    carry the product's embedding so a replay never needs the encoder.
+    Compaction rewrites the file keeping only the latest change per product.
+    """
+
+    def __init__(self, path, compact_every: int = 1000):
+        """
+        Args:
+            path: JSONL file (created on first append)
+            compact_every: Compact after this many appends (0 disables)
+        """
+        self.path = Path(path)
+        self.compact_every = compact_every
+        self.seq = 0
+        self.records = 0
+        self.appended_since_compaction = 0
+        for record in self.read():
+            self.seq = max(self.seq, record['seq'])
+            self.records += 1
+
+    @classmethod
+    def from_env(cls, data_dir: str = '.', default_name: str = 'catalog_changes.jsonl') -> Optional['CatalogChangeLog']:
+        """CATALOG_LOG_PATH (default <data_dir>/<default_name>, 'off' disables) and CATALOG_LOG_COMPACT_EVERY"""
+        path = os.environ.get('CATALOG_LOG_PATH', str(Path(data_dir) / default_name))
+        if path.lower() in ('', 'off', 'none'):
+            return None
+        return cls(path, compact_every=int(os.environ.get('CATALOG_LOG_COMPACT_EVERY', '1000')))
+
+    def read(self) -> Iterator[Dict]:
+        """Yield logged changes in order (a torn last line from a crash is ignored)"""
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Ignoring unreadable catalog log line %d in %s", line_no, self.path)
+
+    def append(self, upserts: List[Dict], embeddings: np.ndarray, deletes: List[Any]) -> int:
+        """
+        Durably append one batch of changes
+
+        Returns:
+            Sequence number of the last record written
+        """
+        timestamp = datetime.utcnow().isoformat()
+        lines = []
+        for product, vector in zip(upserts, embeddings):
+            self.seq += 1
+            lines.append({'seq': self.seq, 'ts': timestamp, 'op': 'upsert',
+                          'product': product, 'vector': vector.tolist()})
+        for product_id in deletes:
+            self.seq += 1
+            lines.append({'seq': self.seq, 'ts': timestamp, 'op': 'delete', 'id': product_id})
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.records += len(lines)
+        self.appended_since_compaction += len(lines)
+        return self.seq
+
+    def latest(self) -> Dict[Any, Dict]:
+        """Latest change per product id, in log order"""
+        state = {}
+        for record in self.read():
+            key = record['product']['id'] if record['op'] == 'upsert' else record['id']
+            state.pop(key, None)
+            state[key] = record
+        return state
+
+    def needs_compaction(self) -> bool:
+        return bool(self.compact_every) and self.appended_since_compaction >= self.compact_every
+
+    def compact(self):
+        """Rewrite the log with only the latest change per product (atomic replace)"""
+        state = self.latest()
+        tmp_path = self.path.with_name(self.path.name + '.partial')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in state.values():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        logger.info("Compacted catalog log %s: %d -> %d records", self.path, self.records, len(state))
+        self.records = len(state)
+        self.appended_since_compaction = 0
+
+    def replay(self, recommender):
+        """
+        Fold every logged change into a freshly loaded recommender
+
+        Returns:
+            Recommender with the changes applied (the same one if the log is empty)
+        """
+        state = self.latest()
+        if not state:
+            return recommender
+        upserts, vectors, deletes = [], [], []
+        dimension = recommender.product_embeddings.shape[1]
+        for key, record in state.items():
+            if record['op'] == 'upsert':
+                upserts.append(record['product'])
+                vectors.append(record.get('vector'))
+            elif key in recommender.catalog.position:
+                deletes.append(key)
+        if any(vector is None or len(vector) != dimension for vector in vectors):
+            # Written with a different model: re-embed from the product text
+            logger.warning("Catalog log vectors do not match the embedding store; re-embedding %d products",
+                           len(upserts))
+            embeddings = None
+        else:
+            embeddings = np.asarray(vectors, dtype=np.float32).reshape(len(upserts), dimension)
+        recommender = recommender.with_product_changes(upserts, deletes, embeddings)
+        recommender.catalog_seq = self.seq
+        logger.info("✓ Replayed catalog log: %d upserts, %d deletes (seq %d)",
+                    len(upserts), len(deletes), self.seq)
+        return recommender
+
+
+def apply_catalog_changes(recommender,
+                          upserts: List[Dict] = (),
+                          deletes: List[Any] = (),
+                          change_log: Optional[CatalogChangeLog] = None,
+                          max_tombstone_ratio: float = 0.2):
+    """
+    Embed, apply and log one batch of product changes
+
+    Args:
+        recommender: Live CelebrityProductRecommender (not modified)
+        upserts: Products to add or replace (validated here)
+        deletes: Ids of products to remove
+        change_log: Where the batch is persisted (None keeps it in memory only)
+        max_tombstone_ratio: Compact the index once this share of rows is deleted
+
+    Returns:
+        New CelebrityProductRecommender
+
+    Raises:
+        CatalogError: if a product is invalid or an id is unknown
+    """
+    upserts = [
+        {key: value for key, value in validate_product(product, position).items() if key not in VECTOR_FIELDS}
+        for position, product in enumerate(upserts)
+    ]
+    deletes = list(deletes)
+    embeddings = recommender.embed_products(upserts) if upserts else np.empty(
+        (0, recommender.product_embeddings.shape[1]), dtype=np.float32)
+
+    # Build first so a bad batch is rejected before it reaches the log
+    updated = recommender.with_product_changes(upserts, deletes, embeddings)
+    if change_log is not None:
+        updated.catalog_seq = change_log.append(upserts, embeddings, deletes)
+        if change_log.needs_compaction():
+            change_log.compact()
+    else:
+        updated.catalog_seq = recommender.catalog_seq + len(upserts) + len(deletes)
+
+    for product in upserts:
+        CATALOG_MUTATIONS.inc(op='update' if product['id'] in recommender.catalog.position else 'create')
+    if deletes:
+        CATALOG_MUTATIONS.inc(len(deletes), op='delete')
+
+    catalog = updated.catalog
+    if catalog.tombstones and catalog.tombstones > max_tombstone_ratio * len(catalog):
+        updated = updated.compacted()
+        logger.info("Compacted catalog index: dropped %d deleted rows", catalog.tombstones)
+    return updated
@@ -0,0 +1,90 @@
+"""
+Request Coalescing
+Single-flight execution: identical concurrent requests share one computation instead of each running it
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Dict, Tuple
+
+from instrumentation import REQUESTS_COALESCED, trace_annotate
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(**fields) -> str:
+    """
+    Canonical hash of everything that determines a response
+
+    Field order does not matter; values must be JSON-serializable.
+    """
+    canonical = json.dumps(fields, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """
+    At most one in-flight computation per key; duplicates wait for it
+
+    The computation runs in a worker thread as its own task, so the event
+    loop keeps accepting requests (and joining them to the running call)
+    while it works, and a caller that disconnects does not cancel it for
+    the others. Nothing is kept once the call finishes: this coalesces
+    bursts, it is not a cache.
+    """
+
+    def __init__(self, endpoint: str, enabled: bool = True):
+        """
+        Args:
+            endpoint: Label for the coalesced-request counter
+            enabled: False runs every call on its own (still in a worker thread)
+        """
+        self.endpoint = endpoint
+        self.enabled = enabled
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the outcome as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key: str, fn: Callable[..., Any], *args) -> Tuple[Any, bool]:
+        """
+        Run `fn(*args)` in a worker thread, or join the identical call already running
+
+        Args:
+            key: Canonical request hash (see request_key)
+            fn: Blocking function; its result is shared by every waiter, so it must be treated as read-only
+            *args: Arguments for fn
+
+        Returns:
+            (result, coalesced) — coalesced is True when another request computed the result
+        """
+        task = self._calls.get(key) if self.enabled else None
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+            REQUESTS_COALESCED.inc(endpoint=self.endpoint)
+        else:
+            self.leaders += 1
+            # The task copies this request's context, so stages land on the leader's trace
+            task = asyncio.get_running_loop().create_task(asyncio.to_thread(fn, *args))
+            if self.enabled:
+                self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        trace_annotate('coalesced', coalesced)
+        return await asyncio.shield(task), coalesced
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'in_flight': len(self._calls),
+            'computed': self.leaders,
+            'coalesced': self.coalesced
+        }
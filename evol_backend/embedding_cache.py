@@ -0,0 +1,174 @@
+"""
+Embedding Cache
+Content-addressed store of text embeddings so vector generation only encodes new or changed items
+"""
+
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the exact text that gets encoded"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Maps content hashes to embeddings for one (namespace, model) pair
+
+    Stored as a single ``.npz`` file holding parallel ``hashes`` and
+    ``vectors`` arrays. The model name is part of the file name, so
+    switching models starts from an empty cache instead of mixing
+    embedding spaces.
+    """
+
+    def __init__(self, cache_dir: str, namespace: str, model_name: str):
+        """
+        Args:
+            cache_dir: Directory holding cache files
+            namespace: Kind of item ('products', 'celebrities')
+            model_name: Sentence transformer model the vectors came from
+        """
+        safe_model = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.path = Path(cache_dir) / f"{namespace}-{safe_model}.npz"
+        self.model_name = model_name
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with np.load(self.path, allow_pickle=False) as data:
+            for key, vector in zip(data['hashes'], data['vectors']):
+                self._vectors[str(key)] = vector
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def lookup(self, hashes: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Split hashes into cache hits and misses
+
+        Returns:
+            tuple: ({position: vector} for hits, positions that need encoding)
+        """
+        hits = {}
+        misses = []
+        for i, key in enumerate(hashes):
+            vector = self._vectors.get(key)
+            if vector is None:
+                misses.append(i)
+            else:
+                hits[i] = vector
+        return hits, misses
+
+    def put(self, key: str, vector: np.ndarray):
+        self._vectors[key] = np.asarray(vector, dtype=np.float32)
+        self._dirty = True
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """Drop entries whose hash is not in ``keep``; returns how many were removed"""
+        keep = set(keep)
+        stale = [key for key in self._vectors if key not in keep]
+        for key in stale:
+            del self._vectors[key]
+        if stale:
+            self._dirty = True
+        return len(stale)
+
+    def save(self) -> Optional[Path]:
+        """Write the cache atomically (no-op if nothing changed)"""
+        if not self._dirty:
+            return None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        keys = list(self._vectors)
+        vectors = np.stack([self._vectors[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, hashes=np.array(keys, dtype='U64'), vectors=vectors)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        return self.path
+
+
+def encode_with_cache(model, texts: List[str], cache: Optional[EmbeddingCache],
+                      refresh: bool = False) -> Tuple[np.ndarray, int]:
+    """
+    Encode texts, reusing cached vectors for any text seen before
+
+    Args:
+        model: SentenceTransformer (or anything with a compatible ``encode``)
+        texts: Texts to embed, in output order
+        cache: Embedding cache, or None to encode everything
+        refresh: Re-encode every text and overwrite its cache entry
+
+    Returns:
+        tuple: (normalized embeddings array, number of texts actually encoded)
+    """
+    hashes = [content_hash(t) for t in texts]
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32), 0
+    if cache is None or refresh:
+        hits, misses = {}, list(range(len(texts)))
+    else:
+        hits, misses = cache.lookup(hashes)
+
+    encoded = None
+    if misses:
+        encoded = model.encode(
+            [texts[i] for i in misses],
+            show_progress_bar=len(misses) > 1,
+            convert_to_numpy=True,
+            normalize_embeddings=True  # Normalize for cosine similarity
+        ).astype(np.float32)
+
+    dimension = encoded.shape[1] if encoded is not None else len(next(iter(hits.values())))
+    embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+    for i, vector in hits.items():
+        embeddings[i] = vector
+    for row, i in enumerate(misses):
+        embeddings[i] = encoded[row]
+        if cache is not None:
+            cache.put(hashes[i], encoded[row])
+    return embeddings, len(misses)
+
+
+def catalog_changes(previous_metadata: Optional[Dict], id_key: str, ids: List,
+                    hashes: List[str], model_name: str) -> Dict[str, List]:
+    """
+    Compare the current catalog with the metadata written by the previous run
+
+    Args:
+        previous_metadata: Parsed *_embeddings_metadata.json, or None
+        id_key: Metadata key holding the id list ('product_ids', 'celebrity_ids')
+        ids: Current item ids
+        hashes: Content hashes aligned with ids
+        model_name: Model used for this run
+
+    Returns:
+        Dict of id lists: added, changed, removed, unchanged. Everything counts
+        as changed if the previous run used a different model or predates
+        content hashes.
+    """
+    previous = {}
+    if previous_metadata and previous_metadata.get('model_name') == model_name:
+        previous = dict(zip(previous_metadata.get(id_key, []), previous_metadata.get('content_hashes', [])))
+    previous_ids = set(previous_metadata.get(id_key, [])) if previous_metadata else set()
+
+    changes = {'added': [], 'changed': [], 'removed': [], 'unchanged': []}
+    for item_id, digest in zip(ids, hashes):
+        if item_id not in previous_ids:
+            changes['added'].append(item_id)
+        elif previous.get(item_id) == digest:
+            changes['unchanged'].append(item_id)
+        else:
+            changes['changed'].append(item_id)
+    current = set(ids)
+    changes['removed'] = [item_id for item_id in previous_ids if item_id not in current]
+    return changes
@@ -0,0 +1,356 @@
+"""
+Embedding Pipeline
+Chunked, multi-process and resumable catalog encoding into a memory-mapped embedding store
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from embedding_cache import content_hash
+
+# Per-process encoder, created once by _init_worker
+_worker_encoder = None
+
+
+def _init_worker(model_name: str, threads: int, stub_encoder: bool):
+    """Load one model copy per worker and cap its intra-op threads (0 = library default)"""
+    global _worker_encoder
+    if threads > 0:
+        # Must be set before torch / BLAS spin up their thread pools
+        for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+            os.environ[var] = str(threads)
+        os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+    if stub_encoder:
+        from recommender_engine import HashingEncoder
+        _worker_encoder = HashingEncoder()
+        return
+    if threads > 0:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    from sentence_transformers import SentenceTransformer
+    _worker_encoder = SentenceTransformer(model_name)
+
+
+def _encode_texts(texts: List[str]) -> np.ndarray:
+    return _worker_encoder.encode(
+        texts,
+        batch_size=64,
+        show_progress_bar=False,
+        convert_to_numpy=True,
+        normalize_embeddings=True  # Normalize for cosine similarity
+    ).astype(np.float32)
+
+
+def _embedding_dimension() -> int:
+    return _worker_encoder.get_sentence_embedding_dimension()
+
+
+def _atomic_write_json(path: Path, payload: Dict):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+class _PreviousStore:
+    """Rows of the last completed run, addressable by content hash"""
+
+    def __init__(self, embeddings_path: Path, metadata_path: Path, model_name: str):
+        self.rows: Dict[str, int] = {}
+        self.embeddings = None
+        if not (embeddings_path.exists() and metadata_path.exists()):
+            return
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        if metadata.get('model_name') != model_name:
+            return
+        self.embeddings = np.load(embeddings_path, mmap_mode='r')
+        self.rows = {digest: row for row, digest in enumerate(metadata.get('content_hashes', []))}
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        row = self.rows.get(digest)
+        return None if row is None else self.embeddings[row]
+
+
+class EmbeddingPipeline:
+    """
+    Streams a catalog through a pool of encoder processes into a .npy memmap
+
+    Items are read in chunks and only one bounded window of chunks is in
+    flight at a time, so peak memory depends on chunk size and worker count,
+    not on catalog size. Rows whose text hash matches the previous run are
+    copied from the old store instead of being re-encoded. After every
+    completed chunk the output is flushed and a checkpoint written, so an
+    interrupted run resumes where it stopped.
+
+    Outputs (for prefix 'product'):
+        product_embeddings.npy            (n_items, dim) float32
+        products_with_vectors.json        items + style_vector/style_text
+        product_embeddings_metadata.json  ids, content hashes, model name
+    """
+
+    def __init__(self,
+                 model_name: str,
+                 workers: int = 0,
+                 chunk_size: int = 512,
+                 threads_per_worker: int = 1,
+                 stub_encoder: bool = False):
+        """
+        Args:
+            model_name: Sentence transformer model loaded in each worker
+            workers: Encoder processes (0 = encode in this process)
+            chunk_size: Items per chunk (unit of work and of checkpointing)
+            threads_per_worker: Intra-op threads per worker model copy (ignored without workers)
+            stub_encoder: Use the offline HashingEncoder (for tests and benchmarks)
+        """
+        self.model_name = model_name
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.threads_per_worker = threads_per_worker
+        self.stub_encoder = stub_encoder
+        # Recorded in metadata/checkpoints so stub vectors are never reused for a real model
+        self.store_model_name = 'hashing-encoder' if stub_encoder else model_name
+        self.max_in_flight = max(2, workers * 2)
+
+    def _chunks(self, items: Iterable[Dict], text_fn: Callable[[Dict], str]) -> Iterator[Dict]:
+        chunk = {'items': [], 'texts': [], 'hashes': []}
+        for item in items:
+            text = text_fn(item)
+            chunk['items'].append(item)
+            chunk['texts'].append(text)
+            chunk['hashes'].append(content_hash(text))
+            if len(chunk['items']) == self.chunk_size:
+                yield chunk
+                chunk = {'items': [], 'texts': [], 'hashes': []}
+        if chunk['items']:
+            yield chunk
+
+    def run(self,
+            items: Callable[[], Iterable[Dict]],
+            text_fn: Callable[[Dict], str],
+            output_dir: str = '.',
+            prefix: str = 'product',
+            collection: str = 'products',
+            vector_field: str = 'style_vector',
+            text_field: str = 'style_text',
+            reuse: bool = True,
+            resume: bool = True) -> Dict:
+        """
+        Encode a catalog
+
+        Args:
+            items: Callable returning a fresh iterator over catalog records
+                   (called twice: once to count, once to encode)
+            text_fn: Builds the text that gets embedded for one record
+            output_dir: Where outputs and the checkpoint are written
+            prefix: Output file prefix ('product' -> product_embeddings.npy)
+            collection: Collection name ('products' -> products_with_vectors.json)
+            vector_field: Record field that receives the vector
+            text_field: Record field that receives the embedded text
+            reuse: Copy vectors of unchanged items from the previous run
+            resume: Continue from a matching checkpoint if one exists
+
+        Returns:
+            Summary dict (num_items, dimension, encoded, reused, resumed_chunks)
+        """
+        out = Path(output_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        embeddings_path = out / f'{prefix}_embeddings.npy'
+        json_path = out / f'{collection}_with_vectors.json'
+        metadata_path = out / f'{prefix}_embeddings_metadata.json'
+        partial_embeddings = embeddings_path.with_name(embeddings_path.name + '.partial')
+        partial_json = json_path.with_name(json_path.name + '.partial')
+        partial_index = out / f'{prefix}_embeddings.index.partial'
+        checkpoint_path = out / f'{prefix}_embeddings.checkpoint.json'
+
+        num_items = sum(1 for _ in items())
+        print(f"Encoding {num_items} {collection} in chunks of {self.chunk_size} "
+              f"with {self.workers or 'no'} worker processes...")
+
+        pool = None
+        if self.workers > 0:
+            pool = multiprocessing.get_context('spawn').Pool(
+                self.workers,
+                initializer=_init_worker,
+                initargs=(self.model_name, self.threads_per_worker, self.stub_encoder)
+            )
+            dimension = pool.apply(_embedding_dimension)
+        else:
+            _init_worker(self.model_name, 0, self.stub_encoder)
+            dimension = _embedding_dimension()
+
+        previous = _PreviousStore(embeddings_path, metadata_path, self.store_model_name) if reuse else None
+        if previous is not None and previous.embeddings is not None and previous.embeddings.shape[1] != dimension:
+            previous = None
+
+        checkpoint = None
+        if resume and checkpoint_path.exists() and partial_embeddings.exists():
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            expected = {'model_name': self.store_model_name, 'num_items': num_items,
+                        'dimension': dimension, 'chunk_size': self.chunk_size}
+            if any(checkpoint.get(k) != v for k, v in expected.items()):
+                print("Checkpoint does not match this run, starting over")
+                checkpoint = None
+
+        done_chunks = checkpoint['chunks_done'] if checkpoint else 0
+        if checkpoint:
+            embeddings = np.lib.format.open_memmap(partial_embeddings, mode='r+')
+            json_file = open(partial_json, 'r+', encoding='utf-8')
+            json_file.truncate(checkpoint['json_offset'])
+            json_file.seek(checkpoint['json_offset'])
+            index_file = open(partial_index, 'r+', encoding='utf-8')
+            index_file.truncate(checkpoint['index_offset'])
+            index_file.seek(checkpoint['index_offset'])
+            print(f"Resuming after {done_chunks} completed chunks")
+        else:
+            embeddings = np.lib.format.open_memmap(
+                partial_embeddings, mode='w+', dtype=np.float32, shape=(num_items, dimension)
+            )
+            json_file = open(partial_json, 'w', encoding='utf-8')
+            json_file.write('[\n')
+            index_file = open(partial_index, 'w', encoding='utf-8')
+
+        # Running hash of content hashes per chunk, to detect catalog edits between resumes
+        prefix_digest = hashlib.sha256()
+        prefix_digest_at: Dict[int, str] = {}
+        stats = {'encoded': 0, 'reused': 0}
+        pending = deque()
+        written = done_chunks * self.chunk_size
+
+        def finish_chunk(entry):
+            nonlocal written
+            chunk_index, start, chunk, vectors, encode_rows, result = entry
+            if encode_rows:
+                encoded = result.get() if pool is not None else result
+                for row, vector in zip(encode_rows, encoded):
+                    vectors[row] = vector
+                stats['encoded'] += len(encode_rows)
+            stats['reused'] += len(chunk['items']) - len(encode_rows)
+
+            embeddings[start:start + len(vectors)] = vectors
+            for offset, item in enumerate(chunk['items']):
+                record = dict(item)
+                record[vector_field] = vectors[offset].tolist()
+                record[text_field] = chunk['texts'][offset]
+                if start + offset > 0:
+                    json_file.write(',\n')
+                json_file.write(json.dumps(record, ensure_ascii=False))
+                index_file.write(json.dumps([item['id'], chunk['hashes'][offset], item.get('category')]) + '\n')
+            embeddings.flush()
+            json_file.flush()
+            index_file.flush()
+            written = start + len(vectors)
+            _atomic_write_json(checkpoint_path, {
+                'model_name': self.store_model_name,
+                'num_items': num_items,
+                'dimension': dimension,
+                'chunk_size': self.chunk_size,
+                'chunks_done': chunk_index + 1,
+                'prefix_digest': prefix_digest_at[chunk_index],
+                'json_offset': json_file.tell(),
+                'index_offset': index_file.tell()
+            })
+            print(f"  {written}/{num_items} encoded")
+
+        try:
+            start = 0
+            for chunk_index, chunk in enumerate(self._chunks(items(), text_fn)):
+                for digest in chunk['hashes']:
+                    prefix_digest.update(digest.encode('ascii'))
+                prefix_digest_at[chunk_index] = prefix_digest.hexdigest()
+                if chunk_index < done_chunks:
+                    if chunk_index == done_chunks - 1 and prefix_digest_at[chunk_index] != checkpoint['prefix_digest']:
+                        raise RuntimeError(
+                            "Catalog changed since the checkpoint was written; "
+                            f"delete {checkpoint_path} to start over"
+                        )
+                    start += len(chunk['items'])
+                    continue
+
+                vectors = np.empty((len(chunk['items']), dimension), dtype=np.float32)
+                encode_rows = []
+                for row, digest in enumerate(chunk['hashes']):
+                    cached = previous.get(digest) if previous is not None else None
+                    if cached is None:
+                        encode_rows.append(row)
+                    else:
+                        vectors[row] = cached
+                texts = [chunk['texts'][row] for row in encode_rows]
+                if not encode_rows:
+                    result = None
+                elif pool is not None:
+                    result = pool.apply_async(_encode_texts, (texts,))
+                else:
+                    result = _encode_texts(texts)
+
+                pending.append((chunk_index, start, chunk, vectors, encode_rows, result))
+                start += len(chunk['items'])
+                while len(pending) >= self.max_in_flight:
+                    finish_chunk(pending.popleft())
+            while pending:
+                finish_chunk(pending.popleft())
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            json_file.close()
+            index_file.close()
+
+        with open(partial_json, 'a', encoding='utf-8') as f:
+            f.write('\n]\n')
+        del embeddings
+        if previous is not None:
+            previous.embeddings = None
+
+        self._write_metadata(partial_index, metadata_path, prefix, collection, num_items, dimension)
+        os.replace(partial_embeddings, embeddings_path)
+        os.replace(partial_json, json_path)
+        partial_index.unlink()
+        checkpoint_path.unlink()
+
+        print(f"✓ Encoded {stats['encoded']}, reused {stats['reused']} unchanged "
+              f"({done_chunks} chunks resumed from checkpoint)")
+        print(f"✓ Saved embeddings to: {embeddings_path}")
+        print(f"✓ Saved {collection} with vectors to: {json_path}")
+        print(f"✓ Saved metadata to: {metadata_path}")
+        return {
+            'num_items': num_items,
+            'dimension': dimension,
+            'encoded': stats['encoded'],
+            'reused': stats['reused'],
+            'resumed_chunks': done_chunks
+        }
+
+    def _write_metadata(self, index_path: Path, metadata_path: Path, prefix: str,
+                        collection: str, num_items: int, dimension: int):
+        """Stream ids and content hashes from the index file into the metadata JSON"""
+        categories = set()
+        tmp_path = metadata_path.with_name(metadata_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as out:
+            out.write('{\n')
+            out.write(f'  "num_{collection}": {num_items},\n')
+            out.write(f'  "embedding_dimension": {dimension},\n')
+            out.write(f'  "model_name": {json.dumps(self.store_model_name)},\n')
+            for key, column in ((f'{prefix}_ids', 0), ('content_hashes', 1)):
+                out.write(f'  "{key}": [')
+                with open(index_path, 'r', encoding='utf-8') as index:
+                    for i, line in enumerate(index):
+                        entry = json.loads(line)
+                        if entry[2] is not None:
+                            categories.add(entry[2])
+                        out.write((', ' if i else '') + json.dumps(entry[column]))
+                out.write('],\n')
+            out.write(f'  "categories": {json.dumps(sorted(categories))}\n')
+            out.write('}\n')
+        os.replace(tmp_path, metadata_path)
@@ -3,15 +3,20 @@ Celebrity Vibe Vector Generation Script
 Generates semantic embeddings for each celebrity using sentence-transformers
 """
 
+import argparse
 import json
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from pathlib import Path
 import pickle
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+from embedding_cache import EmbeddingCache, catalog_changes, content_hash, encode_with_cache
+from projection import fit_projection, refresh_projected_stores
 
 class CelebrityVectorGenerator:
-    def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', cache_dir: Optional[str] = 'embedding_cache',
+                 full: bool = False):
         """
         Initialize the vector generator with a sentence transformer model
         
@@ -19,11 +24,19 @@ class CelebrityVectorGenerator:
             model_name: Hugging Face model name for sentence transformers
                        'all-MiniLM-L6-v2' - Fast, good quality (default)
                        'all-mpnet-base-v2' - Higher quality, slower
+            cache_dir: Directory for the content-hash embedding cache (None disables it)
+            full: Re-encode everything even if cached, and rewrite all outputs
         """
         print(f"Loading sentence transformer model: {model_name}...")
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
         print("Model loaded successfully!")
         
+        # Content-addressed cache: unchanged items are never re-encoded
+        self.cache = EmbeddingCache(cache_dir, 'celebrities', model_name) if cache_dir else None
+        self.full = full
+        self.content_hashes: List[str] = []
+        
     def generate_celebrity_vibe_text(self, celeb: Dict) -> str:
         """
         Generate comprehensive text representation of celebrity's vibe
@@ -66,15 +79,12 @@ Overall Aesthetic: {primary_vibes} with elements of {secondary_vibes}.
             vibe_text = self.generate_celebrity_vibe_text(celeb)
             vibe_texts.append(vibe_text)
         
-        # Generate embeddings in batch (more efficient)
+        # Generate embeddings in batch, encoding only texts not already cached
         print("Computing embeddings...")
-        embeddings = self.model.encode(
-            vibe_texts, 
-            show_progress_bar=True,
-            convert_to_numpy=True,
-            normalize_embeddings=True  # Normalize for cosine similarity
-        )
-        
+        self.content_hashes = [content_hash(text) for text in vibe_texts]
+        embeddings, encoded = encode_with_cache(self.model, vibe_texts, self.cache, refresh=self.full)
+        print(f"✓ Reused {len(vibe_texts) - encoded} cached embeddings, encoded {encoded} new or changed")
+
         # Add embeddings to celebrity objects
         for i, celeb in enumerate(celebrities):
             celeb['vibe_vector'] = embeddings[i].tolist()
@@ -88,10 +98,30 @@ Overall Aesthetic: {primary_vibes} with elements of {secondary_vibes}.
                        output_dir: str = '.'):
         """
         Save celebrities with vectors and embeddings array
+
+        Outputs are left untouched when no celebrity was added, changed or
+        removed since the previous run.
         """
         output_path = Path(output_dir)
         output_path.mkdir(exist_ok=True)
-        
+        metadata_path = output_path / 'celebrity_embeddings_metadata.json'
+
+        if self.cache is not None:
+            self.cache.prune(self.content_hashes)
+            self.cache.save()
+
+        previous_metadata = None
+        if metadata_path.exists():
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                previous_metadata = json.load(f)
+        changes = catalog_changes(previous_metadata, 'celebrity_ids', [c['id'] for c in celebrities],
+                                  self.content_hashes, self.model_name)
+        print(f"✓ Catalog changes: {len(changes['added'])} added, {len(changes['changed'])} changed, "
+              f"{len(changes['removed'])} removed, {len(changes['unchanged'])} unchanged")
+        if not (self.full or changes['added'] or changes['changed'] or changes['removed']):
+            print("✓ Embedding store is up to date, nothing to write")
+            return
+
         # Save updated celebrities JSON with vibe_vectors
         json_path = output_path / 'celebrities_with_vectors.json'
         with open(json_path, 'w', encoding='utf-8') as f:
@@ -108,10 +138,10 @@ Overall Aesthetic: {primary_vibes} with elements of {secondary_vibes}.
         metadata = {
             'num_celebrities': len(celebrities),
             'embedding_dimension': embeddings.shape[1],
-            'model_name': self.model.get_sentence_embedding_dimension(),
-            'celebrity_ids': [c['id'] for c in celebrities]
+            'model_name': self.model_name,
+            'celebrity_ids': [c['id'] for c in celebrities],
+            'content_hashes': self.content_hashes
         }
-        metadata_path = output_path / 'celebrity_embeddings_metadata.json'
         with open(metadata_path, 'w', encoding='utf-8') as f:
             json.dump(metadata, f, indent=2)
         print(f"✓ Saved metadata to: {metadata_path}")
@@ -124,12 +154,26 @@ Overall Aesthetic: {primary_vibes} with elements of {secondary_vibes}.
 
 def main():
     """Main execution function"""
+    parser = argparse.ArgumentParser(description="Celebrity Vibe Vector Generation")
+    parser.add_argument('--cache-dir', default='embedding_cache',
+                        help="Content-hash embedding cache directory")
+    parser.add_argument('--full', action='store_true',
+                        help="Re-encode every item and refresh the cache")
+    parser.add_argument('--projection-dim', type=int, default=0,
+                        help="Fit a projection to this many dimensions on the product and celebrity "
+                             "embeddings and write projected stores (0 = re-project with an existing one)")
+    parser.add_argument('--whiten', action='store_true',
+                        help="Whiten the fitted projection (similarity thresholds need retuning)")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("Celebrity Vibe Vector Generation")
     print("=" * 60)
     
     # Initialize generator
-    generator = CelebrityVectorGenerator(model_name='all-MiniLM-L6-v2')
+    generator = CelebrityVectorGenerator(model_name='all-MiniLM-L6-v2',
+                                         cache_dir=args.cache_dir,
+                                         full=args.full)
     
     # Load celebrities
     print("\nLoading celebrities...")
@@ -158,6 +202,12 @@ def main():
     print(f"Total celebrities processed: {len(celebrities_with_vectors)}")
     print(f"Embedding dimension: {embeddings.shape[1]}")
     print(f"Embedding shape: {embeddings.shape}")
+    
+    # Projected stores are derived from the full-dimension ones and must follow every change
+    if args.projection_dim:
+        fit_projection('.', args.projection_dim, args.whiten, model_name=generator.model_name)
+    elif refresh_projected_stores('.'):
+        print("✓ Re-projected with the deployed projection")
     print(f"\nCelebrity names:")
     for celeb in celebrities_with_vectors:
         print(f"  - {celeb['name']} ({celeb['id']})")
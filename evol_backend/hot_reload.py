@@ -0,0 +1,247 @@
+"""
+Hot Reload
+Builds, validates and atomically swaps in a new recommender snapshot while the API keeps serving
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from instrumentation import CATALOG_RELOADS
+
+logger = logging.getLogger(__name__)
+
+# Files that make up one recommender snapshot
+DATA_FILES = (
+    'celebrities_with_vectors.json',
+    'celebrity_embeddings.pkl',
+    'products_with_vectors.json',
+    'product_embeddings.npy',
+    'product_embeddings.pkl',
+    'celebrity_embeddings_metadata.json',
+    'product_embeddings_metadata.json',
+    'weight_profiles.json',
+    'embedding_projection.npz',
+    'product_embeddings_projected.npy',
+    'celebrity_embeddings_projected.npy',
+)
+
+CANARY_TEXT = "I love elegant and timeless jewelry for weddings and formal events."
+
+
+def data_version(data_dir: str = '.') -> str:
+    """
+    Fingerprint of the data files on disk (name, size, mtime)
+
+    Cheap enough to poll; any regenerate/replace of a data file changes it.
+    """
+    digest = hashlib.sha1()
+    root = Path(data_dir)
+    for name in DATA_FILES:
+        path = root / name
+        if path.exists():
+            stat = path.stat()
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+def snapshot_version(data_fingerprint: str, engine) -> str:
+    """Data-file fingerprint, suffixed with the change-log position when live changes are applied"""
+    seq = getattr(engine, 'catalog_seq', 0)
+    return f"{data_fingerprint}.{seq}" if seq else data_fingerprint
+
+
+def _catalog_size(engine) -> Optional[int]:
+    catalog = getattr(engine, 'catalog', None)
+    return catalog.live_count if catalog is not None else None
+
+
+def validate_recommender(engine) -> None:
+    """
+    Sanity-check a freshly built recommender before it takes traffic
+
+    Raises:
+        ValueError: if the snapshot is empty, inconsistent or cannot serve a request
+    """
+    if not engine.celebrities:
+        raise ValueError("snapshot has no celebrities")
+    if len(engine.celebrities) != len(engine.celebrity_embeddings):
+        raise ValueError("celebrity count does not match celebrity embeddings")
+    # A sharding coordinator holds no products; its canary exercises the shards
+    if _catalog_size(engine) is not None:
+        if not engine.products:
+            raise ValueError("snapshot has no products")
+        if engine.product_embeddings.shape[1] != engine.celebrity_embeddings.shape[1]:
+            raise ValueError("product and celebrity embedding dimensions differ")
+        sample = np.asarray(engine.product_embeddings[:1000])
+        if not np.isfinite(sample).all():
+            raise ValueError("product embeddings contain NaN/inf")
+    recommendations, celebrities = engine.recommend_products(
+        user_vibe_text=CANARY_TEXT,
+        user_occasions=['Weddings'],
+        user_budget='moderate',
+        top_n=5
+    )
+    if not recommendations or not celebrities:
+        raise ValueError("canary request returned no recommendations")
+
+
+class HotReloader:
+    """
+    Owns the live recommender reference and replaces it without downtime
+
+    A reload builds the complete new snapshot in a worker thread, validates it,
+    then swaps the reference in one assignment. Requests that already hold the
+    old snapshot finish on it; the old snapshot is freed once they are done.
+    Only one reload runs at a time, and incremental changes (apply) are
+    serialized with reloads so none is lost to a concurrent rebuild.
+    """
+
+    def __init__(self,
+                 build: Callable[[Optional[object]], object],
+                 data_dir: str = '.',
+                 on_swap: Optional[Callable[[object], None]] = None):
+        """
+        Args:
+            build: Creates a recommender; receives the current one (or None) so
+                   expensive pieces such as the query encoder can be reused
+            data_dir: Directory whose files are fingerprinted and watched
+            on_swap: Called with the new recommender right after it goes live
+        """
+        self.build = build
+        self.data_dir = data_dir
+        self.on_swap = on_swap
+        self.current = None
+        self.version: Optional[str] = None
+        self.data_version: Optional[str] = None
+        self.loaded_at: Optional[str] = None
+        self.last_result: Optional[Dict] = None
+        self._lock = threading.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+        self.watch_interval = 0.0
+
+    def _build_snapshot(self):
+        fingerprint = data_version(self.data_dir)
+        engine = self.build(self.current)
+        validate_recommender(engine)
+        engine.version = snapshot_version(fingerprint, engine)
+        return engine, fingerprint
+
+    def _publish(self, engine):
+        self.current = engine
+        self.version = engine.version
+        if self.on_swap is not None:
+            self.on_swap(engine)
+
+    def load(self, trigger: str = 'startup') -> Dict:
+        """
+        Build, validate and swap in a new snapshot (blocking)
+
+        Returns:
+            Result dict; on failure the previous snapshot stays live
+        """
+        if not self._lock.acquire(blocking=False):
+            return {'result': 'busy', 'version': self.version}
+        started = time.perf_counter()
+        try:
+            engine, fingerprint = self._build_snapshot()
+            previous = self.version
+            self.data_version = fingerprint
+            self.loaded_at = datetime.utcnow().isoformat()
+            self._publish(engine)
+            version = engine.version
+            result = {
+                'result': 'swapped',
+                'trigger': trigger,
+                'version': version,
+                'previous_version': previous,
+                'products': _catalog_size(engine),
+                'celebrities': len(engine.celebrities),
+                'seconds': round(time.perf_counter() - started, 3)
+            }
+            logger.info("Catalog snapshot %s live (%s, %s products, %.1fs)",
+                        version, trigger, _catalog_size(engine), result['seconds'])
+        except Exception as e:
+            result = {
+                'result': 'failed',
+                'trigger': trigger,
+                'version': self.version,
+                'error': f"{type(e).__name__}: {e}",
+                'seconds': round(time.perf_counter() - started, 3)
+            }
+            logger.error("Catalog reload failed, keeping snapshot %s: %s", self.version, e)
+        finally:
+            self._lock.release()
+        CATALOG_RELOADS.inc(trigger=trigger, result=result['result'])
+        self.last_result = dict(result, finished_at=datetime.utcnow().isoformat())
+        return result
+
+    def apply(self, change: Callable[[object], object]):
+        """
+        Derive a new snapshot from the live one and swap it in (blocking)
+
+        Waits for a running reload to finish first.
+
+        Args:
+            change: Returns the new recommender given the live one; any
+                    exception it raises leaves the live snapshot in place
+
+        Returns:
+            The new live recommender
+        """
+        with self._lock:
+            if self.current is None:
+                raise RuntimeError("no catalog snapshot is loaded")
+            engine = change(self.current)
+            engine.version = snapshot_version(self.data_version, engine)
+            self._publish(engine)
+            return engine
+
+    async def reload(self, trigger: str = 'admin') -> Dict:
+        """Run load() in a worker thread so the event loop keeps serving"""
+        return await asyncio.to_thread(self.load, trigger)
+
+    async def _watch(self, interval: float):
+        seen = data_version(self.data_dir)
+        while True:
+            await asyncio.sleep(interval)
+            version = data_version(self.data_dir)
+            if version == seen:
+                continue
+            # Wait one more interval so a multi-file regenerate can finish
+            seen = version
+            await asyncio.sleep(interval)
+            if data_version(self.data_dir) != version or version == self.data_version:
+                continue
+            await self.reload(trigger='watch')
+
+    def start_watching(self, interval: float):
+        """Poll the data files every `interval` seconds and reload when they change"""
+        if interval <= 0 or self._watch_task is not None:
+            return
+        self.watch_interval = interval
+        self._watch_task = asyncio.get_running_loop().create_task(self._watch(interval))
+        logger.info("Watching %s for catalog changes every %.0fs", self.data_dir, interval)
+
+    def stop_watching(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+
+    def status(self) -> Dict:
+        return {
+            'version': self.version,
+            'data_version': self.data_version,
+            'loaded_at': self.loaded_at,
+            'on_disk_version': data_version(self.data_dir),
+            'reload_in_progress': self._lock.locked(),
+            'watch_interval_seconds': self.watch_interval if self._watch_task is not None else 0,
+            'last_reload': self.last_result
+        }
@@ -0,0 +1,378 @@
+"""
+Request Instrumentation
+In-process metrics registry exposed in Prometheus text format
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Latency buckets in seconds (sub-millisecond up to the slowest cold requests)
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value the way Prometheus expects"""
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str],
+                   extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{_escape_label(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class for labelled metrics"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"{self.name} expects labels {self.label_names}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(val)}"
+            for key, val in items
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (e.g. in-flight requests)"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(val)}"
+            for key, val in items
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed bucket boundaries"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        n_buckets = len(self.buckets)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0.0] * (n_buckets + 2)
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[n_buckets] += value
+            state[n_buckets + 1] += 1
+
+    def count(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-1] if state else 0.0
+
+    def samples(self) -> List[str]:
+        n_buckets = len(self.buckets)
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0.0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                labels = _format_labels(self.label_names, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.label_names, key, ('le', '+Inf'))
+            lines.append(f"{self.name}_bucket{labels} {_format_value(state[n_buckets + 1])}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[n_buckets])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[n_buckets + 1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders the /metrics payload"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} already registered as {existing.metric_type}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text exposition format (v0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+# Global registry shared by the API and the engine
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    'evol_stage_duration_seconds',
+    'Time spent in each recommendation pipeline stage',
+    ['stage']
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    'evol_http_request_duration_seconds',
+    'End-to-end HTTP request latency',
+    ['endpoint']
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    'evol_http_requests_total',
+    'HTTP requests handled, by endpoint and status code',
+    ['endpoint', 'status']
+)
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    'evol_http_requests_in_flight',
+    'HTTP requests currently being processed',
+    ['endpoint']
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    'evol_cache_lookups_total',
+    'Cache lookups by cache name and result (hit/miss)',
+    ['cache', 'result']
+)
+REQUESTS_COALESCED = REGISTRY.counter(
+    'evol_requests_coalesced_total',
+    'Requests answered by joining an identical computation already in flight',
+    ['endpoint']
+)
+SESSION_EVICTIONS = REGISTRY.counter(
+    'evol_session_evictions_total',
+    'Server-side sessions dropped, by store and reason (expired/memory/replaced)',
+    ['store', 'reason']
+)
+CATALOG_RELOADS = REGISTRY.counter(
+    'evol_catalog_reloads_total',
+    'Catalog snapshot reloads by trigger and result',
+    ['trigger', 'result']
+)
+CATALOG_MUTATIONS = REGISTRY.counter(
+    'evol_catalog_mutations_total',
+    'Products created, updated or deleted through the catalog API',
+    ['op']
+)
+
+
+# ==================== Per-Request Tracing ====================
+
+class RequestTrace:
+    """
+    Stage timings and counters for a single request
+
+    Only populated while active (see ``activate_trace``), so normal
+    traffic pays nothing beyond a context variable lookup per stage.
+    """
+
+    def __init__(self):
+        self.stages: List[Dict[str, Any]] = []
+        self.counts: Dict[str, int] = {}
+        self.cache: Dict[str, str] = {}
+        self.attributes: Dict[str, Any] = {}
+
+    def add_stage(self, name: str, wall_seconds: float, cpu_seconds: Optional[float] = None):
+        self.stages.append({
+            'stage': name,
+            'wall_ms': round(wall_seconds * 1000.0, 3),
+            'cpu_ms': round(cpu_seconds * 1000.0, 3) if cpu_seconds is not None else None
+        })
+
+    def total_wall_ms(self) -> float:
+        return round(sum(s['wall_ms'] for s in self.stages), 3)
+
+    def server_timing(self) -> str:
+        """Render stages as a ``Server-Timing`` header value"""
+        return ", ".join(f"{s['stage']};dur={s['wall_ms']}" for s in self.stages)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'stages': list(self.stages),
+            'total_wall_ms': self.total_wall_ms(),
+            'counts': dict(self.counts),
+            'cache': dict(self.cache),
+            'attributes': dict(self.attributes)
+        }
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('evol_request_trace', default=None)
+
+
+def activate_trace(trace: RequestTrace) -> Token:
+    """Make ``trace`` the active trace for the current context; returns a reset token"""
+    return _current_trace.set(trace)
+
+
+def deactivate_trace(token: Token):
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def trace_count(name: str, value: int):
+    """Record a candidate count on the active trace (no-op when tracing is off)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.counts[name] = int(value)
+
+
+def trace_annotate(name: str, value: Any):
+    """Attach an arbitrary attribute to the active trace (no-op when tracing is off)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes[name] = value
+
+
+# ==================== Stage Timing ====================
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    """
+    Time a pipeline stage and record it in the stage latency histogram
+
+    CPU time is only sampled when a request trace is active.
+
+    Args:
+        stage: Stage name used as the ``stage`` label
+    """
+    trace = _current_trace.get()
+    cpu_start = time.thread_time() if trace is not None else 0.0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        if trace is not None:
+            trace.add_stage(stage, elapsed, time.thread_time() - cpu_start)
+
+
+def record_stage(stage: str, seconds: float):
+    """Record a stage duration measured outside of ``timed_stage``"""
+    STAGE_LATENCY.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    """Count a cache lookup; hit rate = hits / (hits + misses)"""
+    result = 'hit' if hit else 'miss'
+    CACHE_LOOKUPS.inc(cache=cache, result=result)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.cache[cache] = result
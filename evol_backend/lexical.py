@@ -0,0 +1,309 @@
+"""
+Lexical Matching
+BM25 inverted index over product text, so exact attribute terms ("platinum", "pear diamond") match by postings lookup
+"""
+
+import argparse
+import math
+import re
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+# Words that carry no attribute information in survey answers or product copy
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i in is it its like love me my of on or our so than that the
+their them these this those to very was we were with would you your prefer preferred want looking something
+""".split())
+
+
+def _normalize(token: str) -> str:
+    """Fold simple plurals so "diamonds" matches "diamond" and "rubies" matches "ruby\""""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercased alphanumeric terms of `text`, stopwords and single characters dropped"""
+    if not text:
+        return []
+    return [_normalize(token) for token in _TOKEN.findall(text.lower())
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+def product_lexical_text(product: Dict) -> str:
+    """Fields a product is matched on: its name, category, description and material"""
+    return ' '.join(str(product.get(field) or '') for field in ('name', 'category', 'description', 'material'))
+
+
+class LexicalQuery:
+    """
+    Analyzed query terms with the corpus statistics they are scored against
+
+    A single process uses its own catalog's statistics; a sharding
+    coordinator sums every shard's, so each shard scores with the same
+    idf and average length as one process holding the whole catalog.
+    """
+
+    __slots__ = ('terms', 'documents', 'total_length', 'df')
+
+    def __init__(self, terms: List[str], documents: int, total_length: float, df: List[int]):
+        self.terms = terms
+        self.documents = documents
+        self.total_length = total_length
+        self.df = df
+
+    def to_dict(self) -> Dict:
+        return {'terms': self.terms, 'documents': self.documents,
+                'total_length': self.total_length, 'df': self.df}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LexicalQuery':
+        return cls(list(data['terms']), int(data['documents']), float(data['total_length']),
+                   [int(value) for value in data['df']])
+
+
+def query_terms(text: Optional[str]) -> List[str]:
+    """Distinct terms of a query, in order of first appearance"""
+    return list(dict.fromkeys(tokenize(text)))
+
+
+def matched_terms(product: Dict, terms: List[str]) -> List[str]:
+    """Those of `terms` found in the product's text (for explanations)"""
+    tokens = set(tokenize(product_lexical_text(product)))
+    return [term for term in terms if term in tokens]
+
+
+def merge_term_stats(stats: Iterable[Dict]) -> Dict:
+    """Sum per-shard term_stats() results for the same terms"""
+    stats = list(stats)
+    return {
+        'documents': sum(entry['documents'] for entry in stats),
+        'total_length': sum(entry['total_length'] for entry in stats),
+        'df': [sum(values) for values in zip(*(entry['df'] for entry in stats))]
+    }
+
+
+class LexicalIndex:
+    """
+    BM25 postings over the product text of a catalog
+
+    Postings are three flat arrays: for term t, rows[indptr[t]:indptr[t+1]]
+    are the products containing it (int32) and tf the matching term counts
+    (float32), so a query term costs one slice and the index about 8 bytes
+    per distinct (product, term) pair. Deleted products have no postings
+    and zero length, so document frequencies and the average length only
+    count live products. Like CatalogIndex, a finalized index is never
+    modified; with_changes() returns a new one.
+    """
+
+    # BM25 term-frequency saturation and length normalization
+    k1: float = 1.2
+    b: float = 0.75
+
+    def __init__(self, vocab: Optional[Dict[str, int]] = None):
+        self.vocab: Dict[str, int] = vocab if vocab is not None else {}
+        self._terms = array('i')
+        self._rows = array('i')
+        self._tf = array('f')
+        self._lengths = array('f')
+        self.finalized = False
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, product: Dict):
+        """Append the next row's product (call finalize() once all products are added)"""
+        if self.finalized:
+            raise RuntimeError("LexicalIndex is finalized")
+        tokens = tokenize(product_lexical_text(product))
+        row = len(self._lengths)
+        for term, count in Counter(tokens).items():
+            code = self.vocab.get(term)
+            if code is None:
+                code = self.vocab[term] = len(self.vocab)
+            self._terms.append(code)
+            self._rows.append(row)
+            self._tf.append(count)
+        self._lengths.append(len(tokens))
+
+    def finalize(self) -> 'LexicalIndex':
+        """Group the postings by term"""
+        terms = np.frombuffer(self._terms, dtype=np.int32)
+        # Stable, so each term's rows stay in catalog order
+        order = np.argsort(terms, kind='stable')
+        self._set_postings(terms[order], np.frombuffer(self._rows, dtype=np.int32)[order],
+                           np.frombuffer(self._tf, dtype=np.float32)[order])
+        self.lengths = np.frombuffer(self._lengths, dtype=np.float32).copy()
+        self.documents = len(self.lengths)
+        self.total_length = float(self.lengths.sum(dtype=np.float64))
+        self._terms = self._rows = self._tf = self._lengths = None
+        self.finalized = True
+        return self
+
+    def _set_postings(self, terms: np.ndarray, rows: np.ndarray, tf: np.ndarray):
+        """Postings from entries already sorted by term"""
+        self.indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self.vocab)), out=self.indptr[1:])
+        self.rows = np.ascontiguousarray(rows, dtype=np.int32)
+        self.tf = np.ascontiguousarray(tf, dtype=np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indptr.nbytes + self.rows.nbytes + self.tf.nbytes + self.lengths.nbytes
+
+    def with_changes(self, delta: 'LexicalIndex', rows: np.ndarray, deleted: np.ndarray,
+                     size: int, documents: int) -> 'LexicalIndex':
+        """
+        Copy-on-write update
+
+        Postings of replaced and deleted rows are dropped and the changed
+        products' postings merged in, in one vectorized pass over the
+        postings. The vocabulary is shared unless a change brings a new term.
+
+        Args:
+            delta: Finalized index of the changed products over a copy of this vocabulary
+            rows: Row of each delta product (existing rows are replaced, new rows appended)
+            deleted: Rows of deleted products
+            size: Rows after the change
+            documents: Live products after the change
+        """
+        new = LexicalIndex(delta.vocab if len(delta.vocab) > len(self.vocab) else self.vocab)
+        changed = np.zeros(size, dtype=bool)
+        changed[rows] = True
+        changed[deleted] = True
+        entry_terms = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+        kept = ~changed[self.rows]
+        delta_terms = np.repeat(np.arange(len(delta.indptr) - 1, dtype=np.int32), np.diff(delta.indptr))
+        terms = np.concatenate([entry_terms[kept], delta_terms])
+        # Two sorted runs: the stable sort merges them in linear time
+        order = np.argsort(terms, kind='stable')
+        new._set_postings(
+            terms[order],
+            np.concatenate([self.rows[kept], rows[delta.rows].astype(np.int32)])[order],
+            np.concatenate([self.tf[kept], delta.tf])[order]
+        )
+
+        new.lengths = np.zeros(size, dtype=np.float32)
+        new.lengths[:len(self.lengths)] = self.lengths
+        new.lengths[deleted] = 0.0
+        new.lengths[rows] = delta.lengths
+        new.documents = documents
+        new.total_length = float(new.lengths.sum(dtype=np.float64))
+        new.finalized = True
+        return new
+
+    # ==================== Scoring ====================
+
+    def term_stats(self, terms: List[str]) -> Dict:
+        """Live products, their total length and the document frequency of each term"""
+        df = np.diff(self.indptr)
+        return {
+            'documents': self.documents,
+            'total_length': self.total_length,
+            'df': [int(df[self.vocab[term]]) if term in self.vocab else 0 for term in terms]
+        }
+
+    def query(self, text: Optional[str]) -> Optional[LexicalQuery]:
+        """Analyze `text` against this index's own statistics (None when it has no terms)"""
+        terms = query_terms(text)
+        if not terms:
+            return None
+        stats = self.term_stats(terms)
+        return LexicalQuery(terms, stats['documents'], stats['total_length'], stats['df'])
+
+    def scores(self, query: LexicalQuery) -> Optional[np.ndarray]:
+        """
+        BM25 score of every row, divided by the best score the query's terms allow
+
+        Only the postings of the query terms are read. The result lies in
+        [0, 1): a product approaches 1 as it contains every matched query
+        term often relative to its length. Query terms no product contains
+        are ignored, so filler words in free text do not dilute the scale.
+
+        Returns:
+            (len(self),) float64 column, or None when no query term occurs in the corpus
+        """
+        k1, b = self.k1, self.b
+        average_length = query.total_length / max(1, query.documents)
+        bound = 0.0
+        matched_rows, matched_scores = [], []
+        for term, df in zip(query.terms, query.df):
+            if df <= 0:
+                continue
+            idf = math.log(1.0 + (query.documents - df + 0.5) / (df + 0.5))
+            bound += idf * (k1 + 1.0)
+            code = self.vocab.get(term)
+            if code is None:
+                # Only in other shards' products
+                continue
+            start, stop = self.indptr[code], self.indptr[code + 1]
+            rows = self.rows[start:stop]
+            tf = self.tf[start:stop].astype(np.float64)
+            norm = k1 * (1.0 - b + b * self.lengths[rows].astype(np.float64) / average_length)
+            matched_rows.append(rows)
+            matched_scores.append(idf * tf * (k1 + 1.0) / (tf + norm))
+        if bound == 0.0:
+            return None
+        if not matched_rows:
+            return np.zeros(len(self.lengths))
+        column = np.bincount(np.concatenate(matched_rows), weights=np.concatenate(matched_scores),
+                             minlength=len(self.lengths))
+        column /= bound
+        return column
+
+
+def main():
+    """Main execution function"""
+    from catalog import iter_catalog
+
+    parser = argparse.ArgumentParser(description="Lexical index statistics and query matches")
+    parser.add_argument('query', help="Free text to match, e.g. \"white gold or platinum\"")
+    parser.add_argument('--catalog', default='products_with_vectors.json', help="Product catalog file")
+    parser.add_argument('--top', type=int, default=10, help="Matches to show")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Lexical Index")
+    print("=" * 60)
+
+    products = list(iter_catalog(args.catalog))
+    started = time.perf_counter()
+    index = LexicalIndex()
+    for product in products:
+        index.add(product)
+    index.finalize()
+    print(f"✓ Indexed {len(index):,} products in {(time.perf_counter() - started) * 1000:.0f} ms: "
+          f"{len(index.vocab):,} terms, {len(index.rows):,} postings, {index.nbytes / (1024 * 1024):.2f} MB")
+
+    query = index.query(args.query)
+    if query is None:
+        print("  no terms to match")
+        return
+    timings = []
+    for _ in range(100):
+        started = time.perf_counter()
+        scores = index.scores(query)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    print(f"  terms: {', '.join(f'{term} (df {df})' for term, df in zip(query.terms, query.df))}")
+    print(f"  scoring p50: {np.percentile(timings, 50):.3f} ms")
+    if scores is None:
+        print("  no product contains any query term")
+        return
+    rows = np.argsort(-scores, kind='stable')[:args.top]
+    for row in rows[scores[rows] > 0]:
+        product = products[row]
+        print(f"  {scores[row]:.3f}  {product['name']}  [{', '.join(matched_terms(product, query.terms))}]")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
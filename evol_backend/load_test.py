@@ -0,0 +1,479 @@
+"""
+Concurrent HTTP Load Generator
+Asyncio load tests against a local API instance, built from the api_test.py example surveys
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from api_test import EXAMPLE_SURVEYS
+
+ENDPOINTS = {
+    'recommendations': '/api/v1/recommendations',
+    'match': '/api/v1/celebrities/match',
+}
+
+OCCASION_CHOICES = [
+    "Weddings", "Formal Events", "Anniversary", "Engagement", "Valentine's Day",
+    "Daily Wear", "Cocktail Parties", "Special Celebrations", "Casual Events"
+]
+BUDGET_CHOICES = [
+    "Under ₹50,000 (Accessible luxury)",
+    "₹50,000 - ₹1,50,000 (Premium)",
+    "₹1,50,000 - ₹3,00,000 (Luxury)",
+    "Above ₹3,00,000 (Ultra-luxury)",
+]
+EXTRA_PREFERENCES = [
+    "Prefer white gold or platinum", "Rose gold preferred", "Love layered looks",
+    "Yellow gold with floral designs", "Pear diamonds", "Something for everyday wear",
+]
+
+# Histogram bucket upper bounds in milliseconds
+HISTOGRAM_BOUNDS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+# ==================== Minimal Async HTTP Client ====================
+
+class HttpConnection:
+    """
+    Keep-alive HTTP/1.1 connection over asyncio streams
+
+    Deliberately dependency-free so the tool runs anywhere the API does.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self.writer = None
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        """Send one request and return (status, body); reconnects once on a stale connection"""
+        for attempt in range(2):
+            if self.writer is None:
+                await self._connect()
+            try:
+                return await self._roundtrip(method, path, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt == 1:
+                    raise
+        raise ConnectionError("unreachable")
+
+    async def _roundtrip(self, method: str, path: str, body: Optional[bytes]) -> Tuple[int, bytes]:
+        body = body or b''
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode('ascii')
+        self.writer.write(head + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            payload = b''.join(chunks)
+        else:
+            payload = await self.reader.readexactly(int(headers.get('content-length', '0')))
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, payload
+
+
+class ConnectionPool:
+    """Reuses idle keep-alive connections across requests"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._idle: List[HttpConnection] = []
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        conn = self._idle.pop() if self._idle else HttpConnection(self.host, self.port)
+        try:
+            result = await conn.request(method, path, body)
+        except BaseException:
+            await conn.close()
+            raise
+        self._idle.append(conn)
+        return result
+
+    async def close(self):
+        while self._idle:
+            await self._idle.pop().close()
+
+
+# ==================== Workload ====================
+
+class SurveyGenerator:
+    """
+    Produces request payloads from EXAMPLE_SURVEYS
+
+    A `repeat_ratio` share of requests reuse an unmodified preset (what
+    kiosks with preset buttons send); the rest are perturbed so that any
+    server-side cache sees a realistic hit rate instead of 100%.
+    """
+
+    def __init__(self, repeat_ratio: float = 0.3, seed: int = 0):
+        self.presets = list(EXAMPLE_SURVEYS.values())
+        self.repeat_ratio = repeat_ratio
+        self.rng = random.Random(seed)
+
+    def survey(self) -> Dict:
+        base = dict(self.rng.choice(self.presets))
+        if self.rng.random() < self.repeat_ratio:
+            return base
+        base['occasions'] = self.rng.sample(OCCASION_CHOICES, self.rng.randint(1, 3))
+        base['budget'] = self.rng.choice(BUDGET_CHOICES)
+        base['additional_preferences'] = (
+            f"{self.rng.choice(EXTRA_PREFERENCES)} (variant {self.rng.randint(0, 999)})"
+        )
+        return base
+
+
+def parse_mix(mix: str) -> List[Tuple[str, float]]:
+    """Parse 'recommendations=0.8,match=0.2' into normalized (endpoint, weight) pairs"""
+    pairs = []
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}', expected one of {list(ENDPOINTS)}")
+        pairs.append((name, float(weight or 1.0)))
+    total = sum(w for _, w in pairs)
+    return [(name, w / total) for name, w in pairs]
+
+
+def build_request(endpoint: str, surveys: SurveyGenerator, top_n: int) -> Tuple[str, bytes]:
+    survey = surveys.survey()
+    if endpoint == 'match':
+        return f"{ENDPOINTS['match']}?top_k=3", json.dumps(survey).encode('utf-8')
+    payload = {'survey': survey, 'top_n': top_n, 'celebrity_threshold': 0.4, 'include_scores': False}
+    return ENDPOINTS['recommendations'], json.dumps(payload).encode('utf-8')
+
+
+@dataclass
+class RunStats:
+    """Outcome of one load phase"""
+    label: str
+    duration: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list)
+    per_endpoint: Dict[str, List[float]] = field(default_factory=dict)
+    errors: int = 0
+    dropped: int = 0
+    offered: int = 0
+    error_samples: List[str] = field(default_factory=list)
+
+    def record(self, endpoint: str, latency_ms: float, ok: bool, error: Optional[str] = None):
+        if ok:
+            self.latencies_ms.append(latency_ms)
+            self.per_endpoint.setdefault(endpoint, []).append(latency_ms)
+        else:
+            self.errors += 1
+            if error and len(self.error_samples) < 5:
+                self.error_samples.append(error)
+
+    @property
+    def completed(self) -> int:
+        return len(self.latencies_ms) + self.errors
+
+    def summary(self) -> Dict:
+        lat = np.array(self.latencies_ms) if self.latencies_ms else np.array([0.0])
+        return {
+            'label': self.label,
+            'duration_s': round(self.duration, 3),
+            'offered': self.offered,
+            'completed': self.completed,
+            'dropped': self.dropped,
+            'throughput_rps': round(len(self.latencies_ms) / self.duration, 2) if self.duration else 0.0,
+            'error_rate': round(self.errors / self.completed, 4) if self.completed else 0.0,
+            'latency_ms': {
+                'p50': round(float(np.percentile(lat, 50)), 2),
+                'p90': round(float(np.percentile(lat, 90)), 2),
+                'p99': round(float(np.percentile(lat, 99)), 2),
+                'max': round(float(lat.max()), 2)
+            },
+            'per_endpoint_p99_ms': {
+                name: round(float(np.percentile(values, 99)), 2)
+                for name, values in self.per_endpoint.items()
+            },
+            'error_samples': self.error_samples
+        }
+
+
+async def _issue(pool: ConnectionPool, endpoint: str, path: str, body: bytes, stats: RunStats):
+    start = time.perf_counter()
+    try:
+        status, payload = await pool.request('POST', path, body)
+        ok = 200 <= status < 300
+        error = None if ok else f"HTTP {status}: {payload[:200].decode('utf-8', 'replace')}"
+    except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+        ok, error = False, f"{type(e).__name__}: {e}"
+    stats.record(endpoint, (time.perf_counter() - start) * 1000.0, ok, error)
+
+
+async def run_closed_loop(host: str, port: int, concurrency: int, duration: float,
+                          mix: List[Tuple[str, float]], surveys: SurveyGenerator, top_n: int) -> RunStats:
+    """`concurrency` workers each send requests back-to-back for `duration` seconds"""
+    stats = RunStats(label=f"closed-loop c={concurrency}")
+    names, weights = zip(*mix)
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        pool = ConnectionPool(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                endpoint = random.choices(names, weights)[0]
+                path, body = build_request(endpoint, surveys, top_n)
+                stats.offered += 1
+                await _issue(pool, endpoint, path, body, stats)
+        finally:
+            await pool.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    stats.duration = time.perf_counter() - start
+    return stats
+
+
+async def run_open_loop(host: str, port: int, rate: float, duration: float, max_in_flight: int,
+                        mix: List[Tuple[str, float]], surveys: SurveyGenerator, top_n: int) -> RunStats:
+    """
+    Poisson arrivals at `rate` req/s regardless of how fast the server answers
+
+    Unlike a closed loop, queueing delay shows up in the latencies instead of
+    silently lowering the offered load. Arrivals beyond `max_in_flight`
+    outstanding requests are counted as dropped.
+    """
+    stats = RunStats(label=f"open-loop {rate:g} req/s")
+    names, weights = zip(*mix)
+    pool = ConnectionPool(host, port)
+    in_flight = set()
+    start = time.perf_counter()
+    next_arrival = start
+    try:
+        while next_arrival - start < duration:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            stats.offered += 1
+            if len(in_flight) >= max_in_flight:
+                stats.dropped += 1
+            else:
+                endpoint = random.choices(names, weights)[0]
+                path, body = build_request(endpoint, surveys, top_n)
+                task = asyncio.create_task(_issue(pool, endpoint, path, body, stats))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            next_arrival += random.expovariate(rate)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    finally:
+        await pool.close()
+    stats.duration = time.perf_counter() - start
+    return stats
+
+
+# ==================== Reporting ====================
+
+def print_histogram(latencies_ms: List[float]):
+    if not latencies_ms:
+        print("  (no successful requests)")
+        return
+    counts = np.histogram(latencies_ms, bins=[0] + HISTOGRAM_BOUNDS_MS + [float('inf')])[0]
+    peak = max(counts.max(), 1)
+    lower = 0
+    for bound, count in zip(HISTOGRAM_BOUNDS_MS + [float('inf')], counts):
+        label = f"{lower:>6g}-{bound:<6g} ms" if bound != float('inf') else f"{lower:>6g}+       ms"
+        print(f"  {label} {count:>7} {'█' * int(40 * count / peak)}")
+        lower = bound
+
+
+def print_summary(stats: RunStats):
+    summary = stats.summary()
+    print(f"\n{summary['label']}: {summary['completed']} completed in {summary['duration_s']:.1f}s")
+    print(f"  throughput {summary['throughput_rps']:.2f} req/s, error rate {summary['error_rate']:.2%}, "
+          f"dropped {summary['dropped']}")
+    lat = summary['latency_ms']
+    print(f"  latency p50 {lat['p50']:.1f} ms, p90 {lat['p90']:.1f} ms, p99 {lat['p99']:.1f} ms, max {lat['max']:.1f} ms")
+    for name, p99 in summary['per_endpoint_p99_ms'].items():
+        print(f"    {name:<16} p99 {p99:.1f} ms")
+    for sample in summary['error_samples']:
+        print(f"  ! {sample}")
+    print_histogram(stats.latencies_ms)
+
+
+def find_saturation(results: List[Dict], slo_p99_ms: float, min_efficiency: float = 0.95) -> Optional[Dict]:
+    """
+    Highest offered rate the server still keeps up with
+
+    A step counts as sustained when it achieves at least `min_efficiency` of
+    the offered rate, has a p99 within the SLO and an error rate under 1%.
+    """
+    sustained = None
+    for result in results:
+        offered_rate = result['offered'] / result['duration_s'] if result['duration_s'] else 0.0
+        keeps_up = result['throughput_rps'] >= min_efficiency * offered_rate
+        if keeps_up and result['latency_ms']['p99'] <= slo_p99_ms and result['error_rate'] < 0.01:
+            sustained = result
+        else:
+            break
+    return sustained
+
+
+# ==================== Local Server ====================
+
+def spawn_local_server(port: int, stub_encoder: bool) -> subprocess.Popen:
+    """Start `uvicorn main:app` on localhost (optionally with the offline stub encoder)"""
+    env = dict(os.environ)
+    if stub_encoder:
+        env['EVOL_STUB_ENCODER'] = '1'
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        env=env
+    )
+
+
+async def wait_for_health(host: str, port: int, timeout: float = 120.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        conn = HttpConnection(host, port)
+        try:
+            status, body = await conn.request('GET', '/health')
+            if status == 200 and json.loads(body).get('recommender_loaded'):
+                return
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            await conn.close()
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"Server on {host}:{port} did not become healthy within {timeout:.0f}s")
+
+
+async def run(args) -> Dict:
+    url = urlsplit(args.url)
+    host, port = url.hostname or '127.0.0.1', url.port or 80
+    mix = parse_mix(args.mix)
+    surveys = SurveyGenerator(repeat_ratio=args.repeat_ratio, seed=args.seed)
+    random.seed(args.seed)
+
+    await wait_for_health(host, port, timeout=args.startup_timeout)
+
+    if args.warmup > 0:
+        await run_closed_loop(host, port, 1, args.warmup, mix, surveys, args.top_n)
+
+    results = []
+    if args.rates:
+        for rate in [float(r) for r in args.rates.split(',')]:
+            stats = await run_open_loop(host, port, rate, args.duration, args.max_in_flight,
+                                        mix, surveys, args.top_n)
+            print_summary(stats)
+            results.append(stats.summary())
+        saturation = find_saturation(results, args.slo_p99_ms)
+        print("\n" + "=" * 60)
+        if saturation:
+            print(f"Saturation point: sustained {saturation['label']} "
+                  f"({saturation['throughput_rps']:.2f} req/s, p99 {saturation['latency_ms']['p99']:.1f} ms)")
+        else:
+            print("Saturation point: below the lowest offered rate")
+        print("=" * 60)
+    else:
+        saturation = None
+        stats = await run_closed_loop(host, port, args.concurrency, args.duration, mix, surveys, args.top_n)
+        print_summary(stats)
+        results.append(stats.summary())
+
+    return {'args': vars(args), 'results': results, 'saturation': saturation}
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Concurrent load test for the Jewelry Recommendation API")
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help="API base URL")
+    parser.add_argument('--concurrency', type=int, default=8, help="Closed-loop workers")
+    parser.add_argument('--rates', default=None,
+                        help="Open-loop arrival rates to sweep, req/s (e.g. 2,5,10,20); finds the saturation point")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds per phase")
+    parser.add_argument('--warmup', type=float, default=5.0, help="Warm-up seconds before measuring")
+    parser.add_argument('--max-in-flight', type=int, default=512, help="Open-loop cap on outstanding requests")
+    parser.add_argument('--mix', default='recommendations=0.8,match=0.2',
+                        help="Endpoint mix, e.g. recommendations=0.8,match=0.2")
+    parser.add_argument('--repeat-ratio', type=float, default=0.3,
+                        help="Share of requests that reuse an unmodified preset survey")
+    parser.add_argument('--top-n', type=int, default=10, help="top_n for recommendation requests")
+    parser.add_argument('--slo-p99-ms', type=float, default=1000.0, help="p99 latency SLO for saturation search")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--spawn-server', action='store_true',
+                        help="Start a local uvicorn instance for the test (port taken from --url)")
+    parser.add_argument('--stub-encoder', action='store_true',
+                        help="With --spawn-server: use the offline HashingEncoder instead of the transformer")
+    parser.add_argument('--startup-timeout', type=float, default=120.0, help="Seconds to wait for /health")
+    parser.add_argument('--output', default=None, help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("API Load Test")
+    print("=" * 60)
+
+    server = None
+    if args.spawn_server:
+        server = spawn_local_server(urlsplit(args.url).port or 8000, args.stub_encoder)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Saved report to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,24 +3,51 @@ FastAPI Server for Jewelry Recommendation System
 Provides REST API endpoints for celebrity-based product recommendations
 """
 
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.routing import Match
 from pydantic import BaseModel, Field, validator
 from typing import List, Optional, Dict, Any
 import uvicorn
 from pathlib import Path
 import logging
 from datetime import datetime
+import asyncio
 import os
+import signal
+import time
+import uuid
+from contextlib import nullcontext
 
-from recommender_engine import CelebrityProductRecommender
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from recommender_engine import CelebrityProductRecommender, HashingEncoder
+from profiling import RequestProfiler, PROFILE_MODES
+from structured_logging import setup_logging, stop_logging, log_event
+from traffic_capture import TrafficRecorder
+from hot_reload import HotReloader
+from catalog import CatalogError
+from catalog_log import CatalogChangeLog, apply_catalog_changes
+from sharding import ShardedRecommender, HttpShardClient, serve_facets, serve_shard_query, serve_term_stats
+from coalescing import SingleFlight, request_key
+from sessions import SessionStore, RankedList, make_cursor, parse_cursor
+from instrumentation import (
+    REGISTRY,
+    PROMETHEUS_CONTENT_TYPE,
+    REQUEST_LATENCY,
+    REQUESTS_TOTAL,
+    REQUESTS_IN_FLIGHT,
+    RequestTrace,
+    activate_trace,
+    deactivate_trace,
+    timed_stage,
+    record_stage,
+    trace_annotate
 )
+
+# Configure logging (JSON lines via a background queue listener; LOG_LEVEL / LOG_FORMAT)
+setup_logging()
 logger = logging.getLogger(__name__)
+summary_logger = logging.getLogger("evol.requests")
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -40,9 +67,176 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global recommender instance (loaded once at startup)
+# Global recommender instance; replaced wholesale by the hot reloader, so
+# handlers take one local reference per request and never re-read it
 recommender: Optional[CelebrityProductRecommender] = None
 
+# Header that turns on the per-request trace without changing the payload
+DEBUG_TRACE_HEADER = "X-Debug-Trace"
+REQUEST_ID_HEADER = "X-Request-ID"
+CATALOG_VERSION_HEADER = "X-Catalog-Version"
+
+# Sampling profiler for live traffic (off unless PROFILE_SAMPLE_EVERY > 0)
+profiler = RequestProfiler.from_env()
+
+# Opt-in traffic capture for replay benchmarks (off unless CAPTURE_SAMPLE_RATE > 0)
+capture = TrafficRecorder.from_env()
+
+# Admin endpoints are only enabled when a token is configured
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+# Poll the data files every N seconds and reload on change (0 = admin endpoint only)
+RELOAD_WATCH_INTERVAL = float(os.environ.get("RELOAD_WATCH_INTERVAL", "0"))
+
+
+# Catalog sharding: SHARD_INDEX/SHARD_COUNT make this process serve one slice of the
+# catalog; SHARD_URLS makes it a coordinator that fans requests out to the shards
+SHARD = (int(os.environ["SHARD_INDEX"]), int(os.environ["SHARD_COUNT"])) if os.environ.get("SHARD_COUNT") else None
+SHARD_URLS = [url.strip() for url in os.environ.get("SHARD_URLS", "").split(",") if url.strip()]
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT", "5"))
+
+# Rank catalogs of at least N products with the threshold algorithm over the
+# pre-sorted score columns instead of a full scan (0 = always scan)
+THRESHOLD_MIN_PRODUCTS = int(os.environ.get("THRESHOLD_MIN_PRODUCTS", "0"))
+
+# Score product similarity on int8/float16 embeddings (unset = float32), re-scoring the
+# best EXACT_RESCORE_DEPTH rows of each ranking with the exact vectors
+EMBEDDING_QUANTIZATION = os.environ.get("EMBEDDING_QUANTIZATION", "").strip().lower() or None
+EXACT_RESCORE_DEPTH = int(os.environ.get("EXACT_RESCORE_DEPTH", "100"))
+
+# Identical concurrent recommendation requests share one computation (REQUEST_COALESCING=0 disables)
+recommendation_flight = SingleFlight(
+    '/api/v1/recommendations',
+    enabled=os.environ.get("REQUEST_COALESCING", "1").strip().lower() not in ('0', 'false', 'no', 'off')
+)
+
+# Paginated rankings kept server-side (SESSION_TTL, SESSION_MAX_MB); SESSION_DEPTH caps their length
+ranked_sessions = SessionStore.from_env('ranked_list')
+# Per-user scoring state for incremental re-scoring of refined surveys
+scoring_sessions = SessionStore.from_env('scoring_state')
+SESSION_DEPTH = int(os.environ.get("SESSION_DEPTH", "500"))
+
+# Named blend weights requests can select with `weight_profile` (part of the snapshot, reloaded with it)
+WEIGHT_PROFILES_PATH = os.environ.get("WEIGHT_PROFILES", "weight_profiles.json")
+
+# Live product changes made through the API (CATALOG_LOG_PATH, replayed on every load)
+change_log = None if SHARD_URLS else CatalogChangeLog.from_env(
+    '.', default_name=f"catalog_changes.shard{SHARD[0]}of{SHARD[1]}.jsonl" if SHARD else 'catalog_changes.jsonl'
+)
+
+
+def _build_recommender(current: Optional[CelebrityProductRecommender]) -> CelebrityProductRecommender:
+    """Load a fresh recommender, reusing the live query encoder when there is one"""
+    if current is not None:
+        encoder = current.model
+    else:
+        # EVOL_STUB_ENCODER=1 swaps in an offline hashing encoder (load tests only)
+        encoder = HashingEncoder() if os.environ.get('EVOL_STUB_ENCODER') == '1' else None
+    if SHARD_URLS:
+        shards = [HttpShardClient(url, timeout=SHARD_TIMEOUT) for url in SHARD_URLS]
+        engine = ShardedRecommender('.', shards, encoder=encoder)
+        engine.load_weight_profiles(WEIGHT_PROFILES_PATH)
+        return engine
+    engine = CelebrityProductRecommender('.', encoder=encoder, shard=SHARD)
+    engine.load_weight_profiles(WEIGHT_PROFILES_PATH)
+    engine.threshold_min_rows = THRESHOLD_MIN_PRODUCTS or None
+    if EMBEDDING_QUANTIZATION:
+        engine = engine.with_quantization(EMBEDDING_QUANTIZATION, EXACT_RESCORE_DEPTH)
+    if change_log is not None:
+        engine = change_log.replay(engine)
+    engine.warm_candidate_pools()
+    return engine
+
+
+def _install_recommender(engine: CelebrityProductRecommender):
+    """Publish a new snapshot (a single reference assignment)"""
+    global recommender
+    recommender = engine
+
+
+reloader = HotReloader(_build_recommender, data_dir='.', on_swap=_install_recommender)
+
+
+def _endpoint_label(request: Request) -> str:
+    """Resolve the route template for metric labels (keeps label cardinality bounded)"""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """
+    Track in-flight requests, latency and status codes per endpoint
+    
+    Endpoints that attach a trace to `request.state.trace` also get one
+    structured summary log line per request.
+    """
+    endpoint = _endpoint_label(request)
+    if endpoint == "/metrics":
+        return await call_next(request)
+    
+    request.state.received_at = time.perf_counter()
+    request.state.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+    status_code = 500
+    serialization_seconds = None
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers[REQUEST_ID_HEADER] = request.state.request_id
+        catalog_version = getattr(request.state, 'catalog_version', None) or reloader.version
+        if catalog_version:
+            response.headers[CATALOG_VERSION_HEADER] = catalog_version
+        
+        # Response model validation + JSON encoding happen after the handler returns
+        serialization_started = getattr(request.state, 'serialization_started', None)
+        if serialization_started is not None:
+            serialization_seconds = time.perf_counter() - serialization_started
+            record_stage('serialization', serialization_seconds)
+            if 'server-timing' in response.headers:
+                response.headers['Server-Timing'] += f", serialization;dur={serialization_seconds * 1000.0:.3f}"
+        return response
+    finally:
+        elapsed = time.perf_counter() - request.state.received_at
+        REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+        REQUEST_LATENCY.observe(elapsed, endpoint=endpoint)
+        REQUESTS_TOTAL.inc(endpoint=endpoint, status=str(status_code))
+        
+        capture_entry = getattr(request.state, 'capture', None)
+        if capture_entry is not None:
+            capture.record(
+                endpoint,
+                capture_entry['payload'],
+                status_code,
+                elapsed * 1000.0,
+                product_ids=capture_entry.get('product_ids'),
+                celebrity_ids=capture_entry.get('celebrity_ids'),
+                params=capture_entry.get('params')
+            )
+        
+        trace = getattr(request.state, 'trace', None)
+        if trace is not None:
+            stages = {s['stage']: s['wall_ms'] for s in trace.stages}
+            if serialization_seconds is not None:
+                stages['serialization'] = round(serialization_seconds * 1000.0, 3)
+            log_event(
+                summary_logger,
+                "recommendation request",
+                request_id=request.state.request_id,
+                endpoint=endpoint,
+                status=status_code,
+                latency_ms=round(elapsed * 1000.0, 3),
+                stages_ms=stages,
+                counts=trace.counts,
+                cache=trace.cache,
+                coalesced=trace.attributes.get('coalesced', False),
+                weight_profile=trace.attributes.get('weight_profile')
+            )
+
 
 # ==================== Pydantic Models ====================
 
@@ -91,6 +285,43 @@ class SurveyResponse(BaseModel):
         return v
 
 
+class RecommendationFilters(BaseModel):
+    """Hard filters: any of the values within a field, every field given"""
+    categories: Optional[List[str]] = Field(
+        None,
+        description="Product categories to keep",
+        example=["earrings-catalog", "rings-catalog"]
+    )
+    price_bands: Optional[List[str]] = Field(
+        None,
+        description="Price bands to keep (affordable, moderate, luxury, ultra-luxury)",
+        example=["moderate"]
+    )
+    style_tags: Optional[List[str]] = Field(
+        None,
+        description="Primary or secondary style tags to keep",
+        example=["Minimalist", "Classic"]
+    )
+    occasions: Optional[List[str]] = Field(
+        None,
+        description="Product occasions to keep",
+        example=["Weddings"]
+    )
+    min_price: Optional[float] = Field(None, ge=0, description="Lowest price in INR (inclusive)")
+    max_price: Optional[float] = Field(None, ge=0, description="Highest price in INR (inclusive)")
+    
+    @validator('max_price')
+    def validate_price_range(cls, v, values):
+        if v is not None and values.get('min_price') is not None and v < values['min_price']:
+            raise ValueError("max_price must not be below min_price")
+        return v
+    
+    def as_dict(self) -> Optional[Dict[str, Any]]:
+        """The fields that were given, or None when nothing is filtered"""
+        filters = {key: value for key, value in self.model_dump().items() if value not in (None, [])}
+        return filters or None
+
+
 class RecommendationRequest(BaseModel):
     """Request model for getting recommendations"""
     survey: SurveyResponse
@@ -110,6 +341,46 @@ class RecommendationRequest(BaseModel):
         False,
         description="Include detailed scoring breakdown"
     )
+    paginate: bool = Field(
+        False,
+        description="Keep the full ranking server-side and return a cursor for further pages"
+    )
+    session: bool = Field(
+        False,
+        description="Keep this user's scoring state server-side and return a session_id"
+    )
+    session_id: Optional[str] = Field(
+        None,
+        description="Session from a previous response; only what the changed answers affect is recomputed"
+    )
+    weight_profile: Optional[str] = Field(
+        None,
+        description="Named server-side blend weights (see GET /api/v1/weights)"
+    )
+    weights: Optional[Dict[str, float]] = Field(
+        None,
+        description="Blend weight overrides by component, applied on top of weight_profile"
+    )
+    diversity_lambda: Optional[float] = Field(
+        None,
+        ge=0.0,
+        le=1.0,
+        description="Relevance/novelty trade-off for diversity selection (1.0 = pure score order)"
+    )
+    diversity_pool: Optional[int] = Field(
+        None,
+        ge=1,
+        le=500,
+        description="Number of top-ranked candidates diversity selection chooses from (default 3 * top_n)"
+    )
+    filters: Optional[RecommendationFilters] = Field(
+        None,
+        description="Hard filters; only matching products are scored and recommended"
+    )
+    include_facets: bool = Field(
+        False,
+        description="Return product counts per category, price band, style tag and occasion (after filters)"
+    )
 
 
 class CelebrityMatch(BaseModel):
@@ -136,6 +407,7 @@ class ProductRecommendation(BaseModel):
     image_url: str
     match_score: float
     scores_breakdown: Optional[Dict[str, float]] = None
+    explanation: Optional[Dict[str, Any]] = None
 
 
 class CelebrityWithProducts(BaseModel):
@@ -154,6 +426,23 @@ class RecommendationResponse(BaseModel):
     all_recommendations: List[ProductRecommendation]
     total_recommendations: int
     request_params: Dict[str, Any]
+    catalog_version: Optional[str] = None
+    next_cursor: Optional[str] = None
+    session_id: Optional[str] = None
+    recomputed: Optional[List[str]] = None
+    facets: Optional[Dict[str, Dict[str, int]]] = None
+    trace: Optional[Dict[str, Any]] = None
+
+
+class RecommendationPage(BaseModel):
+    """Further products from a paginated ranking"""
+    status: str = "success"
+    timestamp: str
+    all_recommendations: List[ProductRecommendation]
+    total_recommendations: int
+    remaining: int
+    next_cursor: Optional[str] = None
+    catalog_version: Optional[str] = None
 
 
 class HealthResponse(BaseModel):
@@ -161,9 +450,91 @@ class HealthResponse(BaseModel):
     status: str
     version: str
     recommender_loaded: bool
+    catalog_version: Optional[str] = None
     timestamp: str
 
 
+class ProfilingConfig(BaseModel):
+    """Runtime profiler settings (admin)"""
+    sample_every: Optional[int] = Field(
+        None,
+        ge=0,
+        description="Profile 1 in N recommendation requests (0 disables)"
+    )
+    mode: Optional[str] = Field(
+        None,
+        description=f"Profiler mode: one of {', '.join(PROFILE_MODES)}"
+    )
+    flush: bool = Field(
+        False,
+        description="Write collected profiles to disk now"
+    )
+
+
+class ProductInput(BaseModel):
+    """Catalog product (same fields as products.json; extra fields are kept)"""
+    model_config = {'extra': 'allow'}
+    
+    id: int
+    name: str
+    price: str = Field(..., description="Price string as in products.json, e.g. '1,23,456 INR'")
+    category: str
+    description: str = ''
+    material: Optional[str] = None
+    image_url: str = ''
+    primary_style_tags: List[str] = []
+    secondary_style_tags: List[str] = []
+    occasions: List[str] = []
+    vibe_description: str = ''
+
+
+class ProductPatch(BaseModel):
+    """Partial product update; only the fields sent are changed"""
+    model_config = {'extra': 'allow'}
+    
+    name: Optional[str] = None
+    price: Optional[str] = None
+    category: Optional[str] = None
+    description: Optional[str] = None
+    material: Optional[str] = None
+    image_url: Optional[str] = None
+    primary_style_tags: Optional[List[str]] = None
+    secondary_style_tags: Optional[List[str]] = None
+    occasions: Optional[List[str]] = None
+    vibe_description: Optional[str] = None
+
+
+class ShardQuery(BaseModel):
+    """Scatter-gather query from a sharding coordinator (internal)"""
+    user_embedding: List[float]
+    celebrities: List[Dict[str, Any]]
+    occasions: List[str] = []
+    budget: str = 'moderate'
+    k: int = Field(..., ge=1, le=1000)
+    explain: bool = False
+    weights: Optional[Dict[str, float]] = None
+    lexical: Optional[Dict[str, Any]] = None
+    filters: Optional[Dict[str, Any]] = None
+
+
+class TermStatsQuery(BaseModel):
+    """Corpus statistics request from a sharding coordinator (internal)"""
+    terms: List[str] = Field(..., max_length=256)
+
+
+class FacetQuery(BaseModel):
+    """Facet counts request from a sharding coordinator (internal)"""
+    filters: Optional[Dict[str, Any]] = None
+
+
+class ReloadRequest(BaseModel):
+    """Catalog reload options (admin)"""
+    wait: bool = Field(
+        True,
+        description="Block until the new snapshot is live (false: start it in the background)"
+    )
+
+
 class ErrorResponse(BaseModel):
     """Error response model"""
     status: str = "error"
@@ -201,6 +572,17 @@ def map_budget_to_tier(budget: str) -> str:
     return "moderate"
 
 
+def survey_text_key(survey: SurveyResponse) -> str:
+    """Fingerprint of the free-text answers; a session re-encodes the user only when it changes"""
+    return request_key(
+        style_preference=survey.style_preference,
+        jewelry_type=survey.jewelry_type,
+        sparkle_level=survey.sparkle_level,
+        celebrity_inspiration=survey.celebrity_inspiration,
+        additional_preferences=survey.additional_preferences
+    )
+
+
 def generate_user_vibe_text(survey: SurveyResponse) -> str:
     """Generate comprehensive vibe text from survey responses"""
     vibe_text = f"""
@@ -229,6 +611,122 @@ I love {survey.jewelry_type.lower()} with {survey.sparkle_level.lower()}.
     return vibe_text
 
 
+def generate_lexical_text(survey: SurveyResponse) -> Optional[str]:
+    """Free-text answers matched term by term against product text ("white gold", "pear diamond")"""
+    parts = [text for text in (survey.additional_preferences, survey.celebrity_inspiration) if text]
+    return ' '.join(parts) or None
+
+
+def ranking_arguments(request: RecommendationRequest) -> Dict[str, Any]:
+    """
+    Request-derived keyword arguments of rank_products / rerank_products / recommend_products
+
+    Shared with replay.py, so a replayed capture is ranked on exactly what the endpoint used.
+    """
+    return {
+        'user_vibe_text': generate_user_vibe_text(request.survey),
+        'lexical_text': generate_lexical_text(request.survey),
+        'user_occasions': request.survey.occasions,
+        'user_budget': map_budget_to_tier(request.survey.budget),
+        'celebrity_threshold': request.celebrity_threshold,
+        'explain': request.include_scores,
+        'filters': request.filters.as_dict() if request.filters is not None else None
+    }
+
+
+def request_weights(engine: CelebrityProductRecommender, request: RecommendationRequest) -> Dict[str, float]:
+    """
+    Blend weights for a request: defaults, then the named profile, then explicit overrides
+
+    Raises:
+        ValueError: on an unknown profile or an invalid override (HTTP 422)
+    """
+    weights = engine.weights
+    if request.weight_profile is not None:
+        weights = engine.weight_profiles.get(request.weight_profile)
+        if weights is None:
+            raise ValueError(f"Unknown weight profile {request.weight_profile!r}; "
+                             f"available: {', '.join(engine.weight_profiles) or 'none'}")
+        trace_annotate('weight_profile', request.weight_profile)
+    if request.weights:
+        weights = engine.resolve_weights(dict(weights, **request.weights))
+        trace_annotate('weight_overrides', sorted(request.weights))
+    return weights
+
+
+def format_product(product: Dict,
+                   match_score: float,
+                   scores_breakdown: Optional[Dict] = None,
+                   explanation: Optional[Dict] = None) -> Dict:
+    """Product fields returned in `all_recommendations`"""
+    return {
+        'id': product['id'],
+        'name': product['name'],
+        'price': product['price'],
+        'description': product.get('description', ''),
+        'category': product['category'],
+        'primary_style_tags': product.get('primary_style_tags', []),
+        'secondary_style_tags': product.get('secondary_style_tags', []),
+        'occasions': product.get('occasions', []),
+        'vibe_description': product.get('vibe_description', ''),
+        'image_url': product.get('image_url', ''),
+        'match_score': float(match_score),
+        'scores_breakdown': scores_breakdown,
+        'explanation': explanation
+    }
+
+
+def _require_admin(http_request: Request):
+    """Reject admin calls unless ADMIN_TOKEN is set and matches the request header"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin endpoints are disabled (ADMIN_TOKEN not configured)"
+        )
+    if http_request.headers.get(ADMIN_TOKEN_HEADER) != ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid admin token"
+        )
+
+
+def _resolve_product_id(engine: CelebrityProductRecommender, product_id: str):
+    """Map a path parameter to a live catalog id (ids may be ints or strings)"""
+    position = engine.catalog.position
+    if product_id in position:
+        return product_id
+    try:
+        if int(product_id) in position:
+            return int(product_id)
+    except ValueError:
+        pass
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Product {product_id} not found")
+
+
+async def _change_catalog(change) -> CelebrityProductRecommender:
+    """Apply a catalog change off the event loop, mapping invalid input to 422"""
+    if recommender is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Recommendation engine not loaded"
+        )
+    if SHARD_URLS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="This is a sharding coordinator; send catalog changes to the shard that owns the product"
+        )
+    try:
+        return await asyncio.to_thread(reloader.apply, change)
+    except CatalogError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+def _debug_trace_requested(http_request: Request) -> bool:
+    """Check whether the caller asked for a per-request trace via header"""
+    value = http_request.headers.get(DEBUG_TRACE_HEADER, '')
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 def group_products_by_celebrity(recommendations: List[Dict], 
                                celebrities: List[Dict],
                                include_scores: bool = False) -> List[Dict]:
@@ -260,7 +758,8 @@ def group_products_by_celebrity(recommendations: List[Dict],
                 'vibe_description': product.get('vibe_description', ''),
                 'image_url': product.get('image_url', ''),
                 'match_score': float(rec['final_score']),
-                'scores_breakdown': rec.get('scores_breakdown') if include_scores else None
+                'scores_breakdown': rec.get('scores_breakdown') if include_scores else None,
+                'explanation': rec.get('explanation') if include_scores else None
             })
         
         # Distribute products roughly equally, or based on match scores
@@ -290,23 +789,50 @@ def group_products_by_celebrity(recommendations: List[Dict],
 @app.on_event("startup")
 async def startup_event():
     """Load recommender on startup"""
-    global recommender
     logger.info("Starting up Jewelry Recommendation API...")
     
-    try:
-        logger.info("Loading recommendation engine...")
-        recommender = CelebrityProductRecommender('.')
-        logger.info("✓ Recommendation engine loaded successfully")
-    except Exception as e:
-        logger.error(f"Failed to load recommender: {e}")
+    logger.info("Loading recommendation engine...")
+    result = reloader.load(trigger='startup')
+    if result['result'] == 'swapped':
+        logger.info("✓ Recommendation engine loaded successfully (catalog %s)", result['version'])
+    else:
+        logger.error(f"Failed to load recommender: {result.get('error')}")
         logger.warning("API will start but recommendations will fail until data is loaded")
-        recommender = None
+    
+    # Pick up regenerated data files without a restart (RELOAD_WATCH_INTERVAL > 0)
+    reloader.start_watching(RELOAD_WATCH_INTERVAL)
+    
+    # `kill -USR1 <pid>` toggles request profiling without a redeploy
+    if hasattr(signal, 'SIGUSR1'):
+        default_rate = int(os.environ.get('PROFILE_TOGGLE_SAMPLE_EVERY', '100'))
+        loop = asyncio.get_running_loop()
+        
+        def log_toggle(future: asyncio.Future):
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                logger.error(f"SIGUSR1 profiler toggle failed: {future.exception()}", exc_info=future.exception())
+            else:
+                logger.info(f"✓ Profiling {'enabled' if profiler.enabled else 'disabled'} by SIGUSR1")
+        
+        def toggle_profiling():
+            # Turning profiling off flushes to disk, so it runs on a worker thread
+            loop.run_in_executor(None, profiler.toggle, default_rate).add_done_callback(log_toggle)
+        
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, toggle_profiling)
+        except (NotImplementedError, RuntimeError, ValueError):
+            logger.warning("Could not install SIGUSR1 profiler toggle (not in main thread)")
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down Jewelry Recommendation API...")
+    reloader.stop_watching()
+    profiler.flush()
+    capture.close()
+    stop_logging()
 
 
 # ==================== API Endpoints ====================
@@ -321,7 +847,8 @@ async def root():
         "health": "/health",
         "endpoints": {
             "recommendations": "POST /api/v1/recommendations",
-            "health": "GET /health"
+            "health": "GET /health",
+            "metrics": "GET /metrics"
         }
     }
 
@@ -329,14 +856,22 @@ async def root():
 @app.get("/health", response_model=HealthResponse, tags=["Health"])
 async def health_check():
     """Health check endpoint"""
+    engine = recommender
     return {
-        "status": "healthy" if recommender is not None else "degraded",
+        "status": "healthy" if engine is not None else "degraded",
         "version": "1.0.0",
-        "recommender_loaded": recommender is not None,
+        "recommender_loaded": engine is not None,
+        "catalog_version": engine.version if engine is not None else None,
         "timestamp": datetime.utcnow().isoformat()
     }
 
 
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (stage latencies, request counts, cache hit/miss)"""
+    return Response(content=REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @app.post(
     "/api/v1/recommendations",
     response_model=RecommendationResponse,
@@ -345,7 +880,9 @@ async def health_check():
     summary="Get jewelry recommendations",
     description="Submit user survey and get personalized jewelry recommendations with celebrity matches"
 )
-async def get_recommendations(request: RecommendationRequest):
+async def get_recommendations(request: RecommendationRequest,
+                              http_request: Request,
+                              http_response: Response):
     """
     Main recommendation endpoint
     
@@ -353,34 +890,140 @@ async def get_recommendations(request: RecommendationRequest):
     - Matched celebrities
     - Product recommendations grouped by celebrity
     - Overall product recommendations
+    
+    With `include_scores` or an `X-Debug-Trace: 1` header, the response also
+    carries a stage-by-stage trace and a `Server-Timing` header.
     """
+    # Always traced (feeds the per-request summary log line); only returned on demand
+    trace = RequestTrace()
+    trace_token = activate_trace(trace)
+    http_request.state.trace = trace
+    return_trace = request.include_scores or _debug_trace_requested(http_request)
+    
+    capture_entry = None
+    if capture.should_record():
+        capture_entry = {'payload': request.model_dump()}
+        http_request.state.capture = capture_entry
+    
+    # Body read + validation happened between the middleware and here
+    record_stage('request_parsing', time.perf_counter() - http_request.state.received_at)
+    
+    # One snapshot for the whole request, even if a reload swaps it meanwhile
+    engine = recommender
+    
     try:
         # Check if recommender is loaded
-        if recommender is None:
+        if engine is None:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="Recommendation engine not loaded. Please ensure embeddings are generated."
             )
+        http_request.state.catalog_version = engine.version
         
-        logger.info(f"Processing recommendation request for {len(request.survey.occasions)} occasions")
+        logger.debug("Processing recommendation request for %d occasions", len(request.survey.occasions))
         
         # Generate user vibe text
-        user_vibe_text = generate_user_vibe_text(request.survey)
+        with timed_stage('vibe_text'):
+            arguments = ranking_arguments(request)
+        budget_tier = arguments['user_budget']
+        
+        try:
+            weights = request_weights(engine, request)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        filters = arguments['filters']
+        
+        # Get recommendations (1 in N requests are profiled when enabled)
+        profile_scope = profiler.profile() if profiler.should_profile() else nullcontext()
+        
+        # Paging resolves ids against the local catalog, which a sharding coordinator does not have
+        paginate = request.paginate and getattr(engine, 'catalog', None) is not None
+        pool_size = engine.diversity_pool(request.top_n, request.diversity_pool)
+        depth = max(SESSION_DEPTH, pool_size) if paginate else pool_size
         
-        # Map budget to tier
-        budget_tier = map_budget_to_tier(request.survey.budget)
+        # A known session is re-scored incrementally; an unknown or expired one starts over
+        use_session = request.session or request.session_id is not None
+        state = scoring_sessions.get(request.session_id) if request.session_id else None
+        session_id = request.session_id if state is not None else None
         
-        # Get recommendations
-        recommendations, matched_celebrities = recommender.recommend_products(
-            user_vibe_text=user_vibe_text,
-            user_occasions=request.survey.occasions,
-            user_budget=budget_tier,
+        def compute():
+            with profile_scope:
+                # Rank deep enough for paging; the first page is the usual diversity selection
+                if use_session:
+                    candidates, matched, new_state, recomputed = engine.rerank_products(
+                        state,
+                        survey_text_key(request.survey),
+                        depth=depth,
+                        weights=weights,
+                        **arguments
+                    )
+                else:
+                    candidates, matched = engine.rank_products(
+                        depth=depth,
+                        weights=weights,
+                        **arguments
+                    )
+                    new_state, recomputed = None, None
+                recommendations = engine.diversify(candidates, request.top_n, pool_size, request.diversity_lambda)
+                facets = None
+                if request.include_facets:
+                    with timed_stage('facets'):
+                        facets = engine.facet_counts(filters)
+                return candidates, recommendations, matched, new_state, recomputed, facets
+        
+        # Runs off the event loop; a duplicate of a request already in flight
+        # waits for that computation instead of starting its own
+        flight_key = request_key(
+            catalog_version=engine.version,
+            user_vibe_text=arguments['user_vibe_text'],
+            occasions=request.survey.occasions,
+            budget_tier=budget_tier,
             top_n=request.top_n,
             celebrity_threshold=request.celebrity_threshold,
-            explain=request.include_scores
+            explain=request.include_scores,
+            weights=weights,
+            diversity_pool=pool_size,
+            diversity_lambda=request.diversity_lambda,
+            paginate=paginate,
+            session=use_session,
+            session_id=session_id,
+            filters=filters,
+            include_facets=request.include_facets
         )
+        (candidates, recommendations, matched_celebrities, new_state, recomputed, facets), _ = \
+            await recommendation_flight.run(flight_key, compute)
+        if new_state is not None:
+            session_id = scoring_sessions.put(new_state, token=session_id)
+        
+        next_cursor = None
+        if paginate:
+            with timed_stage('session_store'):
+                ranking = RankedList(
+                    candidates, recommendations, matched_celebrities,
+                    params={'top_n': request.top_n, 'budget_tier': budget_tier},
+                    catalog_version=engine.version
+                )
+                if ranking.remaining(0):
+                    next_cursor = make_cursor(ranked_sessions.put(ranking), 0)
+        
+        logger.debug("Generated %d recommendations with %d celebrity matches",
+                     len(recommendations), len(matched_celebrities))
+        
+        if capture_entry is not None:
+            capture_entry['product_ids'] = [rec['product']['id'] for rec in recommendations]
+            capture_entry['celebrity_ids'] = [celeb['id'] for celeb in matched_celebrities]
         
-        logger.info(f"Generated {len(recommendations)} recommendations with {len(matched_celebrities)} celebrity matches")
+        # Group products by celebrity
+        with timed_stage('celebrity_grouping'):
+            celebrity_product_groups = group_products_by_celebrity(
+                recommendations, 
+                matched_celebrities,
+                request.include_scores
+            )
+        
+        # Serialization is closed out by the metrics middleware once the
+        # response body has been rendered
+        http_request.state.serialization_started = time.perf_counter()
         
         # Format celebrity matches
         celebrity_matches = [
@@ -396,29 +1039,14 @@ async def get_recommendations(request: RecommendationRequest):
             for celeb in matched_celebrities
         ]
         
-        # Group products by celebrity
-        celebrity_product_groups = group_products_by_celebrity(
-            recommendations, 
-            matched_celebrities,
-            request.include_scores
-        )
-        
         # Format all recommendations
         all_recommendations = [
-            {
-                'id': rec['product']['id'],
-                'name': rec['product']['name'],
-                'price': rec['product']['price'],
-                'description': rec['product'].get('description', ''),
-                'category': rec['product']['category'],
-                'primary_style_tags': rec['product'].get('primary_style_tags', []),
-                'secondary_style_tags': rec['product'].get('secondary_style_tags', []),
-                'occasions': rec['product'].get('occasions', []),
-                'vibe_description': rec['product'].get('vibe_description', ''),
-                'image_url': rec['product'].get('image_url', ''),
-                'match_score': float(rec['final_score']),
-                'scores_breakdown': rec.get('scores_breakdown') if request.include_scores else None
-            }
+            format_product(
+                rec['product'],
+                rec['final_score'],
+                rec.get('scores_breakdown') if request.include_scores else None,
+                rec.get('explanation') if request.include_scores else None
+            )
             for rec in recommendations
         ]
         
@@ -434,10 +1062,24 @@ async def get_recommendations(request: RecommendationRequest):
                 'top_n': request.top_n,
                 'celebrity_threshold': request.celebrity_threshold,
                 'budget_tier': budget_tier,
-                'occasions': request.survey.occasions
-            }
+                'occasions': request.survey.occasions,
+                'weight_profile': request.weight_profile,
+                'weights': weights,
+                'diversity_pool': pool_size,
+                'diversity_lambda': engine.mmr_lambda if request.diversity_lambda is None else request.diversity_lambda,
+                'filters': filters
+            },
+            'catalog_version': engine.version,
+            'next_cursor': next_cursor,
+            'session_id': session_id,
+            'recomputed': recomputed,
+            'facets': facets
         }
         
+        if return_trace:
+            response['trace'] = trace.to_dict()
+            http_response.headers['Server-Timing'] = trace.server_timing()
+        
         return response
         
     except HTTPException:
@@ -448,6 +1090,78 @@ async def get_recommendations(request: RecommendationRequest):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating recommendations: {str(e)}"
         )
+    finally:
+        deactivate_trace(trace_token)
+
+
+@app.get(
+    "/api/v1/recommendations/page",
+    response_model=RecommendationPage,
+    tags=["Recommendations"],
+    summary="Next page of a paginated ranking",
+    description="Serve further products from the ranking kept for a `paginate: true` request"
+)
+async def get_recommendation_page(cursor: str, limit: int = Query(20, ge=1, le=100)):
+    """
+    Slice the stored ranking at the cursor (no re-scoring)
+    
+    Products shown on the first page are skipped. A cursor can be replayed,
+    e.g. when a client retries a page.
+    """
+    try:
+        token, offset = parse_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    ranking = ranked_sessions.get(token)
+    if ranking is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Unknown or expired cursor; request recommendations again"
+        )
+    
+    engine = recommender
+    if engine is None or getattr(engine, 'catalog', None) is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Recommendation engine not loaded"
+        )
+    
+    # Products removed from the catalog since the ranking was built are skipped
+    positions, next_offset = ranking.page(min(offset, len(ranking)), limit)
+    catalog_position = engine.catalog.position
+    page = []
+    for product_id, score in zip(ranking.ids[positions].tolist(), ranking.scores[positions].tolist()):
+        row = catalog_position.get(product_id)
+        if row is not None:
+            page.append(format_product(engine.products[row], score))
+    remaining = ranking.remaining(next_offset)
+    
+    return {
+        'status': 'success',
+        'timestamp': datetime.utcnow().isoformat(),
+        'all_recommendations': page,
+        'total_recommendations': len(page),
+        'remaining': remaining,
+        'next_cursor': make_cursor(token, next_offset) if remaining else None,
+        'catalog_version': engine.version
+    }
+
+
+@app.get("/api/v1/weights", tags=["Recommendations"], summary="Blend weights and named profiles")
+async def get_weights():
+    """Default blend weights and the profiles requests can select with `weight_profile`"""
+    engine = recommender
+    if engine is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Recommendation engine not loaded"
+        )
+    return {
+        'status': 'success',
+        'default': engine.weights,
+        'profiles': engine.weight_profiles,
+        'catalog_version': engine.version
+    }
 
 
 @app.post(
@@ -456,30 +1170,41 @@ async def get_recommendations(request: RecommendationRequest):
     summary="Match user with celebrities only",
     description="Get celebrity matches without product recommendations"
 )
-async def match_celebrities(survey: SurveyResponse, top_k: int = 3):
+async def match_celebrities(survey: SurveyResponse, http_request: Request, top_k: int = 3):
     """
     Match user with celebrities based on their style preferences
     """
+    capture_entry = None
+    if capture.should_record():
+        capture_entry = {'payload': survey.model_dump(), 'params': {'top_k': top_k}}
+        http_request.state.capture = capture_entry
+    
+    engine = recommender
+    
     try:
-        if recommender is None:
+        if engine is None:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="Recommendation engine not loaded"
             )
+        http_request.state.catalog_version = engine.version
         
         # Generate user vibe text
         user_vibe_text = generate_user_vibe_text(survey)
         
         # Encode user preferences
-        user_embedding = recommender.encode_user_preferences(user_vibe_text)
+        user_embedding = engine.encode_user_preferences(user_vibe_text)
         
         # Find matching celebrities
-        matched_celebrities = recommender.find_matching_celebrities(
+        matched_celebrities = engine.find_matching_celebrities(
             user_embedding,
             top_k=top_k,
             threshold=0.3
         )
         
+        if capture_entry is not None:
+            capture_entry['celebrity_ids'] = [celeb['id'] for celeb in matched_celebrities]
+        
         # Format response
         celebrity_matches = [
             {
@@ -498,7 +1223,8 @@ async def match_celebrities(survey: SurveyResponse, top_k: int = 3):
             'status': 'success',
             'timestamp': datetime.utcnow().isoformat(),
             'matched_celebrities': celebrity_matches,
-            'total_matches': len(celebrity_matches)
+            'total_matches': len(celebrity_matches),
+            'catalog_version': engine.version
         }
         
     except HTTPException:
@@ -511,26 +1237,223 @@ async def match_celebrities(survey: SurveyResponse, top_k: int = 3):
         )
 
 
+# ==================== Catalog Endpoints ====================
+
+@app.post("/api/v1/products", status_code=status.HTTP_201_CREATED, tags=["Catalog"],
+          summary="Add a product")
+async def create_product(product: ProductInput, http_request: Request):
+    """
+    Add a product to the live catalog (admin)
+    
+    The product is embedded and merged into a new catalog snapshot; the
+    change is appended to the catalog log so it survives restarts.
+    """
+    _require_admin(http_request)
+    record = product.model_dump()
+    
+    def change(engine):
+        if record['id'] in engine.catalog.position:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail=f"Product {record['id']} already exists")
+        return apply_catalog_changes(engine, upserts=[record], change_log=change_log)
+    
+    engine = await _change_catalog(change)
+    http_request.state.catalog_version = engine.version
+    return {'status': 'success', 'product': record, 'catalog_version': engine.version}
+
+
+@app.patch("/api/v1/products/{product_id}", tags=["Catalog"], summary="Update a product")
+async def update_product(product_id: str, patch: ProductPatch, http_request: Request):
+    """
+    Change some fields of a live product, e.g. its price (admin)
+    
+    The product is re-embedded from its updated text; other products are untouched.
+    """
+    _require_admin(http_request)
+    fields = patch.model_dump(exclude_unset=True)
+    fields.pop('id', None)
+    updated = {}
+    
+    def change(engine):
+        key = _resolve_product_id(engine, product_id)
+        updated.update(engine.products[engine.catalog.position[key]], **fields)
+        return apply_catalog_changes(engine, upserts=[updated], change_log=change_log)
+    
+    engine = await _change_catalog(change)
+    http_request.state.catalog_version = engine.version
+    return {'status': 'success', 'product': updated, 'catalog_version': engine.version}
+
+
+@app.delete("/api/v1/products/{product_id}", tags=["Catalog"], summary="Remove a product")
+async def delete_product(product_id: str, http_request: Request):
+    """Remove a product from the live catalog (admin)"""
+    _require_admin(http_request)
+    deleted = []
+    
+    def change(engine):
+        deleted.append(_resolve_product_id(engine, product_id))
+        return apply_catalog_changes(engine, deletes=deleted, change_log=change_log)
+    
+    engine = await _change_catalog(change)
+    http_request.state.catalog_version = engine.version
+    return {'status': 'success', 'deleted': deleted[0], 'catalog_version': engine.version}
+
+
+@app.post("/internal/shard/candidates", tags=["Internal"], include_in_schema=False)
+async def shard_candidates(query: ShardQuery, http_request: Request):
+    """
+    Local top-k for a sharding coordinator
+    
+    Any non-coordinator instance can answer; with SHARD_INDEX/SHARD_COUNT it
+    holds (and scores) only its slice of the catalog.
+    """
+    engine = recommender
+    if engine is None or SHARD_URLS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No local catalog loaded"
+        )
+    http_request.state.catalog_version = engine.version
+    try:
+        return serve_shard_query(engine, query.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+@app.post("/internal/shard/term-stats", tags=["Internal"], include_in_schema=False)
+async def shard_term_stats(query: TermStatsQuery):
+    """Live product count, total text length and document frequencies for a coordinator's BM25 scoring"""
+    engine = recommender
+    if engine is None or SHARD_URLS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No local catalog loaded"
+        )
+    return serve_term_stats(engine, query.terms)
+
+
+@app.post("/internal/shard/facets", tags=["Internal"], include_in_schema=False)
+async def shard_facets(query: FacetQuery):
+    """Facet counts of the local products passing a coordinator's filters"""
+    engine = recommender
+    if engine is None or SHARD_URLS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No local catalog loaded"
+        )
+    return serve_facets(engine, query.filters)
+
+
+# ==================== Admin Endpoints ====================
+
+@app.get("/admin/profiling", tags=["Admin"], summary="Request profiler status")
+async def get_profiling(http_request: Request):
+    """Current sampling profiler settings and recently written files"""
+    _require_admin(http_request)
+    return {'status': 'success', 'profiler': profiler.status()}
+
+
+@app.post("/admin/profiling", tags=["Admin"], summary="Configure request profiler")
+async def configure_profiling(config: ProfilingConfig, http_request: Request):
+    """
+    Switch request profiling on/off at runtime
+    
+    Profiles are aggregated and written to PROFILE_DIR as rotating
+    `.pstats` (cprofile mode) or `.collapsed` (stack mode) files.
+    """
+    _require_admin(http_request)
+    try:
+        profiler.configure(sample_every=config.sample_every, mode=config.mode)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    written = profiler.flush() if config.flush else None
+    return {
+        'status': 'success',
+        'profiler': profiler.status(),
+        'flushed_to': str(written) if written else None
+    }
+
+
+@app.get("/admin/coalescing", tags=["Admin"], summary="Request coalescing status")
+async def get_coalescing(http_request: Request):
+    """Recommendation computations started vs requests that joined one already in flight"""
+    _require_admin(http_request)
+    return {'status': 'success', 'coalescing': recommendation_flight.status()}
+
+
+@app.get("/admin/sessions", tags=["Admin"], summary="Server-side session stores")
+async def get_sessions(http_request: Request):
+    """Live sessions and memory used per store"""
+    _require_admin(http_request)
+    return {
+        'status': 'success',
+        'sessions': {'ranked_list': ranked_sessions.status(), 'scoring_state': scoring_sessions.status()}
+    }
+
+
+@app.get("/admin/reload", tags=["Admin"], summary="Catalog snapshot status")
+async def get_reload_status(http_request: Request):
+    """Live catalog version, on-disk version and the outcome of the last reload"""
+    _require_admin(http_request)
+    return {'status': 'success', 'reload': reloader.status()}
+
+
+@app.post("/admin/reload", tags=["Admin"], summary="Reload catalog and embeddings")
+async def reload_catalog(http_request: Request,
+                         http_response: Response,
+                         options: Optional[ReloadRequest] = None):
+    """
+    Rebuild the recommender from the data files and swap it in atomically
+    
+    The new snapshot is built off the event loop and validated (consistent
+    shapes, finite vectors, a canary recommendation) before it goes live.
+    In-flight requests finish on the snapshot they started with; on any
+    failure the current snapshot keeps serving.
+    """
+    _require_admin(http_request)
+    options = options or ReloadRequest()
+    if not options.wait:
+        asyncio.get_running_loop().create_task(reloader.reload(trigger='admin'))
+        http_response.status_code = status.HTTP_202_ACCEPTED
+        return {'status': 'accepted', 'reload': reloader.status()}
+    
+    result = await reloader.reload(trigger='admin')
+    if result['result'] == 'busy':
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A reload is already in progress")
+    if result['result'] == 'failed':
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"New snapshot rejected, still serving {result['version']}: {result['error']}"
+        )
+    return {'status': 'success', 'reload': result}
+
+
 # ==================== Error Handlers ====================
 
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return {
+    detail = getattr(exc, 'detail', None)
+    if detail in (None, "Not Found"):
+        message, detail = "Endpoint not found", f"The endpoint {request.url.path} does not exist"
+    else:
+        message = "Not found"
+    return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={
         "status": "error",
-        "message": "Endpoint not found",
-        "detail": f"The endpoint {request.url.path} does not exist",
+        "message": message,
+        "detail": detail,
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
-    return {
+    return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={
         "status": "error",
         "message": "Internal server error",
         "detail": "An unexpected error occurred",
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 
 # ==================== Run Server ====================
@@ -0,0 +1,241 @@
+"""
+Sampling Request Profiler
+Profiles 1 in N production requests and writes rotating pstats / collapsed-stack files
+"""
+
+import cProfile
+import itertools
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('cprofile', 'stack')
+
+
+class _StackSampler:
+    """
+    Background thread that periodically samples one thread's Python stack
+
+    Much cheaper than cProfile (no per-call hooks); the output is in
+    Brendan Gregg's collapsed format, ready for flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, target_thread_id: int, interval: float, stacks: Counter):
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.stacks = stacks
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='evol-stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+            parts = []
+            while frame is not None:
+                code = frame.f_code
+                parts.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(parts))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class RequestProfiler:
+    """
+    Profiles a sample of requests and aggregates the results on disk
+
+    Disabled by default (``sample_every=0``); the request path then only
+    checks a single integer before skipping profiling entirely.
+    """
+
+    def __init__(self,
+                 output_dir: str = 'profiles',
+                 sample_every: int = 0,
+                 mode: str = 'cprofile',
+                 flush_every: int = 50,
+                 max_files: int = 10,
+                 sample_interval: float = 0.005):
+        """
+        Args:
+            output_dir: Directory for rotated profile files
+            sample_every: Profile 1 in N requests (0 disables profiling)
+            mode: 'cprofile' (deterministic, pstats) or 'stack' (sampling, collapsed stacks)
+            flush_every: Write a new file after this many profiled requests
+            max_files: Number of files of each kind to keep
+            sample_interval: Seconds between stack samples in 'stack' mode
+        """
+        self.output_dir = Path(output_dir)
+        self.flush_every = flush_every
+        self.max_files = max_files
+        self.sample_interval = sample_interval
+        self.sample_every = 0
+        self.mode = 'cprofile'
+
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        # cProfile cannot run two profilers at once; concurrent samples are skipped
+        self._active = threading.Lock()
+        self._stats: Optional[pstats.Stats] = None
+        self._stacks: Counter = Counter()
+        self._pending = 0
+        self.profiled_requests = 0
+        self.skipped_requests = 0
+        self.files_written = []
+
+        self.configure(sample_every=sample_every, mode=mode)
+
+    @classmethod
+    def from_env(cls) -> 'RequestProfiler':
+        """Build a profiler from PROFILE_* environment variables"""
+        return cls(
+            output_dir=os.environ.get('PROFILE_DIR', 'profiles'),
+            sample_every=int(os.environ.get('PROFILE_SAMPLE_EVERY', '0')),
+            mode=os.environ.get('PROFILE_MODE', 'cprofile'),
+            flush_every=int(os.environ.get('PROFILE_FLUSH_EVERY', '50')),
+            max_files=int(os.environ.get('PROFILE_MAX_FILES', '10'))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_every > 0
+
+    def configure(self, sample_every: Optional[int] = None, mode: Optional[str] = None):
+        """
+        Change sampling rate and/or mode at runtime
+
+        Switching mode flushes whatever was collected in the old mode.
+        """
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}', expected one of {PROFILE_MODES}")
+        if sample_every is not None and sample_every < 0:
+            raise ValueError("sample_every must be >= 0")
+
+        if mode is not None and mode != self.mode:
+            self.flush()
+            self.mode = mode
+        if sample_every is not None:
+            self.sample_every = sample_every
+        logger.info(f"Request profiler: sample_every={self.sample_every}, mode={self.mode}")
+
+    def should_profile(self) -> bool:
+        """Decide whether the current request is sampled (1 in N)"""
+        n = self.sample_every
+        return n > 0 and next(self._counter) % n == 0
+
+    @contextmanager
+    def profile(self) -> Iterator[None]:
+        """Profile the enclosed block in the calling thread"""
+        if not self._active.acquire(blocking=False):
+            self.skipped_requests += 1
+            yield
+            return
+
+        try:
+            if self.mode == 'stack':
+                stacks: Counter = Counter()
+                sampler = _StackSampler(threading.get_ident(), self.sample_interval, stacks)
+                sampler.start()
+                try:
+                    yield
+                finally:
+                    sampler.stop()
+                    self._record(stacks=stacks)
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    yield
+                finally:
+                    profiler.disable()
+                    self._record(profiler=profiler)
+        finally:
+            self._active.release()
+
+    def _record(self, profiler: Optional[cProfile.Profile] = None, stacks: Optional[Counter] = None):
+        with self._lock:
+            if profiler is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profiler)
+                else:
+                    self._stats.add(profiler)
+            if stacks is not None:
+                self._stacks.update(stacks)
+            self.profiled_requests += 1
+            self._pending += 1
+            should_flush = self._pending >= self.flush_every
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> Optional[Path]:
+        """Write aggregated profiles to a new file and rotate old ones"""
+        with self._lock:
+            stats, self._stats = self._stats, None
+            stacks, self._stacks = self._stacks, Counter()
+            pending, self._pending = self._pending, 0
+        if not pending:
+            return None
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        path = None
+        if stats is not None:
+            path = self.output_dir / f"requests-{stamp}.pstats"
+            stats.dump_stats(str(path))
+            self._rotate('*.pstats')
+        if stacks:
+            path = self.output_dir / f"requests-{stamp}.collapsed"
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._rotate('*.collapsed')
+        if path is None:
+            return None
+
+        self.files_written.append(str(path))
+        self.files_written = self.files_written[-self.max_files:]
+        logger.info(f"Wrote profile of {pending} requests to {path}")
+        return path
+
+    def _rotate(self, pattern: str):
+        files = sorted(self.output_dir.glob(pattern), key=lambda p: p.stat().st_mtime)
+        for old in files[:-self.max_files]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+    def toggle(self, default_sample_every: int = 100):
+        """Flip profiling on/off (SIGUSR1 runs this on a worker thread, since turning off flushes)"""
+        if self.enabled:
+            self.configure(sample_every=0)
+            self.flush()
+        else:
+            self.configure(sample_every=default_sample_every)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'sample_every': self.sample_every,
+            'mode': self.mode,
+            'output_dir': str(self.output_dir),
+            'profiled_requests': self.profiled_requests,
+            'skipped_requests': self.skipped_requests,
+            'pending_requests': self._pending,
+            'recent_files': list(self.files_written)
+        }
@@ -0,0 +1,326 @@
+"""
+Embedding Projection
+Learned reduction of the sentence embedding space (truncated SVD, optionally whitened) shared by products, celebrities and queries
+"""
+
+import argparse
+import os
+import pickle
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Written next to the full-dimension stores, which stay the source of truth
+PROJECTION_FILE = 'embedding_projection.npz'
+PROJECTED_PRODUCTS_FILE = 'product_embeddings_projected.npy'
+PROJECTED_CELEBRITIES_FILE = 'celebrity_embeddings_projected.npy'
+
+# Rows read at a time when fitting or projecting a memory-mapped store
+BLOCK_ROWS = 16384
+
+
+class EmbeddingProjection:
+    """
+    Linear map from the model's embedding space to its top principal directions
+
+    Fitted on the uncentered second-moment matrix (truncated SVD rather than
+    mean-centered PCA), so it keeps dot products rather than variances. Each
+    projected vector also carries the norm it lost, in a column of its own
+    for stored items and another for queries. The residuals never multiply
+    each other, so query-item dot products are the projected ones while
+    norms stay exact: cosine scores keep their scale and the celebrity
+    threshold its meaning. With whitening every direction is rescaled to
+    unit variance and vectors are re-normalized instead, which spreads the
+    scores and needs thresholds retuned.
+    """
+
+    __slots__ = ('components', 'scales', 'explained_variance', 'model_name')
+
+    def __init__(self,
+                 components: np.ndarray,
+                 scales: Optional[np.ndarray] = None,
+                 explained_variance: float = 1.0,
+                 model_name: Optional[str] = None):
+        """
+        Args:
+            components: (dimension, input_dimension) orthonormal rows
+            scales: (dimension,) whitening factors, or None
+            explained_variance: Share of the second moment the components keep
+            model_name: Model whose embedding space was fitted
+        """
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.scales = None if scales is None else np.asarray(scales, dtype=np.float32)
+        self.explained_variance = float(explained_variance)
+        self.model_name = model_name
+
+    @property
+    def dimension(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def output_dimension(self) -> int:
+        """Stored columns: the components plus the two residual columns unless whitened"""
+        return self.dimension + (0 if self.scales is not None else 2)
+
+    @property
+    def input_dimension(self) -> int:
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls,
+            sources: Iterable[np.ndarray],
+            dimension: int,
+            whiten: bool = False,
+            model_name: Optional[str] = None) -> 'EmbeddingProjection':
+        """
+        Fit on the rows of every source together (memory-mapped arrays are read block by block)
+
+        Raises:
+            ValueError: if the sources are empty or dimension is out of range
+        """
+        moment, rows = None, 0
+        for source in sources:
+            for start in range(0, len(source), BLOCK_ROWS):
+                block = np.asarray(source[start:start + BLOCK_ROWS], dtype=np.float64)
+                moment = block.T @ block if moment is None else moment + block.T @ block
+                rows += len(block)
+        if not rows:
+            raise ValueError("no embeddings to fit a projection on")
+        if not 0 < dimension <= moment.shape[0]:
+            raise ValueError(f"projection dimension must be in 1..{moment.shape[0]}, got {dimension}")
+        eigenvalues, eigenvectors = np.linalg.eigh(moment / rows)
+        order = np.argsort(eigenvalues)[::-1][:dimension]
+        kept = np.clip(eigenvalues[order], 1e-12, None)
+        return cls(
+            components=eigenvectors[:, order].T,
+            scales=1.0 / np.sqrt(kept) if whiten else None,
+            explained_variance=float(kept.sum() / max(eigenvalues.sum(), 1e-12)),
+            model_name=model_name
+        )
+
+    def transform(self, embeddings: np.ndarray, query: bool = False) -> np.ndarray:
+        """
+        Project one vector or an (n, input_dimension) array
+
+        Args:
+            embeddings: Full-dimension embeddings
+            query: Queries put their residual in the other column than stored items
+        """
+        single = np.ndim(embeddings) == 1
+        embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        projected = embeddings @ self.components.T
+        if self.scales is not None:
+            projected *= self.scales
+            norms = np.linalg.norm(projected, axis=1, keepdims=True)
+            projected /= np.where(norms > 0, norms, 1.0)
+            return projected[0] if single else projected
+        vectors = np.zeros((len(embeddings), self.output_dimension), dtype=np.float32)
+        vectors[:, :self.dimension] = projected
+        lost = np.einsum('ij,ij->i', embeddings, embeddings) - np.einsum('ij,ij->i', projected, projected)
+        vectors[:, self.dimension + (0 if query else 1)] = np.sqrt(np.clip(lost, 0.0, None))
+        return vectors[0] if single else vectors
+
+    def save(self, path):
+        tmp_path = Path(str(path) + '.tmp.npz')
+        np.savez(
+            tmp_path,
+            components=self.components,
+            scales=self.scales if self.scales is not None else np.empty(0, dtype=np.float32),
+            explained_variance=np.float64(self.explained_variance),
+            model_name=np.array(self.model_name or '')
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path) -> 'EmbeddingProjection':
+        with np.load(path, allow_pickle=False) as data:
+            scales = data['scales']
+            return cls(
+                components=data['components'],
+                scales=scales if len(scales) else None,
+                explained_variance=float(data['explained_variance']),
+                model_name=str(data['model_name']) or None
+            )
+
+
+# ==================== Projected Stores ====================
+
+def _load_full_stores(data_dir: Path):
+    """(product embeddings memmap, celebrity embeddings) at full dimension"""
+    products = np.load(data_dir / 'product_embeddings.npy', mmap_mode='r')
+    with open(data_dir / 'celebrity_embeddings.pkl', 'rb') as f:
+        celebrities = np.asarray(pickle.load(f), dtype=np.float32)
+    return products, celebrities
+
+
+def write_projected_stores(projection: EmbeddingProjection, data_dir: str = '.') -> Dict:
+    """
+    Project both full-dimension stores and publish them with the projection
+
+    The projection file is written last: the recommender only switches to
+    the projected stores when it exists, so a first deployment is never
+    loaded half-written. A snapshot caught between files of a refit fails
+    its canary and the hot reloader keeps the previous one.
+
+    Returns:
+        Summary dict (products, celebrities, dimension)
+    """
+    data_dir = Path(data_dir)
+    products, celebrities = _load_full_stores(data_dir)
+    if products.shape[1] != projection.input_dimension:
+        raise ValueError(f"embedding store has dimension {products.shape[1]}, "
+                         f"projection expects {projection.input_dimension}; refit the projection")
+
+    product_path = data_dir / PROJECTED_PRODUCTS_FILE
+    tmp_products = product_path.with_name(product_path.name + '.tmp')
+    projected = np.lib.format.open_memmap(tmp_products, mode='w+', dtype=np.float32,
+                                          shape=(len(products), projection.output_dimension))
+    for start in range(0, len(products), BLOCK_ROWS):
+        projected[start:start + BLOCK_ROWS] = projection.transform(products[start:start + BLOCK_ROWS])
+    projected.flush()
+    del projected
+
+    celebrity_path = data_dir / PROJECTED_CELEBRITIES_FILE
+    tmp_celebrities = celebrity_path.with_name(celebrity_path.name + '.tmp')
+    with open(tmp_celebrities, 'wb') as f:
+        np.save(f, projection.transform(celebrities))
+
+    os.replace(tmp_products, product_path)
+    os.replace(tmp_celebrities, celebrity_path)
+    projection.save(data_dir / PROJECTION_FILE)
+    print(f"✓ Saved {projection.dimension}-d projected embeddings to: {product_path}, {celebrity_path}")
+    print(f"✓ Saved projection to: {data_dir / PROJECTION_FILE}")
+    return {'products': len(products), 'celebrities': len(celebrities), 'dimension': projection.dimension}
+
+
+def fit_projection(data_dir: str = '.', dimension: int = 128, whiten: bool = False,
+                   model_name: Optional[str] = None) -> EmbeddingProjection:
+    """Fit on the combined product and celebrity stores and write the projected stores"""
+    products, celebrities = _load_full_stores(Path(data_dir))
+    projection = EmbeddingProjection.fit([products, celebrities], dimension, whiten, model_name)
+    print(f"✓ Fitted {projection.input_dimension} -> {projection.dimension} projection "
+          f"({projection.explained_variance:.1%} of the variance{', whitened' if whiten else ''})")
+    write_projected_stores(projection, data_dir)
+    return projection
+
+
+def refresh_projected_stores(data_dir: str = '.') -> bool:
+    """
+    Re-project regenerated full stores with the existing projection (no refit)
+
+    Returns:
+        False if no projection is deployed in data_dir
+    """
+    path = Path(data_dir) / PROJECTION_FILE
+    if not path.exists():
+        return False
+    write_projected_stores(EmbeddingProjection.load(path), data_dir)
+    return True
+
+
+# ==================== Agreement Report ====================
+
+def agreement_report(recommender, queries: List[Dict], dimensions: List[int], top_n: int = 10,
+                     whiten: bool = False) -> List[Dict]:
+    """
+    Ranking agreement of projected against full-dimension embeddings
+
+    Args:
+        recommender: Full-dimension CelebrityProductRecommender (not modified)
+        queries: Dicts with user_vibe_text, user_occasions, user_budget (see benchmark.generate_queries)
+        dimensions: Projection sizes to try
+        top_n: Recommendations per query
+
+    Returns:
+        One dict per dimension: variance kept, top-n and celebrity agreement, scan time, memory
+    """
+    references = []
+    for query in queries:
+        recommendations, celebrities = recommender.recommend_products(top_n=top_n, **query)
+        references.append(({rec['product']['id'] for rec in recommendations},
+                           {celeb['id'] for celeb in celebrities}))
+    full_ms = _similarity_ms(recommender, queries)
+
+    results = []
+    for dimension in dimensions:
+        projection = EmbeddingProjection.fit(
+            [recommender.product_embeddings, recommender.celebrity_embeddings], dimension, whiten)
+        projected = recommender.with_projection(projection)
+        products_agree, celebrities_agree = [], []
+        for query, (products, celebrities) in zip(queries, references):
+            recommendations, matched = projected.recommend_products(top_n=top_n, **query)
+            products_agree.append(len(products & {rec['product']['id'] for rec in recommendations})
+                                  / max(1, len(products)))
+            celebrities_agree.append(len(celebrities & {celeb['id'] for celeb in matched})
+                                     / max(1, len(celebrities)))
+        results.append({
+            'dimension': dimension,
+            'explained_variance': round(projection.explained_variance, 4),
+            'top_n_agreement': round(float(np.mean(products_agree)), 4),
+            'celebrity_agreement': round(float(np.mean(celebrities_agree)), 4),
+            'similarity_p50_ms': round(_similarity_ms(projected, queries), 3),
+            'full_similarity_p50_ms': round(full_ms, 3),
+            'embedding_mb': round(len(recommender.products) * projection.output_dimension * 4 / (1024 * 1024), 2)
+        })
+    return results
+
+
+def _similarity_ms(recommender, queries: List[Dict]) -> float:
+    timings = []
+    for query in queries:
+        user_embedding = recommender.encode_user_preferences(query['user_vibe_text'])
+        started = time.perf_counter()
+        recommender.product_similarity(user_embedding)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return float(np.percentile(timings, 50))
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Embedding projection tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    fit = sub.add_parser('fit', help="Fit a projection on the stores in --data-dir and write projected stores")
+    fit.add_argument('--dimension', type=int, default=128, help="Projected dimension")
+    fit.add_argument('--whiten', action='store_true', help="Rescale every direction to unit variance")
+    fit.add_argument('--data-dir', default='.', help="Directory with the embedding stores")
+
+    report = sub.add_parser('report', help="Ranking agreement against full dimension")
+    report.add_argument('--dimensions', default='32,64,128,192', help="Comma-separated sizes to compare")
+    report.add_argument('--whiten', action='store_true', help="Whiten the projections")
+    report.add_argument('--queries', type=int, default=50, help="Generated queries to compare")
+    report.add_argument('--top-n', type=int, default=10, help="Recommendations per query")
+    report.add_argument('--stub-encoder', action='store_true', help="Use the offline HashingEncoder")
+    report.add_argument('--seed', type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Embedding Projection")
+    print("=" * 60)
+
+    if args.command == 'fit':
+        fit_projection(args.data_dir, args.dimension, args.whiten, model_name='all-MiniLM-L6-v2')
+        return
+
+    from benchmark import generate_queries
+    from recommender_engine import CelebrityProductRecommender, HashingEncoder
+
+    recommender = CelebrityProductRecommender('.', encoder=HashingEncoder() if args.stub_encoder else None)
+    if recommender.projection is not None:
+        raise SystemExit(f"{PROJECTION_FILE} is deployed here; the report needs the full-dimension stores alone")
+    queries = generate_queries(args.queries, np.random.default_rng(args.seed))
+    dimensions = [int(d) for d in args.dimensions.split(',') if d.strip()]
+    print(f"{len(recommender.products):,} products, {len(queries)} queries, "
+          f"full dimension {recommender.product_embeddings.shape[1]}")
+    for row in agreement_report(recommender, queries, dimensions, args.top_n, args.whiten):
+        print(f"  {row['dimension']:>4}-d: variance {row['explained_variance']:.1%}, "
+              f"top-{args.top_n} agreement {row['top_n_agreement']:.3f}, "
+              f"celebrities {row['celebrity_agreement']:.3f}, "
+              f"similarity {row['similarity_p50_ms']:.3f} ms (full {row['full_similarity_p50_ms']:.3f} ms)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
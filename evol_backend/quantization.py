@@ -0,0 +1,226 @@
+"""
+Embedding Quantization
+Compressed product embeddings (per-row scaled int8 or float16) scored without decompressing the catalog
+"""
+
+import argparse
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+QUANTIZATION_MODES = ('int8', 'float16')
+
+# Rows decoded per block while scoring: under 1 MB of float32 at dim 384, so the
+# decoded block is still in cache when it is multiplied with the query
+BLOCK_ROWS = 512
+
+
+class QuantizedEmbeddings:
+    """
+    Product embeddings stored at 1 (int8) or 2 (float16) bytes per value
+
+    int8 keeps one float32 scale per row (max |value| / 127), so every
+    row uses the full code range whatever its magnitude. Scoring decodes
+    BLOCK_ROWS rows at a time into a reused float32 buffer and multiplies
+    it with the query, so no full-precision copy of the catalog is ever
+    materialized. float16 decodes several times slower than int8 (numpy
+    converts half floats without SIMD), so int8 is the mode for large catalogs.
+    """
+
+    __slots__ = ('mode', 'codes', 'scales', '_local')
+
+    def __init__(self, mode: str, codes: np.ndarray, scales: Optional[np.ndarray] = None):
+        """
+        Args:
+            mode: 'int8' or 'float16'
+            codes: (n, dim) int8 or float16 values
+            scales: (n,) float32 per-row scales (int8 only)
+        """
+        self.mode = mode
+        self.codes = codes
+        self.scales = scales
+        # Decode buffer per worker thread (requests score concurrently)
+        self._local = threading.local()
+
+    @classmethod
+    def quantize(cls, embeddings: np.ndarray, mode: str = 'int8') -> 'QuantizedEmbeddings':
+        """
+        Compress (n, dim) embeddings; reads them once, block by block (works on memory-mapped arrays)
+
+        Raises:
+            ValueError: on an unknown mode
+        """
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"unknown quantization {mode!r}; expected one of {', '.join(QUANTIZATION_MODES)}")
+        n = len(embeddings)
+        codes = np.empty(embeddings.shape, dtype=np.int8 if mode == 'int8' else np.float16)
+        scales = np.empty(n, dtype=np.float32) if mode == 'int8' else None
+        for start in range(0, n, BLOCK_ROWS):
+            block = np.asarray(embeddings[start:start + BLOCK_ROWS], dtype=np.float32)
+            if mode == 'int8':
+                block_scales = np.abs(block).max(axis=1) / 127.0
+                block_scales[block_scales == 0] = 1.0
+                codes[start:start + len(block)] = np.rint(block / block_scales[:, None])
+                scales[start:start + len(block)] = block_scales
+            else:
+                codes[start:start + len(block)] = block
+        return cls(mode, codes, scales)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def decode(self, rows) -> np.ndarray:
+        """Approximate float32 vectors of the given rows"""
+        vectors = self.codes[rows].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows, None]
+        return vectors
+
+    def dot(self, query: np.ndarray) -> np.ndarray:
+        """
+        Approximate dot product of every row with `query`
+
+        Returns:
+            (n,) float64
+        """
+        query = np.asarray(query, dtype=np.float32)
+        n = len(self.codes)
+        out = np.empty(n, dtype=np.float32)
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = np.empty((BLOCK_ROWS,) + self.codes.shape[1:], dtype=np.float32)
+        for start in range(0, n, BLOCK_ROWS):
+            block = self.codes[start:start + BLOCK_ROWS]
+            decoded = buffer[:len(block)]
+            decoded[...] = block
+            np.dot(decoded, query, out=out[start:start + len(block)])
+        if self.scales is not None:
+            out *= self.scales
+        return out.astype(np.float64)
+
+    def with_rows(self, size: int, rows: np.ndarray, embeddings: np.ndarray) -> 'QuantizedEmbeddings':
+        """Copy grown to `size` rows with `rows` replaced by the quantized `embeddings`"""
+        changed = QuantizedEmbeddings.quantize(embeddings, self.mode)
+        codes = np.empty((size,) + self.codes.shape[1:], dtype=self.codes.dtype)
+        codes[:len(self.codes)] = self.codes
+        codes[rows] = changed.codes
+        scales = None
+        if self.scales is not None:
+            scales = np.empty(size, dtype=np.float32)
+            scales[:len(self.scales)] = self.scales
+            scales[rows] = changed.scales
+        return QuantizedEmbeddings(self.mode, codes, scales)
+
+    def take(self, rows: np.ndarray) -> 'QuantizedEmbeddings':
+        """Copy with only `rows`, in that order"""
+        return QuantizedEmbeddings(
+            self.mode,
+            np.ascontiguousarray(self.codes[rows]),
+            self.scales[rows] if self.scales is not None else None
+        )
+
+
+# ==================== Accuracy Report ====================
+
+def accuracy_report(recommender, queries, mode: str, k: int = 20, top_n: int = 10,
+                    rescore_depth: int = 100) -> Dict:
+    """
+    Compare quantized against full-precision ranking on the same catalog
+
+    Args:
+        recommender: Full-precision CelebrityProductRecommender (not modified)
+        queries: Dicts with user_vibe_text, user_occasions, user_budget (see benchmark.generate_queries)
+        mode: Quantization mode
+        k: Depth for similarity recall
+        top_n: Recommendations per query for end-to-end agreement
+        rescore_depth: Exact re-score depth of the quantized run
+
+    Returns:
+        Dict with memory, similarity error, recall@k and recommendation agreement
+    """
+    quantized = recommender.with_quantization(mode, rescore_depth)
+    approximate = recommender.with_quantization(mode, 0)
+    errors, recalls = [], []
+    agreement = {'approximate': [], 'rescored': []}
+    timings = {'exact': [], 'quantized': []}
+    for query in queries:
+        user_embedding = recommender.encode_user_preferences(query['user_vibe_text'])
+        started = time.perf_counter()
+        exact = recommender.product_similarity(user_embedding)
+        timings['exact'].append((time.perf_counter() - started) * 1000.0)
+        started = time.perf_counter()
+        approx = quantized.product_similarity(user_embedding)
+        timings['quantized'].append((time.perf_counter() - started) * 1000.0)
+        errors.append(np.abs(approx - exact).max())
+        depth = min(k, len(exact))
+        truth = np.argpartition(-exact, depth - 1)[:depth]
+        found = np.argpartition(-approx, depth - 1)[:depth]
+        recalls.append(len(np.intersect1d(truth, found)) / depth)
+
+        reference, _ = recommender.recommend_products(top_n=top_n, **query)
+        reference = [rec['product']['id'] for rec in reference]
+        for name, engine in (('approximate', approximate), ('rescored', quantized)):
+            recommendations, _ = engine.recommend_products(top_n=top_n, **query)
+            agreement[name].append(len(set(reference) & {rec['product']['id'] for rec in recommendations})
+                                   / max(1, len(reference)))
+    exact_bytes = len(recommender.products) * recommender.product_embeddings.shape[1] * 4
+    return {
+        'mode': mode,
+        'queries': len(queries),
+        'products': len(recommender.products),
+        'float32_mb': round(exact_bytes / (1024 * 1024), 2),
+        'quantized_mb': round(quantized.quantized_embeddings.nbytes / (1024 * 1024), 2),
+        'max_similarity_error': float(np.max(errors)),
+        f'recall_at_{k}': float(np.mean(recalls)),
+        'top_n_agreement': {name: float(np.mean(values)) for name, values in agreement.items()},
+        'similarity_p50_ms': {name: float(np.percentile(values, 50)) for name, values in timings.items()},
+        'rescore_depth': rescore_depth
+    }
+
+
+def main():
+    """Main execution function"""
+    from benchmark import CatalogProfile, build_recommender, generate_queries
+    from recommender_engine import CelebrityProductRecommender, HashingEncoder
+
+    parser = argparse.ArgumentParser(description="Quantized embedding accuracy report")
+    parser.add_argument('--mode', choices=QUANTIZATION_MODES, default='int8', help="Quantization mode")
+    parser.add_argument('--products', type=int, default=0,
+                        help="Synthetic catalog size (default: the real catalog in this directory)")
+    parser.add_argument('--queries', type=int, default=50, help="Generated queries to compare")
+    parser.add_argument('--k', type=int, default=20, help="Depth for similarity recall")
+    parser.add_argument('--top-n', type=int, default=10, help="Recommendations per query")
+    parser.add_argument('--rescore-depth', type=int, default=100, help="Exact re-score depth (0 = off)")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Embedding Quantization Report")
+    print("=" * 60)
+
+    if args.products:
+        recommender = build_recommender(CatalogProfile.from_files(), args.products, 10, 384, args.seed)
+    else:
+        recommender = CelebrityProductRecommender('.', encoder=HashingEncoder())
+    queries = generate_queries(args.queries, np.random.default_rng(args.seed + 1))
+    report = accuracy_report(recommender, queries, args.mode, args.k, args.top_n, args.rescore_depth)
+
+    print(f"✓ {report['mode']} over {report['products']:,} products, {report['queries']} queries")
+    print(f"  memory: {report['float32_mb']} MB float32 -> {report['quantized_mb']} MB")
+    print(f"  max similarity error: {report['max_similarity_error']:.5f}")
+    print(f"  recall@{args.k}: {report[f'recall_at_{args.k}']:.4f}")
+    print(f"  top-{args.top_n} agreement: approximate {report['top_n_agreement']['approximate']:.4f}, "
+          f"rescored {report['top_n_agreement']['rescored']:.4f} (depth {args.rescore_depth})")
+    print(f"  similarity p50: float32 {report['similarity_p50_ms']['exact']:.2f} ms, "
+          f"{args.mode} {report['similarity_p50_ms']['quantized']:.2f} ms")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
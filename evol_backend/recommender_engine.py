@@ -3,14 +3,26 @@ Celebrity-Based Product Recommendation Engine
 Hybrid approach combining vector similarity with style taxonomy matching
 """
 
+import copy
+import hashlib
+import itertools
 import json
+import logging
 import numpy as np
 import pickle
+import weakref
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 from sklearn.metrics.pairwise import cosine_similarity
 from sentence_transformers import SentenceTransformer
 
+from catalog import CandidatePool, CatalogIndex, iter_catalog, product_style_text, shard_bounds
+from instrumentation import timed_stage, trace_count, trace_annotate
+from lexical import LexicalQuery, matched_terms
+from projection import (
+    EmbeddingProjection, PROJECTED_CELEBRITIES_FILE, PROJECTED_PRODUCTS_FILE, PROJECTION_FILE
+)
+from quantization import QuantizedEmbeddings
 from style_taxonomy import (
     STYLE_TAXONOMY, 
     OCCASION_COMPATIBILITY,
@@ -20,21 +32,259 @@ from style_taxonomy import (
     get_category_preference_score
 )
 
+logger = logging.getLogger(__name__)
+
+
+# Sentence transformer used for celebrities, products and user queries
+DEFAULT_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Blended score split by CelebrityProductRecommender._blend: shared constant, occasion + price
+# pool, similarity and taxonomy weights, lexical weight and the request's lexical column (or None)
+Blend = Tuple[float, CandidatePool, float, float, float, Optional[np.ndarray]]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k largest scores, best first, ties in index order
+    
+    Same result as np.argsort(-scores, kind='stable')[:k] in O(n) plus a sort of k.
+    """
+    n = len(scores)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    kth = np.partition(scores, n - k)[n - k]
+    better = np.flatnonzero(scores > kth)
+    tied = np.flatnonzero(scores == kth)[:k - len(better)]
+    rows = np.concatenate([better, tied])
+    return rows[np.lexsort((rows, -scores[rows]))]
+
+
+class HashingEncoder:
+    """
+    Deterministic offline stand-in for SentenceTransformer
+    
+    Maps each text to a seeded random unit vector, so identical text always
+    gets the same embedding. Used by benchmarks and load tests to exercise the
+    engine without downloading a model; similarities are meaningless.
+    """
+    
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+    
+    def encode(self, sentences, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dimension)
+        if normalize_embeddings:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[0] if single else vectors
+
+
+class Explainer:
+    """
+    Score breakdown and explanation of one ranked product, on demand
+    
+    Shared by every candidate of a ranking and holding only references to
+    the request's columns, so explaining costs nothing until a product is
+    actually returned; the values then come from the cached columns and
+    match the blended score exactly.
+    """
+    
+    __slots__ = ('engine', 'similarity', 'matched_celebrities', 'user_occasions', 'user_budget', 'weights',
+                 'lexical', 'lexical_terms')
+    
+    def __init__(self, engine, similarity: np.ndarray, matched_celebrities: List[Dict],
+                 user_occasions: List[str], user_budget: str, weights: Dict[str, float],
+                 lexical: Optional[np.ndarray] = None, lexical_terms: List[str] = ()):
+        self.engine = engine
+        self.similarity = similarity
+        self.matched_celebrities = matched_celebrities
+        self.user_occasions = user_occasions
+        self.user_budget = user_budget
+        self.weights = weights
+        self.lexical = lexical
+        self.lexical_terms = lexical_terms
+    
+    def explain(self, product: Dict) -> Tuple[Dict[str, float], Dict]:
+        """
+        Returns:
+            (per-component scores, explanation with weighted contributions, the
+             celebrity behind the taxonomy score and the matched tag/occasion pairs)
+        """
+        catalog = self.engine.catalog
+        row = catalog.position[product['id']]
+        matched = self.matched_celebrities
+        
+        # Best celebrity-weighted taxonomy score (first celebrity wins ties)
+        taxonomy, celebrity = max(
+            ((float(catalog.style_taxonomy_scores(celeb)[row]) * celeb['similarity_score'], celeb) for celeb in matched),
+            key=lambda entry: entry[0]
+        )
+        breakdown = {
+            'product_similarity': float(self.similarity[row]),
+            'vibe_similarity': float(max(celeb['similarity_score'] for celeb in matched)),
+            'style_taxonomy': taxonomy,
+            'occasion_match': float(catalog.occasion_base_scores(self.user_occasions, np.array([row]))[0]
+                                    + catalog.occasion_constant(self.user_occasions, matched[0])),
+            'price_compatibility': float(catalog.price_scores_for(self.user_budget)[row]),
+            'lexical_match': float(self.lexical[row]) if self.lexical is not None else 0.0
+        }
+        
+        product_tags = product.get('primary_style_tags', []) + product.get('secondary_style_tags', [])
+        celeb_tags = celebrity.get('primary_vibe_tags', []) + celebrity.get('secondary_vibe_tags', [])
+        tag_pairs = [
+            {'celebrity_tag': celeb_tag, 'product_tag': product_tag, 'affinity': affinity}
+            for celeb_tag in celeb_tags
+            for product_tag in product_tags
+            for affinity in (get_style_affinity_score(celeb_tag, product_tag),)
+            if affinity
+        ]
+        tag_pairs.sort(key=lambda pair: -pair['affinity'])
+        
+        product_occasions = set(product.get('occasions', []))
+        occasion_styles = [
+            {'occasion': occasion, 'style_tag': tag}
+            for occasion in self.user_occasions
+            for tag in product_tags
+            if tag in OCCASION_COMPATIBILITY.get(occasion, {}).get('compatible_styles', ())
+        ]
+        explanation = {
+            'contributions': {key: self.weights[key] * value for key, value in breakdown.items()},
+            'taxonomy_celebrity': {'id': celebrity.get('id'), 'name': celebrity.get('name')},
+            'matched_tags': tag_pairs,
+            'matched_occasions': [occasion for occasion in self.user_occasions if occasion in product_occasions],
+            'occasion_styles': occasion_styles,
+            'matched_terms': matched_terms(product, self.lexical_terms) if self.lexical is not None else [],
+            'budget_tier': self.user_budget
+        }
+        return breakdown, explanation
+
+
+class ScoringState:
+    """
+    One user's intermediate results, kept between requests for re-scoring
+    
+    Immutable once built; the snapshot is held weakly so a session never
+    keeps a replaced catalog alive.
+    """
+    
+    __slots__ = ('engine', 'text_key', 'user_embedding', 'celebrity_threshold',
+                 'matched_celebrities', 'similarity', 'occasions', 'budget')
+    
+    def __init__(self, engine, text_key: str, user_embedding: np.ndarray, celebrity_threshold: float,
+                 matched_celebrities: List[Dict], similarity: Optional[np.ndarray],
+                 occasions: List[str], budget: str):
+        self.engine = weakref.ref(engine)
+        self.text_key = text_key
+        self.user_embedding = user_embedding
+        self.celebrity_threshold = celebrity_threshold
+        self.matched_celebrities = matched_celebrities
+        self.similarity = similarity
+        self.occasions = sorted(occasions)
+        self.budget = budget
+    
+    @property
+    def nbytes(self) -> int:
+        similarity = self.similarity.nbytes if self.similarity is not None else 0
+        return self.user_embedding.nbytes + similarity
+
 
 class CelebrityProductRecommender:
     """
     Advanced recommendation system that matches users to products via celebrity style matching
     """
     
-    def __init__(self, data_dir: str = '.'):
+    # Data snapshot id, set by the hot reloader once the instance goes live
+    version: Optional[str] = None
+    # Last catalog change-log sequence number folded into this snapshot
+    catalog_seq: int = 0
+    # Catalogs with at least this many rows are ranked with the threshold algorithm (None = always scan)
+    threshold_min_rows: Optional[int] = None
+    # ...falling back to a full scan once the walk passes this share of the catalog
+    threshold_max_depth: float = 1 / 128
+    # Otherwise try the best rows of the candidate pool (this share of the catalog) before scanning
+    candidate_pool_share: float = 1 / 32
+    # Learned reduction of the embedding space, applied to queries and new products (see projection.py)
+    projection: Optional[EmbeddingProjection] = None
+    # Compressed copy of product_embeddings the similarity column is scored on (see with_quantization)
+    quantized_embeddings: Optional[QuantizedEmbeddings] = None
+    # ...with the best this-many rows of a ranking re-scored against the exact vectors (0 = off)
+    exact_rescore_depth: int = 0
+    # Named complete blend weights requests can select (see load_weight_profiles)
+    weight_profiles: Dict[str, Dict[str, float]] = {}
+    # Diversity selection: MMR over the best top_n * diversity_pool_factor candidates
+    diversity_pool_factor: int = 3
+    # ...trading relevance (1.0) against novelty (0.0)
+    mmr_lambda: float = 0.7
+    # ...where novelty is embedding similarity to the picks so far, plus this much per pick in the same category
+    mmr_category_penalty: float = 0.1
+    # ...minus this much per primary style tag the picks have not shown yet
+    mmr_style_bonus: float = 0.05
+    
+    def __init__(self, data_dir: str = '.', encoder=None, shard: Optional[Tuple[int, int]] = None):
         """
         Initialize the recommender with pre-computed embeddings
         
         Args:
             data_dir: Directory containing data files
+            encoder: Optional query encoder with a SentenceTransformer-style
+                     `encode` method (defaults to loading all-MiniLM-L6-v2)
+            shard: (index, count) to load only that contiguous slice of the
+                   product catalog (see sharding.py)
         """
         self.data_dir = Path(data_dir)
+        self.shard = shard
+        self._init_weights()
         
+        # Load data
+        logger.info("Initializing Celebrity Product Recommender...")
+        self._load_data(encoder)
+        logger.info("✓ Recommender ready!")
+    
+    @classmethod
+    def from_data(cls,
+                  celebrities: List[Dict],
+                  celebrity_embeddings: np.ndarray,
+                  products: List[Dict],
+                  product_embeddings: np.ndarray,
+                  encoder,
+                  data_dir: str = '.') -> 'CelebrityProductRecommender':
+        """
+        Build a recommender from in-memory data instead of the files in data_dir
+        
+        Args:
+            celebrities: Celebrity dicts (same shape as celebrities_with_vectors.json)
+            celebrity_embeddings: (n_celebrities, dim) normalized embeddings
+            products: Product dicts (same shape as products_with_vectors.json)
+            product_embeddings: (n_products, dim) normalized embeddings
+            encoder: Query encoder (SentenceTransformer or HashingEncoder)
+            data_dir: Directory recorded for reference
+        
+        Returns:
+            CelebrityProductRecommender
+        """
+        recommender = cls.__new__(cls)
+        recommender.data_dir = Path(data_dir)
+        recommender.shard = None
+        recommender._init_weights()
+        recommender.celebrities = celebrities
+        recommender.celebrity_embeddings = celebrity_embeddings
+        recommender.product_embeddings = product_embeddings
+        recommender._build_catalog_index(products)
+        recommender.model = encoder
+        return recommender
+    
+    def _init_weights(self):
+        """Set the default blend weights"""
         # Recommendation weights (tunable for optimization)
         self.weights = {
             'vibe_similarity': 0.30,      # Celebrity vibe → user match
@@ -42,41 +292,306 @@ class CelebrityProductRecommender:
             'style_taxonomy': 0.25,       # Taxonomy-based style matching
             'occasion_match': 0.12,       # Occasion compatibility
             'price_compatibility': 0.05,  # Price tier matching
-            'diversity_bonus': 0.03       # Encourage variety
+            'lexical_match': 0.10         # Free-text attribute terms (BM25)
         }
+    
+    def resolve_weights(self, overrides: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """
+        Default blend weights with `overrides` applied
         
-        # Load data
-        print("Initializing Celebrity Product Recommender...")
-        self._load_data()
-        print("✓ Recommender ready!")
+        Args:
+            overrides: Partial {component: weight}; missing components keep their default
+        
+        Returns:
+            Complete weights dict (self.weights itself when there is nothing to override)
+        
+        Raises:
+            ValueError: on an unknown component or a non-finite weight
+        """
+        if not overrides:
+            return self.weights
+        unknown = sorted(set(overrides) - set(self.weights))
+        if unknown:
+            raise ValueError(f"unknown weight(s) {', '.join(unknown)}; expected {', '.join(self.weights)}")
+        weights = dict(self.weights)
+        for key, value in overrides.items():
+            if not np.isfinite(value):
+                raise ValueError(f"weight {key} must be finite, got {value!r}")
+            weights[key] = float(value)
+        return weights
+    
+    def lexical_weights(self, weights: Dict[str, float]) -> Dict[str, float]:
+        """
+        Weights for a request with free-text terms: the other components are
+        scaled down so that, with lexical_match added, they keep their total
+        
+        A free-text request's match_score is then on the same scale as any
+        other request's. Weights are returned unchanged when lexical_match is
+        not positive or not smaller than that total.
+        """
+        w_lexical = weights['lexical_match']
+        total = sum(value for key, value in weights.items() if key != 'lexical_match')
+        if not 0 < w_lexical < total:
+            return weights
+        scale = (total - w_lexical) / total
+        return {key: value if key == 'lexical_match' else value * scale for key, value in weights.items()}
+    
+    def load_weight_profiles(self, path) -> int:
+        """
+        Load named weight overrides from a JSON file: {"name": {"component": weight}}
+        
+        A missing file means no profiles. Profiles are resolved (and
+        validated) here, so a bad file fails the snapshot, not a request.
+        
+        Returns:
+            Number of profiles loaded
+        
+        Raises:
+            ValueError: if the file is not an object of objects or a profile is invalid
+        """
+        path = Path(path)
+        if not path.exists():
+            self.weight_profiles = {}
+            return 0
+        with open(path, 'r', encoding='utf-8') as f:
+            profiles = json.load(f)
+        if not isinstance(profiles, dict):
+            raise ValueError(f"{path}: expected an object of weight profiles")
+        resolved = {}
+        for name, overrides in profiles.items():
+            if not isinstance(overrides, dict):
+                raise ValueError(f"{path}: profile {name!r} must be an object of weights")
+            try:
+                resolved[name] = self.resolve_weights(overrides)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{path}: profile {name!r}: {e}") from e
+        self.weight_profiles = resolved
+        logger.info("✓ Loaded %d weight profiles from %s", len(resolved), path)
+        return len(resolved)
     
-    def _load_data(self):
+    def _load_data(self, encoder=None):
         """Load all necessary data files"""
+        self._load_projection()
+        self._load_celebrities()
+        self._load_products()
+        self._load_encoder(encoder)
+    
+    def _load_celebrities(self):
         # Load celebrities with vectors
         celeb_path = self.data_dir / 'celebrities_with_vectors.json'
         with open(celeb_path, 'r', encoding='utf-8') as f:
             self.celebrities = json.load(f)
-        print(f"✓ Loaded {len(self.celebrities)} celebrities")
+        logger.info("✓ Loaded %d celebrities", len(self.celebrities))
         
         # Load celebrity embeddings
-        celeb_emb_path = self.data_dir / 'celebrity_embeddings.pkl'
-        with open(celeb_emb_path, 'rb') as f:
-            self.celebrity_embeddings = pickle.load(f)
+        if self.projection is not None:
+            self.celebrity_embeddings = np.load(self.data_dir / PROJECTED_CELEBRITIES_FILE)
+        else:
+            celeb_emb_path = self.data_dir / 'celebrity_embeddings.pkl'
+            with open(celeb_emb_path, 'rb') as f:
+                self.celebrity_embeddings = pickle.load(f)
+    
+    def _load_projection(self):
+        # A deployed projection switches every store to its projected copy
+        path = self.data_dir / PROJECTION_FILE
+        self.projection = EmbeddingProjection.load(path) if path.exists() else None
+        if self.projection is not None:
+            logger.info("✓ Using %d-d projected embeddings (%.1f%% of the variance)",
+                        self.projection.dimension, 100 * self.projection.explained_variance)
+    
+    def _load_products(self):
+        # Load product embeddings (memory-mapped .npy from the embedding pipeline,
+        # falling back to the legacy pickle)
+        prod_emb_path = self.data_dir / 'product_embeddings.npy'
+        if self.projection is not None:
+            embeddings = np.load(self.data_dir / PROJECTED_PRODUCTS_FILE, mmap_mode='r')
+        elif prod_emb_path.exists():
+            embeddings = np.load(prod_emb_path, mmap_mode='r')
+        else:
+            with open(self.data_dir / 'product_embeddings.pkl', 'rb') as f:
+                embeddings = pickle.load(f)
+        
+        # Stream products into the columnar index (inline vectors are dropped;
+        # rows line up with the embeddings store)
+        products = iter_catalog(self.data_dir / 'products_with_vectors.json')
+        if self.shard is not None:
+            # Only this shard's rows are kept in memory
+            start, stop = shard_bounds(len(embeddings), *self.shard)
+            embeddings = np.ascontiguousarray(embeddings[start:stop])
+            products = itertools.islice(products, start, stop)
+        self.product_embeddings = embeddings
+        self._build_catalog_index(products)
+        if self.shard is not None:
+            logger.info("✓ Loaded %d products (shard %d of %d)", len(self.products), self.shard[0], self.shard[1])
+        else:
+            logger.info("✓ Loaded %d products", len(self.products))
+    
+    def _load_encoder(self, encoder=None):
+        # Load sentence transformer for user query encoding
+        if encoder is not None:
+            self.model = encoder
+            logger.info("✓ Using provided query encoder (%s)", type(encoder).__name__)
+        else:
+            self.model = SentenceTransformer(DEFAULT_MODEL_NAME)
+            logger.info("✓ Loaded sentence transformer model")
+    
+    def _build_catalog_index(self, products):
+        """Index products for vectorized scoring; rows must match self.product_embeddings"""
+        self.catalog = CatalogIndex.from_products(products)
+        self.products = self.catalog.products
+        if len(self.products) != len(self.product_embeddings):
+            raise ValueError(
+                f"{len(self.products)} products but {len(self.product_embeddings)} product embeddings; "
+                "regenerate the vectors"
+            )
+        self.product_embedding_norms = self._embedding_norms(self.product_embeddings)
+    
+    @staticmethod
+    def _embedding_norms(embeddings: np.ndarray) -> np.ndarray:
+        norms = np.sqrt(np.einsum('ij,ij->i', embeddings, embeddings, dtype=np.float64))
+        norms[norms == 0] = 1.0
+        return norms
+    
+    def embed_products(self, products: List[Dict]) -> np.ndarray:
+        """Embed products with the offline generation template (for live catalog changes)"""
+        embeddings = self.model.encode(
+            [product_style_text(product) for product in products],
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(products), -1)
+        return self.projection.transform(embeddings) if self.projection is not None else embeddings
+    
+    def with_product_changes(self,
+                             upserts: List[Dict],
+                             deletes: List = (),
+                             embeddings: Optional[np.ndarray] = None) -> 'CelebrityProductRecommender':
+        """
+        Copy-on-write catalog update
         
-        # Load products with vectors
-        prod_path = self.data_dir / 'products_with_vectors.json'
-        with open(prod_path, 'r', encoding='utf-8') as f:
-            self.products = json.load(f)
-        print(f"✓ Loaded {len(self.products)} products")
+        The returned recommender shares the encoder, celebrities and every
+        unchanged structure with this one; this instance is left untouched so
+        requests already running on it are unaffected.
         
-        # Load product embeddings
-        prod_emb_path = self.data_dir / 'product_embeddings.pkl'
-        with open(prod_emb_path, 'rb') as f:
-            self.product_embeddings = pickle.load(f)
+        Args:
+            upserts: Validated products to add or replace (matched by id)
+            deletes: Ids of products to remove
+            embeddings: (len(upserts), dim) vectors; computed with embed_products if omitted
         
-        # Load sentence transformer for user query encoding
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        print("✓ Loaded sentence transformer model")
+        Returns:
+            New CelebrityProductRecommender
+        """
+        if embeddings is None:
+            embeddings = self.embed_products(upserts) if upserts else np.empty(
+                (0, self.product_embeddings.shape[1]), dtype=np.float32)
+        if embeddings.shape[1:] != self.product_embeddings.shape[1:]:
+            raise ValueError(
+                f"embedding dimension {embeddings.shape[1:]} does not match the catalog "
+                f"{self.product_embeddings.shape[1:]}"
+            )
+        catalog, rows = self.catalog.with_changes(upserts, deletes)
+        size = len(catalog)
+        
+        recommender = copy.copy(self)
+        recommender.catalog = catalog
+        recommender.products = catalog.products
+        recommender.product_embeddings = np.empty(
+            (size,) + self.product_embeddings.shape[1:], dtype=np.float32)
+        recommender.product_embeddings[:len(self.product_embeddings)] = self.product_embeddings
+        recommender.product_embeddings[rows] = embeddings
+        recommender.product_embedding_norms = np.empty(size, dtype=np.float64)
+        recommender.product_embedding_norms[:len(self.product_embedding_norms)] = self.product_embedding_norms
+        recommender.product_embedding_norms[rows] = self._embedding_norms(embeddings)
+        if self.quantized_embeddings is not None:
+            recommender.quantized_embeddings = self.quantized_embeddings.with_rows(size, rows, embeddings)
+        recommender.version = None
+        return recommender
+    
+    def compacted(self) -> 'CelebrityProductRecommender':
+        """Copy without the rows of deleted products"""
+        catalog, kept = self.catalog.compact()
+        recommender = copy.copy(self)
+        recommender.catalog = catalog
+        recommender.products = catalog.products
+        recommender.product_embeddings = np.ascontiguousarray(self.product_embeddings[kept])
+        recommender.product_embedding_norms = self.product_embedding_norms[kept]
+        if self.quantized_embeddings is not None:
+            recommender.quantized_embeddings = self.quantized_embeddings.take(kept)
+        return recommender
+    
+    def with_quantization(self, mode: Optional[str], rescore_depth: int = 100) -> 'CelebrityProductRecommender':
+        """
+        Copy that scores product similarity on int8 or float16 embeddings
+        
+        The exact vectors stay referenced for the re-score of the top rows
+        and for diversity; with the memory-mapped product_embeddings.npy they
+        are only paged in for those rows, so the resident scan data shrinks
+        to the compressed copy (about 4x for int8, 2x for float16).
+        
+        Args:
+            mode: 'int8', 'float16', or None for full precision
+            rescore_depth: Re-score this many of the best rows of each ranking
+                           with the exact vectors (0 = rank on the approximation alone)
+        
+        Returns:
+            New CelebrityProductRecommender
+        
+        Raises:
+            ValueError: on an unknown mode
+        """
+        recommender = copy.copy(self)
+        recommender.quantized_embeddings = None if mode is None else QuantizedEmbeddings.quantize(
+            self.product_embeddings, mode)
+        recommender.exact_rescore_depth = rescore_depth if mode is not None else 0
+        if mode is not None:
+            logger.info("✓ Quantized product embeddings to %s: %.1f MB (float32 %.1f MB)", mode,
+                        recommender.quantized_embeddings.nbytes / (1024 * 1024),
+                        len(self.product_embeddings) * self.product_embeddings.shape[1] * 4 / (1024 * 1024))
+        return recommender
+    
+    def with_projection(self, projection: EmbeddingProjection) -> 'CelebrityProductRecommender':
+        """
+        Copy with every embedding projected in memory (for comparing sizes before deploying one)
+        
+        Returns:
+            New CelebrityProductRecommender
+        """
+        recommender = copy.copy(self)
+        recommender.projection = projection
+        recommender.celebrity_embeddings = projection.transform(self.celebrity_embeddings)
+        recommender.product_embeddings = projection.transform(self.product_embeddings)
+        recommender.product_embedding_norms = self._embedding_norms(recommender.product_embeddings)
+        if self.quantized_embeddings is not None:
+            recommender.quantized_embeddings = QuantizedEmbeddings.quantize(
+                recommender.product_embeddings, self.quantized_embeddings.mode)
+        return recommender
+    
+    def warm_candidate_pools(self, occasion_sets: Optional[List[List[str]]] = None) -> int:
+        """
+        Build candidate pools for every budget tier before traffic arrives
+        
+        Args:
+            occasion_sets: Occasion lists to build (default: each known occasion on its own)
+        
+        Returns:
+            Number of pools built
+        """
+        if occasion_sets is None:
+            occasion_sets = [[occasion] for occasion in OCCASION_COMPATIBILITY]
+        size = int(self.candidate_pool_share * len(self.catalog)) + 1
+        # Free-text requests blend with the scaled lexical_weights, which key their own pools
+        weight_pairs = {(weights['occasion_match'], weights['price_compatibility'])
+                        for weights in (self.weights, self.lexical_weights(self.weights))}
+        built = 0
+        for tier in PRICE_TIERS:
+            for occasions in occasion_sets:
+                for occasion_weight, price_weight in weight_pairs:
+                    # Warm-up builds are not lookups, so they stay out of the hit rate
+                    self.catalog.candidate_pool(
+                        tier, occasions, occasion_weight, price_weight, record=False
+                    ).top(size)
+                    built += 1
+        return built
     
     def encode_user_preferences(self, user_text: str) -> np.ndarray:
         """
@@ -86,14 +601,14 @@ class CelebrityProductRecommender:
             user_text: Combined user responses and preferences
         
         Returns:
-            np.ndarray: Normalized embedding vector
+            np.ndarray: Normalized embedding vector (projected when a projection is deployed)
         """
         embedding = self.model.encode(
             user_text, 
             convert_to_numpy=True,
             normalize_embeddings=True
         )
-        return embedding
+        return self.projection.transform(embedding, query=True) if self.projection is not None else embedding
     
     def find_matching_celebrities(self, 
                                  user_embedding: np.ndarray,
@@ -274,43 +789,638 @@ class CelebrityProductRecommender:
             else:
                 return max(0.3, 0.7 - (price - max_price) / max_price)
     
-    def calculate_diversity_score(self, 
-                                  recommended_products: List[Dict],
-                                  candidate: Dict) -> float:
+    def product_similarity(self, user_embedding: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
         """
-        Encourage diversity in recommendations
+        Cosine similarity of every product to the user (the one user-dependent column)
         
         Args:
-            recommended_products: Already recommended products
-            candidate: Candidate product to score
+            rows: Compute only these rows (hard filters); the column keeps its
+                  full length, with 0 at every other row
+        """
+        user_norm = float(np.linalg.norm(user_embedding)) or 1.0
+        if rows is not None:
+            if self.quantized_embeddings is not None:
+                vectors = self.quantized_embeddings.decode(rows)
+            else:
+                vectors = np.asarray(self.product_embeddings[rows], dtype=np.float32)
+            similarity = np.zeros(len(self.catalog))
+            similarity[rows] = (vectors @ user_embedding.astype(np.float32)) / (
+                self.product_embedding_norms[rows] * user_norm)
+            return similarity
+        if self.quantized_embeddings is not None:
+            similarity = self.quantized_embeddings.dot(user_embedding)
+        else:
+            similarity = (self.product_embeddings @ user_embedding.astype(np.float32)).astype(np.float64)
+        similarity /= self.product_embedding_norms * user_norm
+        return similarity
+    
+    def facet_counts(self, filters: Optional[Dict] = None) -> Dict[str, Dict[str, int]]:
+        """Products per category, price band, style tag and occasion among those passing `filters`"""
+        return self.catalog.facet_counts(self.catalog.filter_rows(filters))
+    
+    def lexical_query(self, text: Optional[str]) -> Optional[LexicalQuery]:
+        """
+        Analyze free text for lexical matching against the catalog's postings
         
         Returns:
-            float: Diversity bonus multiplier (0.8 to 1.3)
+            LexicalQuery, or None when the text has no terms to match
         """
-        if not recommended_products:
-            return 1.0
+        return self.catalog.lexical.query(text)
+    
+    def top_candidates(self,
+                       user_embedding: np.ndarray,
+                       matched_celebrities: List[Dict],
+                       user_occasions: List[str],
+                       user_budget: str,
+                       k: int,
+                       explain: bool = False,
+                       product_similarity: Optional[np.ndarray] = None,
+                       weights: Optional[Dict[str, float]] = None,
+                       lexical_query: Optional[LexicalQuery] = None,
+                       filters: Optional[Dict] = None) -> List[Dict]:
+        """
+        Best k products of this catalog by blended score, best first
         
-        # Category diversity
-        existing_categories = [p['category'] for p in recommended_products]
-        if candidate['category'] not in existing_categories:
-            diversity_score = 1.2
-        else:
-            # Penalize if category over-represented
-            category_count = existing_categories.count(candidate['category'])
-            diversity_score = max(0.8, 1.0 - (category_count * 0.1))
+        This is the part of a request that depends on the products, so it is
+        also what each shard runs for a scatter-gather coordinator.
+        
+        Args:
+            product_similarity: Precomputed product_similarity(user_embedding)
+            weights: Blend weights for this request (see resolve_weights; default self.weights),
+                     scaled by lexical_weights when lexical_query matches any catalog term
+            lexical_query: Free-text terms to match (see lexical_query)
+            filters: Hard filters (see CatalogIndex.filter_rows); products
+                     failing them are not scored at all
+        
+        Returns:
+            Candidate dicts with product and score; with explain, each also
+            carries an explainer that explain() turns into scores_breakdown
+            and explanation for the candidates actually returned
+        """
+        allowed = None
+        if filters:
+            with timed_stage('filtering'):
+                allowed = self.catalog.filter_rows(filters)
+        logger.debug("Scoring %d products...", self.catalog.live_count if allowed is None else len(allowed))
+        with timed_stage('product_scoring'):
+            similarity = (product_similarity if product_similarity is not None
+                          else self.product_similarity(user_embedding, rows=allowed))
+            weights = self.weights if weights is None else weights
+            lexical = self.catalog.lexical.scores(lexical_query) if lexical_query is not None else None
+            if lexical is not None:
+                weights = self.lexical_weights(weights)
+            blend = self._blend(matched_celebrities, user_occasions, user_budget, weights, lexical)
+            # On quantized embeddings, rank deeper and let the exact re-score settle the top k
+            rescore = self.quantized_embeddings is not None and self.exact_rescore_depth > 0
+            requested, k = k, max(k, self.exact_rescore_depth) if rescore else k
+            if allowed is not None:
+                result = self._filtered_top_k(similarity, matched_celebrities, blend, k, allowed)
+            # The early exits bound unseen products from above, which needs non-negative weights
+            elif (weights['product_similarity'] < 0 or weights['style_taxonomy'] < 0
+                    or (lexical is not None and weights['lexical_match'] < 0)):
+                result = None
+            elif self.threshold_min_rows is not None and len(self.catalog) >= self.threshold_min_rows:
+                result = self._threshold_top_k(similarity, matched_celebrities, blend, k)
+            else:
+                result = self._pool_top_k(similarity, matched_celebrities, blend, k)
+            if result is None:
+                result = self._scan_top_k(similarity, matched_celebrities, blend, k)
+            rows, scores, scored = result
+            if rescore:
+                rows, scores = self._rescore_exact(user_embedding, similarity, rows, scores,
+                                                   weights['product_similarity'], requested)
+        trace_count('products_scored', scored)
+        if lexical is not None:
+            trace_annotate('lexical_terms', lexical_query.terms)
+            trace_count('lexical_matches', int(np.count_nonzero(lexical)))
+        
+        candidates = [
+            {'product': self.products[row], 'score': score, 'scores_breakdown': None}
+            for row, score in zip(rows.tolist(), scores.tolist())
+        ]
+        if explain:
+            # Only references the request's columns; nothing is computed until explain()
+            explainer = Explainer(self, similarity, matched_celebrities, user_occasions, user_budget, weights,
+                                  lexical, lexical_query.terms if lexical_query is not None else ())
+            for candidate in candidates:
+                candidate['explainer'] = explainer
+        return candidates
+    
+    def _rescore_exact(self,
+                       user_embedding: np.ndarray,
+                       similarity: np.ndarray,
+                       rows: np.ndarray,
+                       scores: np.ndarray,
+                       w_similarity: float,
+                       k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Replace the approximate similarity of `rows` with the exact one and re-rank them
+        
+        Only the similarity term depends on the embeddings, so each score is
+        corrected by w_similarity times the difference. The exact values are
+        also written into `similarity`, so explanations and a session's
+        cached column agree with the returned scores; the caller must own
+        that array (rerank_products copies a cached session column first).
+        
+        Returns:
+            (rows, scores) of the best k, best first
+        """
+        user_norm = float(np.linalg.norm(user_embedding)) or 1.0
+        exact = (np.asarray(self.product_embeddings[rows], dtype=np.float32)
+                 @ user_embedding.astype(np.float32)).astype(np.float64)
+        exact /= self.product_embedding_norms[rows] * user_norm
+        scores = scores + w_similarity * (exact - similarity[rows])
+        similarity[rows] = exact
+        best = np.lexsort((rows, -scores))[:k]
+        trace_count('exact_rescored', len(rows))
+        return rows[best], scores[best]
+    
+    def explain(self, candidates: List[Dict]) -> List[Dict]:
+        """
+        Fill in scores_breakdown and explanation for candidates ranked with explain=True
+        
+        Args:
+            candidates: Candidates to explain (updated in place); others are left as they are
+        """
+        for candidate in candidates:
+            explainer = candidate.pop('explainer', None)
+            if explainer is not None:
+                candidate['scores_breakdown'], candidate['explanation'] = explainer.explain(candidate['product'])
+        return candidates
+    
+    def _blend(self,
+               matched_celebrities: List[Dict],
+               user_occasions: List[str],
+               user_budget: str,
+               weights: Dict[str, float],
+               lexical: Optional[np.ndarray] = None) -> Blend:
+        """
+        Split the blended score into what is shared by every product, the
+        cached occasion + price pool for this budget tier, occasion set and
+        weights, and the weights of the per-product terms
+        
+        score = constant + pool.column + w_similarity * similarity + w_taxonomy * taxonomy
+                (+ w_lexical * lexical when the request has free-text terms)
+        """
+        pool = self.catalog.candidate_pool(
+            user_budget, user_occasions, weights['occasion_match'], weights['price_compatibility']
+        )
+        constant = (
+            weights['vibe_similarity'] * float(max(c['similarity_score'] for c in matched_celebrities))
+            + weights['occasion_match'] * self.catalog.occasion_constant(user_occasions, matched_celebrities[0])
+        )
+        return (constant, pool, weights['product_similarity'], weights['style_taxonomy'],
+                weights['lexical_match'], lexical)
+    
+    def _blend_scores(self,
+                      similarity: np.ndarray,
+                      matched_celebrities: List[Dict],
+                      blend: Blend,
+                      rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Blended scores of `rows` (default: every row), identical whichever path asks"""
+        constant, pool, w_similarity, w_taxonomy, w_lexical, lexical = blend
+        select = (lambda column: column) if rows is None else (lambda column: column[rows])
+        taxonomy = np.max([
+            select(self.catalog.style_taxonomy_scores(celeb)) * celeb['similarity_score']
+            for celeb in matched_celebrities
+        ], axis=0)
+        scores = (constant + select(pool.column)
+                  + w_similarity * select(similarity)
+                  + w_taxonomy * taxonomy)
+        if lexical is not None:
+            scores += w_lexical * select(lexical)
+        return scores
+    
+    def _scan_top_k(self,
+                    similarity: np.ndarray,
+                    matched_celebrities: List[Dict],
+                    blend: Blend,
+                    k: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Exact top-k by scoring every product
+        
+        Returns:
+            (rows best first, their scores, products scored)
+        """
+        scores = self._blend_scores(similarity, matched_celebrities, blend)
+        if self.catalog.tombstones:
+            scores = np.where(self.catalog.alive, scores, -np.inf)
+        
+        # Ties keep catalog order
+        rows = top_k_rows(scores, k)
+        if self.catalog.tombstones:
+            rows = rows[self.catalog.alive[rows]]
+        return rows, scores[rows], self.catalog.live_count
+    
+    def _filtered_top_k(self,
+                        similarity: np.ndarray,
+                        matched_celebrities: List[Dict],
+                        blend: Blend,
+                        k: int,
+                        rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Exact top-k among the rows passing hard filters (in catalog order); no other row is scored
+        
+        Returns:
+            (rows best first, their scores, products scored)
+        """
+        scores = self._blend_scores(similarity, matched_celebrities, blend, rows)
+        # Ties keep catalog order
+        best = top_k_rows(scores, k)
+        return rows[best], scores[best], len(rows)
+    
+    def _pool_top_k(self,
+                    similarity: np.ndarray,
+                    matched_celebrities: List[Dict],
+                    blend: Blend,
+                    k: int) -> Optional[Tuple[np.ndarray, np.ndarray, int]]:
+        """
+        Exact top-k from the candidate pool's best rows, when provable
         
-        # Style diversity
-        existing_styles = set()
-        for p in recommended_products:
-            existing_styles.update(p.get('primary_style_tags', []))
+        The pool is ranked by the occasion + price part alone. A product
+        outside it can score at most the pool's cutoff plus the best
+        similarity, taxonomy and lexical terms in the catalog; if the k-th
+        pooled score beats that, the outside products cannot matter.
         
-        candidate_styles = set(candidate.get('primary_style_tags', []))
-        unique_styles = candidate_styles - existing_styles
+        Returns:
+            (rows best first, their scores, products scored), or None to scan
+        """
+        n = len(self.catalog)
+        size = max(8 * k, int(self.candidate_pool_share * n))
+        if k <= 0 or 2 * size >= n:
+            return None
+        constant, pool, w_similarity, w_taxonomy, w_lexical, lexical = blend
+        ranked = pool.top(size + 1)
+        rows = ranked[:size]
+        if self.catalog.tombstones:
+            rows = rows[self.catalog.alive[rows]]
+        if len(rows) < k:
+            return None
+        
+        scores = self._blend_scores(similarity, matched_celebrities, blend, rows)
+        best = np.lexsort((rows, -scores))[:k]
+        # Taxonomy columns lie in [0, 1], so a celebrity with a negative weight adds at most 0
+        bound = (constant + pool.column[ranked[size]]
+                 + w_similarity * similarity.max()
+                 + w_taxonomy * max(
+                     max(celeb['similarity_score'], 0.0) * self.catalog.style_taxonomy_scores(celeb).max()
+                     for celeb in matched_celebrities))
+        if lexical is not None:
+            bound += w_lexical * lexical.max()
+        trace_annotate('candidate_pool', size)
+        if scores[best[-1]] <= bound + 1e-9:
+            return None
+        return rows[best], scores[best], len(rows)
+    
+    def _threshold_top_k(self,
+                         similarity: np.ndarray,
+                         matched_celebrities: List[Dict],
+                         blend: Blend,
+                         k: int) -> Optional[Tuple[np.ndarray, np.ndarray, int]]:
+        """
+        Exact top-k by Fagin's threshold algorithm
         
-        # Bonus for introducing new styles
-        style_bonus = len(unique_styles) * 0.05
+        Walks best-first lists in lock-step: the candidate pool (occasion +
+        price), the taxonomy column of each matched celebrity, the similarity
+        column and, for free text, the products with lexical matches. Each
+        newly reached product is scored exactly.
+        The walk stops once the k-th best score beats the best score any
+        product not yet reached could have. The walk depth doubles per round
+        so every step stays vectorized.
         
-        return min(1.3, diversity_score + style_bonus)
+        Returns:
+            (rows best first, their scores, products scored), or None when the
+            lists do not separate the top k within threshold_max_depth of the
+            catalog and a full scan is cheaper
+        """
+        catalog = self.catalog
+        n = len(catalog)
+        constant, pool, w_similarity, w_taxonomy, w_lexical, lexical = blend
+        taxonomy = []
+        for celeb in matched_celebrities:
+            key = ('taxonomy', tuple(celeb.get('primary_vibe_tags', []) + celeb.get('secondary_vibe_tags', [])))
+            taxonomy.append((catalog.column(key), catalog.ranking(key), celeb['similarity_score']))
+        
+        # Sorted access stops at `limit`; past it a full scan is cheaper
+        limit = min(n, max(256, 4 * k, int(self.threshold_max_depth * n)))
+        nearest = np.argpartition(-similarity, limit - 1)[:limit] if limit < n else np.arange(n)
+        nearest = nearest[np.argsort(-similarity[nearest], kind='stable')]
+        pooled = pool.top(limit)
+        # Only products with a lexical match have a non-zero lexical term
+        matching = np.empty(0, dtype=np.int64)
+        if lexical is not None:
+            matching = np.flatnonzero(lexical)
+            matching = matching[np.argsort(-lexical[matching], kind='stable')]
+        
+        seen = ~catalog.alive
+        slot = np.empty(n, dtype=np.int64)
+        found_rows, found_scores = [], []
+        found = 0
+        walked, depth = 0, min(limit, max(256, 4 * k))
+        while True:
+            reached = np.concatenate(
+                [nearest[walked:depth], pooled[walked:depth], matching[walked:depth]]
+                + [order[walked:depth] for _, order, _ in taxonomy])
+            reached = reached[~seen[reached]]
+            # Drop rows reached through several lists (last write per row wins)
+            positions = np.arange(len(reached))
+            slot[reached] = positions
+            new = reached[slot[reached] == positions]
+            seen[new] = True
+            walked = depth
+            if len(new):
+                found_rows.append(new)
+                found_scores.append(self._blend_scores(similarity, matched_celebrities, blend, new))
+                found += len(new)
+            if depth >= n:
+                break
+            
+            # Best possible score of a product below `depth` in every list
+            threshold = (constant + pool.column[pooled[depth - 1]]
+                         + w_similarity * similarity[nearest[depth - 1]])
+            # Taxonomy columns lie in [0, 1], so a celebrity with a negative weight adds at most 0
+            threshold += w_taxonomy * max(
+                weight * column[order[depth - 1]] if weight > 0 else 0.0 for column, order, weight in taxonomy)
+            if depth <= len(matching):
+                threshold += w_lexical * lexical[matching[depth - 1]]
+            if found >= k > 0:
+                scores = np.concatenate(found_scores)
+                if np.partition(scores, found - k)[found - k] > threshold + 1e-9:
+                    break
+            if depth >= limit:
+                trace_annotate('threshold_depth', n)
+                return None
+            depth = min(limit, depth * 2)
+        trace_annotate('threshold_depth', depth)
+        
+        rows = np.concatenate(found_rows) if found_rows else np.empty(0, dtype=np.int64)
+        scores = np.concatenate(found_scores) if found_scores else np.empty(0)
+        # Ties keep catalog order, as in the full scan
+        best = np.lexsort((rows, -scores))[:k]
+        return rows[best], scores[best], found
+    
+    def candidate_embeddings(self, candidates: List[Dict]) -> np.ndarray:
+        """(len(candidates), dim) embeddings of ranked candidates, looked up by catalog row"""
+        rows = np.fromiter((self.catalog.position[c['product']['id']] for c in candidates),
+                           dtype=np.int64, count=len(candidates))
+        return self.product_embeddings[rows]
+    
+    def select_diverse(self, candidates: List[Dict], top_n: int, mmr_lambda: Optional[float] = None) -> List[Dict]:
+        """
+        Maximal Marginal Relevance selection of top_n from score-ordered candidates
+        
+        Each step picks the candidate maximizing
+        mmr_lambda * relevance - (1 - mmr_lambda) * novelty penalty, where
+        relevance is the blended score rescaled to [0, 1] over the candidates
+        and the penalty is the highest (non-negative) embedding similarity to a pick so far,
+        plus mmr_category_penalty per pick already in the candidate's
+        category, minus mmr_style_bonus per primary style tag not shown yet.
+        The max similarity and the MMR value are running per-candidate arrays,
+        so a step costs one (candidates, dim) product instead of rescanning
+        the picks.
+        mmr_lambda=1 returns the score order.
+        
+        Args:
+            candidates: Output of top_candidates (best first); picks are updated in place
+            top_n: Number of recommendations
+            mmr_lambda: Relevance/novelty trade-off in [0, 1] (default self.mmr_lambda)
+        
+        Returns:
+            Picks in selection order, each with final_score (its blended score) and mmr_score
+        """
+        mmr_lambda = self.mmr_lambda if mmr_lambda is None else mmr_lambda
+        count = len(candidates)
+        if not count:
+            return []
+        
+        scores = np.fromiter((c['score'] for c in candidates), dtype=np.float64, count=count)
+        spread = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / spread if spread > 0 else np.ones(count)
+        
+        vectors = self.candidate_embeddings(candidates).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        vectors /= np.where(norms > 0, norms, 1.0)[:, None]
+        
+        category_codes: Dict[str, int] = {}
+        categories = np.fromiter(
+            (category_codes.setdefault(c['product'].get('category'), len(category_codes)) for c in candidates),
+            dtype=np.int64, count=count)
+        style_codes: Dict[str, int] = {}
+        tagged = [{style_codes.setdefault(tag, len(style_codes)) for tag in c['product'].get('primary_style_tags', [])}
+                  for c in candidates]
+        styles = np.zeros((count, len(style_codes)))
+        for i, codes in enumerate(tagged):
+            styles[i, list(codes)] = 1.0
+        
+        # Running state: max similarity to the picks, and the MMR value itself, which
+        # only ever drops as picks add similarity, category repeats and shown styles
+        novelty_weight = 1.0 - mmr_lambda
+        max_similarity = np.zeros(count)
+        mmr = mmr_lambda * relevance + novelty_weight * self.mmr_style_bonus * styles.sum(axis=1)
+        shown_styles = set()
+        
+        picks = []
+        for _ in range(min(top_n, count)):
+            best = int(mmr.argmax())  # ties go to the better-scored candidate
+            candidate = candidates[best]
+            candidate['final_score'] = candidate['score']
+            candidate['mmr_score'] = float(mmr[best])
+            picks.append(candidate)
+            
+            increase = vectors @ vectors[best]
+            np.subtract(increase, max_similarity, out=increase)
+            np.maximum(increase, 0.0, out=increase)
+            max_similarity += increase
+            increase[categories == categories[best]] += self.mmr_category_penalty
+            new_styles = tagged[best] - shown_styles
+            if new_styles:
+                shown_styles |= new_styles
+                increase += self.mmr_style_bonus * styles[:, list(new_styles)].sum(axis=1)
+            mmr -= novelty_weight * increase
+            mmr[best] = -np.inf
+        return picks
+    
+    def rank_products(self,
+                      user_vibe_text: str,
+                      user_occasions: List[str] = None,
+                      user_budget: str = 'moderate',
+                      depth: int = 20,
+                      celebrity_threshold: float = 0.5,
+                      explain: bool = False,
+                      weights: Optional[Dict[str, float]] = None,
+                      lexical_text: Optional[str] = None,
+                      filters: Optional[Dict] = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Encode the user, match celebrities and rank the catalog (no diversity pass)
+        
+        Any prefix of the ranking is exactly what a smaller `depth` returns.
+        
+        Args:
+            user_vibe_text: User's combined preference text
+            user_occasions: List of occasions
+            user_budget: Budget tier
+            depth: Number of candidates to return
+            celebrity_threshold: Minimum celebrity similarity
+            explain: Include explanation scores
+            weights: Blend weights (see resolve_weights; default self.weights)
+            lexical_text: Free text matched term by term against product text
+            filters: Hard filters (see CatalogIndex.filter_rows)
+        
+        Returns:
+            (candidates best first, matched celebrities)
+        """
+        # Step 1: Encode user preferences
+        logger.debug("Encoding user preferences...")
+        with timed_stage('encoding'):
+            user_embedding = self.encode_user_preferences(user_vibe_text)
+        trace_annotate('encoder_batch_size', 1)
+        
+        # Step 2: Find matching celebrities
+        logger.debug("Finding matching celebrities...")
+        with timed_stage('celebrity_matching'):
+            matched_celebrities = self.find_matching_celebrities(
+                user_embedding, 
+                top_k=3, 
+                threshold=celebrity_threshold
+            )
+        trace_count('celebrities_matched', len(matched_celebrities))
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Matched celebrities: %s", ", ".join(
+                f"{celeb['name']} ({celeb['similarity_score']:.3f})" for celeb in matched_celebrities
+            ))
+        
+        lexical_query = None
+        if lexical_text:
+            with timed_stage('lexical_analysis'):
+                lexical_query = self.lexical_query(lexical_text)
+        
+        # Step 3: Score all products
+        candidates = self.top_candidates(
+            user_embedding, matched_celebrities, user_occasions or [], user_budget,
+            k=depth, explain=explain, weights=weights, lexical_query=lexical_query, filters=filters
+        )
+        return candidates, matched_celebrities
+    
+    def rerank_products(self,
+                        state: Optional['ScoringState'],
+                        text_key: str,
+                        user_vibe_text: str,
+                        user_occasions: List[str] = None,
+                        user_budget: str = 'moderate',
+                        depth: int = 20,
+                        celebrity_threshold: float = 0.5,
+                        explain: bool = False,
+                        weights: Optional[Dict[str, float]] = None,
+                        lexical_text: Optional[str] = None,
+                        filters: Optional[Dict] = None) -> Tuple[List[Dict], List[Dict], 'ScoringState', List[str]]:
+        """
+        rank_products for a returning user, recomputing only what changed since `state`
+        
+        The user is re-encoded only when `text_key` changes. Celebrities are
+        re-matched when the embedding or the threshold changes, and product
+        similarity when the embedding does. Budget and occasion terms always
+        come from the catalog's candidate pools, lexical matches from postings
+        lookups, and re-weighting recomputes nothing. A state from another
+        snapshot only keeps its embedding.
+        
+        Args:
+            state: ScoringState returned by this user's previous call (None for the first)
+            text_key: Fingerprint of the answers the embedding should follow
+            user_vibe_text: Text to encode when text_key changed
+            user_occasions: List of occasions
+            user_budget: Budget tier
+            depth: Number of candidates to return
+            celebrity_threshold: Minimum celebrity similarity
+            explain: Include explanation scores
+            weights: Blend weights (see resolve_weights; default self.weights)
+            lexical_text: Free text matched term by term against product text
+            filters: Hard filters (see CatalogIndex.filter_rows)
+        
+        Returns:
+            (candidates best first, matched celebrities, new state, recomputed parts)
+        """
+        user_occasions = user_occasions or []
+        recomputed = []
+        same_text = state is not None and state.text_key == text_key
+        # Everything but the embedding is only valid for the snapshot it was computed on
+        kept_snapshot = state is not None and state.engine() is self
+        same_snapshot = same_text and kept_snapshot
+        
+        if same_text:
+            user_embedding = state.user_embedding
+        else:
+            with timed_stage('encoding'):
+                user_embedding = self.encode_user_preferences(user_vibe_text)
+            recomputed.append('user_embedding')
+        
+        if same_snapshot and state.celebrity_threshold == celebrity_threshold:
+            matched_celebrities = state.matched_celebrities
+        else:
+            with timed_stage('celebrity_matching'):
+                matched_celebrities = self.find_matching_celebrities(
+                    user_embedding,
+                    top_k=3,
+                    threshold=celebrity_threshold
+                )
+            recomputed.append('celebrity_matching')
+        trace_count('celebrities_matched', len(matched_celebrities))
+        
+        if same_snapshot and state.similarity is not None:
+            similarity = state.similarity
+            if self.quantized_embeddings is not None and self.exact_rescore_depth > 0:
+                # The exact re-score writes into the column, and the cached one may be
+                # in use by other requests on this session; the new state keeps the copy
+                similarity = similarity.copy()
+        elif filters:
+            # Only the filtered rows get a similarity, so none is kept for the next call
+            similarity = None
+            recomputed.append('product_similarity')
+        else:
+            with timed_stage('product_similarity'):
+                similarity = self.product_similarity(user_embedding)
+            recomputed.append('product_similarity')
+        
+        if not kept_snapshot or state.occasions != sorted(user_occasions):
+            recomputed.append('occasion_match')
+        if not kept_snapshot or state.budget != user_budget:
+            recomputed.append('price_compatibility')
+        
+        lexical_query = None
+        if lexical_text:
+            with timed_stage('lexical_analysis'):
+                lexical_query = self.lexical_query(lexical_text)
+        
+        candidates = self.top_candidates(
+            user_embedding, matched_celebrities, user_occasions, user_budget,
+            k=depth, explain=explain, product_similarity=similarity, weights=weights,
+            lexical_query=lexical_query, filters=filters
+        )
+        state = ScoringState(self, text_key, user_embedding, celebrity_threshold,
+                             matched_celebrities, similarity, user_occasions, user_budget)
+        trace_annotate('recomputed', recomputed)
+        return candidates, matched_celebrities, state, recomputed
+    
+    def diversity_pool(self, top_n: int, pool_size: Optional[int] = None) -> int:
+        """Candidates diversity selection chooses top_n from (ranking depth needed for diversify)"""
+        return max(top_n, pool_size if pool_size is not None else top_n * self.diversity_pool_factor)
+    
+    def diversify(self,
+                  candidates: List[Dict],
+                  top_n: int,
+                  pool_size: Optional[int] = None,
+                  mmr_lambda: Optional[float] = None) -> List[Dict]:
+        """Diversity selection over the best diversity_pool() candidates (timed and traced)"""
+        candidates = candidates[:self.diversity_pool(top_n, pool_size)]
+        logger.debug("Applying diversity selection...")
+        with timed_stage('diversity_selection'):
+            final_recommendations = self.select_diverse(candidates, top_n, mmr_lambda)
+        if final_recommendations and 'explainer' in final_recommendations[0]:
+            with timed_stage('explanations'):
+                self.explain(final_recommendations)
+        trace_count('diversity_pool', len(candidates))
+        trace_count('returned', len(final_recommendations))
+        return final_recommendations
     
     def recommend_products(self,
                           user_vibe_text: str,
@@ -318,7 +1428,12 @@ class CelebrityProductRecommender:
                           user_budget: str = 'moderate',
                           top_n: int = 10,
                           celebrity_threshold: float = 0.5,
-                          explain: bool = False) -> List[Dict]:
+                          explain: bool = False,
+                          weights: Optional[Dict[str, float]] = None,
+                          pool_size: Optional[int] = None,
+                          mmr_lambda: Optional[float] = None,
+                          lexical_text: Optional[str] = None,
+                          filters: Optional[Dict] = None) -> List[Dict]:
         """
         Main recommendation function
         
@@ -329,107 +1444,27 @@ class CelebrityProductRecommender:
             top_n: Number of recommendations
             celebrity_threshold: Minimum celebrity similarity
             explain: Include explanation scores
+            weights: Blend weights (see resolve_weights; default self.weights)
+            pool_size: Candidates to diversify over (default top_n * diversity_pool_factor)
+            mmr_lambda: Relevance/novelty trade-off (default self.mmr_lambda)
+            lexical_text: Free text matched term by term against product text
+            filters: Hard filters (see CatalogIndex.filter_rows)
         
         Returns:
             List of recommended products with scores
         """
-        print("\n" + "="*60)
-        print("Generating Recommendations")
-        print("="*60)
-        
-        # Step 1: Encode user preferences
-        print("Encoding user preferences...")
-        user_embedding = self.encode_user_preferences(user_vibe_text)
-        
-        # Step 2: Find matching celebrities
-        print("Finding matching celebrities...")
-        matched_celebrities = self.find_matching_celebrities(
-            user_embedding, 
-            top_k=3, 
-            threshold=celebrity_threshold
+        logger.debug("Generating recommendations")
+        
+        # Keep extra candidates for diversity selection
+        pool_size = self.diversity_pool(top_n, pool_size)
+        candidates, matched_celebrities = self.rank_products(
+            user_vibe_text, user_occasions, user_budget,
+            depth=pool_size, celebrity_threshold=celebrity_threshold, explain=explain, weights=weights,
+            lexical_text=lexical_text, filters=filters
         )
+        final_recommendations = self.diversify(candidates, top_n, pool_size, mmr_lambda)
         
-        print(f"\nMatched Celebrities:")
-        for celeb in matched_celebrities:
-            print(f"  - {celeb['name']} (similarity: {celeb['similarity_score']:.3f})")
-        
-        # Step 3: Score all products
-        print(f"\nScoring {len(self.products)} products...")
-        product_scores = []
-        
-        for prod_idx, product in enumerate(self.products):
-            scores_dict = {}
-            
-            # 1. Product-to-user vibe similarity
-            product_user_sim = cosine_similarity(
-                user_embedding.reshape(1, -1),
-                self.product_embeddings[prod_idx].reshape(1, -1)
-            )[0][0]
-            scores_dict['product_similarity'] = float(product_user_sim)
-            
-            # 2. Celebrity vibe matching
-            celeb_vibe_scores = []
-            for celeb in matched_celebrities:
-                celeb_score = celeb['similarity_score']
-                celeb_vibe_scores.append(celeb_score)
-            scores_dict['vibe_similarity'] = float(np.max(celeb_vibe_scores))
-            
-            # 3. Style taxonomy matching (best celebrity match)
-            taxonomy_scores = []
-            for celeb in matched_celebrities:
-                tax_score = self.calculate_style_taxonomy_score(celeb, product)
-                weighted_tax = tax_score * celeb['similarity_score']
-                taxonomy_scores.append(weighted_tax)
-            scores_dict['style_taxonomy'] = float(np.max(taxonomy_scores))
-            
-            # 4. Occasion compatibility
-            best_celeb = matched_celebrities[0]
-            scores_dict['occasion_match'] = self.calculate_occasion_score(
-                user_occasions or [], product, best_celeb
-            )
-            
-            # 5. Price compatibility
-            scores_dict['price_compatibility'] = self.calculate_price_score(
-                user_budget, product
-            )
-            
-            # Calculate weighted final score
-            final_score = sum(
-                scores_dict[key] * self.weights[key]
-                for key in scores_dict.keys()
-            )
-            
-            product_scores.append({
-                'product': product,
-                'score': final_score,
-                'scores_breakdown': scores_dict if explain else None
-            })
-        
-        # Step 4: Sort and apply diversity
-        print("Applying diversity bonus...")
-        product_scores.sort(key=lambda x: x['score'], reverse=True)
-        
-        # Select diverse recommendations
-        recommendations = []
-        for candidate in product_scores:
-            diversity_bonus = self.calculate_diversity_score(
-                [r['product'] for r in recommendations],
-                candidate['product']
-            )
-            
-            candidate['diversity_bonus'] = diversity_bonus
-            candidate['final_score'] = candidate['score'] * diversity_bonus
-            recommendations.append(candidate)
-            
-            if len(recommendations) >= top_n * 2:  # Get extra for final sorting
-                break
-        
-        # Final sort and trim
-        recommendations.sort(key=lambda x: x['final_score'], reverse=True)
-        final_recommendations = recommendations[:top_n]
-        
-        print(f"\n✓ Generated {len(final_recommendations)} recommendations")
-        print("="*60)
+        logger.debug("Generated %d recommendations", len(final_recommendations))
         
         return final_recommendations, matched_celebrities
     
@@ -512,4 +1547,5 @@ def test_recommender():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     test_recommender()
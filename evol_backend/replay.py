@@ -0,0 +1,303 @@
+"""
+Traffic Replay
+Replays captured requests against an in-process recommender or a local server, and diffs two runs
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Keep the engine quiet while replaying (must be set before main is imported)
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from traffic_capture import read_capture  # noqa: E402
+
+RECOMMENDATIONS_ENDPOINT = '/api/v1/recommendations'
+MATCH_ENDPOINT = '/api/v1/celebrities/match'
+
+
+def _schedule(records: List[Dict], speed: float) -> List[float]:
+    """Replay offsets in seconds (speed 2.0 = twice as fast, 0 = as fast as possible)"""
+    if not records or speed <= 0:
+        return [0.0] * len(records)
+    start = records[0].get('ts', 0.0)
+    return [(r.get('ts', start) - start) / speed for r in records]
+
+
+def _result(seq: int, record: Dict, status: int, latency_ms: float,
+            product_ids: List[Any], celebrity_ids: List[Any], error: Optional[str] = None) -> Dict:
+    return {
+        'seq': seq,
+        'endpoint': record['endpoint'],
+        'status': status,
+        'latency_ms': round(latency_ms, 3),
+        'product_ids': product_ids,
+        'celebrity_ids': celebrity_ids,
+        'error': error
+    }
+
+
+# ==================== In-Process Target ====================
+
+def replay_in_process(records: List[Dict], speed: float, stub_encoder: bool) -> List[Dict]:
+    """Feed captured requests straight into CelebrityProductRecommender"""
+    from main import (
+        WEIGHT_PROFILES_PATH, RecommendationRequest, SurveyResponse, generate_user_vibe_text,
+        ranking_arguments, request_weights
+    )
+    from recommender_engine import CelebrityProductRecommender, HashingEncoder
+
+    recommender = CelebrityProductRecommender('.', encoder=HashingEncoder() if stub_encoder else None)
+    # Same named profiles as the server, so captured weight_profile requests resolve identically
+    recommender.load_weight_profiles(WEIGHT_PROFILES_PATH)
+    offsets = _schedule(records, speed)
+    results = []
+    start = time.perf_counter()
+    for seq, (record, offset) in enumerate(zip(records, offsets)):
+        delay = offset - (time.perf_counter() - start)
+        if delay > 0:
+            time.sleep(delay)
+
+        request_start = time.perf_counter()
+        try:
+            if record['endpoint'] == MATCH_ENDPOINT:
+                survey = SurveyResponse(**record['request'])
+                embedding = recommender.encode_user_preferences(generate_user_vibe_text(survey))
+                celebrities = recommender.find_matching_celebrities(
+                    embedding, top_k=record.get('params', {}).get('top_k', 3), threshold=0.3
+                )
+                product_ids = []
+            else:
+                request = RecommendationRequest(**record['request'])
+                recommendations, celebrities = recommender.recommend_products(
+                    top_n=request.top_n,
+                    weights=request_weights(recommender, request),
+                    pool_size=request.diversity_pool,
+                    mmr_lambda=request.diversity_lambda,
+                    **ranking_arguments(request)
+                )
+                product_ids = [rec['product']['id'] for rec in recommendations]
+            latency_ms = (time.perf_counter() - request_start) * 1000.0
+            results.append(_result(seq, record, 200, latency_ms, product_ids, [c['id'] for c in celebrities]))
+        except ValueError as e:
+            # Invalid request or weights: the server answers these with 422
+            latency_ms = (time.perf_counter() - request_start) * 1000.0
+            results.append(_result(seq, record, 422, latency_ms, [], [], f"{type(e).__name__}: {e}"))
+        except Exception as e:
+            latency_ms = (time.perf_counter() - request_start) * 1000.0
+            results.append(_result(seq, record, 500, latency_ms, [], [], f"{type(e).__name__}: {e}"))
+    return results
+
+
+# ==================== HTTP Target ====================
+
+async def _replay_http(records: List[Dict], speed: float, url: str) -> List[Dict]:
+    from load_test import ConnectionPool
+
+    parts = urlsplit(url)
+    pool = ConnectionPool(parts.hostname or '127.0.0.1', parts.port or 80)
+    offsets = _schedule(records, speed)
+    results: List[Optional[Dict]] = [None] * len(records)
+
+    async def issue(seq: int, record: Dict):
+        path = record['endpoint']
+        if path == MATCH_ENDPOINT:
+            path = f"{path}?top_k={record.get('params', {}).get('top_k', 3)}"
+        body = json.dumps(record['request']).encode('utf-8')
+        request_start = time.perf_counter()
+        try:
+            status, payload = await pool.request('POST', path, body)
+            latency_ms = (time.perf_counter() - request_start) * 1000.0
+            data = json.loads(payload) if status == 200 else {}
+            results[seq] = _result(
+                seq, record, status, latency_ms,
+                [p['id'] for p in data.get('all_recommendations', [])],
+                [c['id'] for c in data.get('matched_celebrities', [])],
+                None if status == 200 else payload[:200].decode('utf-8', 'replace')
+            )
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            latency_ms = (time.perf_counter() - request_start) * 1000.0
+            results[seq] = _result(seq, record, 0, latency_ms, [], [], f"{type(e).__name__}: {e}")
+
+    tasks = []
+    start = time.perf_counter()
+    try:
+        for seq, (record, offset) in enumerate(zip(records, offsets)):
+            delay = offset - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if speed <= 0:
+                # As fast as possible, but one at a time so latencies stay comparable
+                await issue(seq, record)
+            else:
+                tasks.append(asyncio.create_task(issue(seq, record)))
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        await pool.close()
+    return results
+
+
+def replay_http(records: List[Dict], speed: float, url: str) -> List[Dict]:
+    """Send captured requests to a running server, preserving (scaled) inter-arrival times"""
+    return asyncio.run(_replay_http(records, speed, url))
+
+
+# ==================== Diff ====================
+
+def load_results(path: str) -> List[Dict]:
+    """Load a replay result file, or a raw capture file (seq = capture order)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    if rows and 'seq' not in rows[0]:
+        rows.sort(key=lambda r: r.get('ts', 0.0))
+        for seq, row in enumerate(rows):
+            row['seq'] = seq
+    return rows
+
+
+def _latency_summary(rows: List[Dict]) -> Dict[str, float]:
+    values = [r['latency_ms'] for r in rows if r.get('status') == 200]
+    if not values:
+        return {'p50': 0.0, 'p99': 0.0, 'mean': 0.0}
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p99': float(np.percentile(values, 99)),
+        'mean': float(np.mean(values))
+    }
+
+
+def diff_runs(baseline: List[Dict], candidate: List[Dict], worst: int = 10) -> Dict:
+    """
+    Compare rankings and latencies of two runs over the same capture
+
+    Returns:
+        Dict with ranking agreement, latency summaries per endpoint and the
+        requests whose product lists diverge the most
+    """
+    by_seq = {r['seq']: r for r in candidate}
+    identical = 0
+    overlaps = []
+    celebrity_agreement = []
+    divergent = []
+    compared = 0
+    status_changes = 0
+
+    for base in baseline:
+        other = by_seq.get(base['seq'])
+        if other is None:
+            continue
+        if base.get('status') != other.get('status'):
+            status_changes += 1
+            continue
+        compared += 1
+        celebrity_agreement.append(base.get('celebrity_ids') == other.get('celebrity_ids'))
+        a, b = base.get('product_ids', []), other.get('product_ids', [])
+        if not a and not b:
+            continue
+        if a == b:
+            identical += 1
+        overlap = len(set(a) & set(b)) / max(len(a), len(b))
+        overlaps.append(overlap)
+        if a != b:
+            divergent.append({'seq': base['seq'], 'overlap': round(overlap, 3), 'baseline': a, 'candidate': b})
+
+    divergent.sort(key=lambda d: d['overlap'])
+    endpoints = sorted({r['endpoint'] for r in baseline} | {r['endpoint'] for r in candidate})
+    latency = {}
+    for endpoint in endpoints:
+        base_summary = _latency_summary([r for r in baseline if r['endpoint'] == endpoint])
+        cand_summary = _latency_summary([r for r in candidate if r['endpoint'] == endpoint])
+        latency[endpoint] = {'baseline': base_summary, 'candidate': cand_summary}
+
+    return {
+        'compared': compared,
+        'status_changes': status_changes,
+        'identical_rankings': identical,
+        'identical_ranking_rate': identical / len(overlaps) if overlaps else 1.0,
+        'mean_topk_overlap': float(np.mean(overlaps)) if overlaps else 1.0,
+        'celebrity_agreement_rate': float(np.mean(celebrity_agreement)) if celebrity_agreement else 1.0,
+        'latency_ms': latency,
+        'most_divergent': divergent[:worst]
+    }
+
+
+def print_diff(diff: Dict):
+    print("\n" + "=" * 60)
+    print("Replay Diff")
+    print("=" * 60)
+    print(f"Requests compared: {diff['compared']} (status changed: {diff['status_changes']})")
+    print(f"Identical rankings: {diff['identical_rankings']} ({diff['identical_ranking_rate']:.1%})")
+    print(f"Mean top-k overlap: {diff['mean_topk_overlap']:.3f}")
+    print(f"Celebrity match agreement: {diff['celebrity_agreement_rate']:.1%}")
+    print("\nLatency (ms):")
+    for endpoint, summary in diff['latency_ms'].items():
+        base, cand = summary['baseline'], summary['candidate']
+        change = (cand['p50'] - base['p50']) / base['p50'] if base['p50'] else 0.0
+        print(f"  {endpoint}")
+        print(f"    p50 {base['p50']:.2f} → {cand['p50']:.2f} ({change:+.1%}), "
+              f"p99 {base['p99']:.2f} → {cand['p99']:.2f}")
+    if diff['most_divergent']:
+        print("\nMost divergent requests:")
+        for item in diff['most_divergent']:
+            print(f"  seq {item['seq']}: overlap {item['overlap']:.2f}")
+            print(f"    baseline:  {item['baseline']}")
+            print(f"    candidate: {item['candidate']}")
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare builds")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help="Replay a capture")
+    run_parser.add_argument('captures', nargs='+', help="capture.jsonl files (rotated files allowed)")
+    run_parser.add_argument('--target', default='inprocess',
+                            help="'inprocess' or a server URL such as http://127.0.0.1:8000")
+    run_parser.add_argument('--speed', type=float, default=1.0,
+                            help="Replay speed multiplier (1 = original timing, 0 = back-to-back)")
+    run_parser.add_argument('--stub-encoder', action='store_true',
+                            help="In-process only: use the offline HashingEncoder")
+    run_parser.add_argument('--limit', type=int, default=None, help="Replay only the first N records")
+    run_parser.add_argument('--output', required=True, help="Result JSONL path")
+
+    diff_parser = sub.add_parser('diff', help="Compare two replay results (or a capture and a replay)")
+    diff_parser.add_argument('baseline', help="Baseline result JSONL (or the capture itself)")
+    diff_parser.add_argument('candidate', help="Candidate result JSONL")
+    diff_parser.add_argument('--worst', type=int, default=10, help="How many divergent requests to list")
+    diff_parser.add_argument('--output', default=None, help="Write the diff as JSON")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        records = read_capture(args.captures)
+        if args.limit:
+            records = records[:args.limit]
+        print(f"Replaying {len(records)} captured requests against {args.target} (speed {args.speed:g})...")
+        if args.target == 'inprocess':
+            results = replay_in_process(records, args.speed, args.stub_encoder)
+        else:
+            results = replay_http(records, args.speed, args.target)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for row in results:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        errors = sum(1 for r in results if r['status'] != 200)
+        summary = _latency_summary(results)
+        print(f"✓ {len(results)} requests, {errors} errors, p50 {summary['p50']:.2f} ms, p99 {summary['p99']:.2f} ms")
+        print(f"✓ Saved results to: {args.output}")
+    else:
+        diff = diff_runs(load_results(args.baseline), load_results(args.candidate), args.worst)
+        print_diff(diff)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(diff, f, indent=2)
+            print(f"\n✓ Saved diff to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Recommendation Sessions
+Server-side per-user state (ranked lists for paging) with TTL and memory-bounded LRU eviction
+"""
+
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from instrumentation import SESSION_EVICTIONS, record_cache_lookup
+
+# Bookkeeping charged per session on top of its arrays (dict entry, object headers)
+SESSION_OVERHEAD_BYTES = 512
+
+
+class SessionStore:
+    """
+    Token -> session object, expired after `ttl` seconds without use
+
+    Sessions report their size through an `nbytes` attribute; once the
+    total passes `max_bytes` the least recently used ones are evicted.
+    Thread-safe: pages are served from the event loop while sessions are
+    created in worker threads.
+    """
+
+    def __init__(self, name: str, ttl: float = 1800.0, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            name: Label for the cache and eviction metrics
+            ttl: Idle seconds before a session expires
+            max_bytes: Memory budget across all sessions
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._sessions: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name: str) -> 'SessionStore':
+        """SESSION_TTL (seconds, default 1800) and SESSION_MAX_MB (default 64)"""
+        return cls(
+            name,
+            ttl=float(os.environ.get('SESSION_TTL', '1800')),
+            max_bytes=int(float(os.environ.get('SESSION_MAX_MB', '64')) * 1024 * 1024)
+        )
+
+    @staticmethod
+    def _size(session) -> int:
+        return int(session.nbytes) + SESSION_OVERHEAD_BYTES
+
+    def _drop(self, token: str, reason: str):
+        _, session = self._sessions.pop(token)
+        self.nbytes -= self._size(session)
+        SESSION_EVICTIONS.inc(store=self.name, reason=reason)
+
+    def _expire(self, now: float):
+        # Least recently used first, so expired sessions sit at the front
+        while self._sessions:
+            token, (last_used, _) = next(iter(self._sessions.items()))
+            if now - last_used < self.ttl:
+                break
+            self._drop(token, 'expired')
+
+    def put(self, session, token: Optional[str] = None) -> str:
+        """
+        Store (or replace) a session
+
+        Returns:
+            Session token
+        """
+        token = token or secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            if token in self._sessions:
+                self._drop(token, 'replaced')
+            self._sessions[token] = (now, session)
+            self.nbytes += self._size(session)
+            self._expire(now)
+            while self.nbytes > self.max_bytes and len(self._sessions) > 1:
+                self._drop(next(iter(self._sessions)), 'memory')
+        return token
+
+    def get(self, token: str):
+        """Session for `token` (refreshing its TTL), or None if unknown or expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(token)
+            if entry is not None:
+                self._sessions[token] = (now, entry[1])
+                self._sessions.move_to_end(token)
+        record_cache_lookup(self.name, entry is not None)
+        return entry[1] if entry is not None else None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                'sessions': len(self._sessions),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl
+            }
+
+
+# ==================== Ranked List Paging ====================
+
+class RankedList:
+    """
+    One user's full ranking, kept compactly for paging
+
+    Product ids and blended scores are parallel arrays in rank order, and
+    `seen` marks the positions the diversity-selected first page already
+    showed. Pages are then plain slices of the unseen positions, so they
+    are stable and a cursor can be replayed.
+    """
+
+    __slots__ = ('ids', 'scores', 'seen', 'matched_celebrities', 'params', 'catalog_version')
+
+    def __init__(self,
+                 candidates: List[Dict],
+                 shown: List[Dict],
+                 matched_celebrities: List[Dict],
+                 params: Dict[str, Any],
+                 catalog_version: Optional[str] = None):
+        """
+        Args:
+            candidates: Ranked candidates, best first (see rank_products)
+            shown: Recommendations already returned on the first page
+            matched_celebrities: Celebrities the ranking was built for
+            params: Request parameters echoed back with every page
+            catalog_version: Snapshot the ranking was computed on
+        """
+        ids = [candidate['product']['id'] for candidate in candidates]
+        self.ids = np.asarray(ids, dtype=np.int64 if all(isinstance(i, int) for i in ids) else object)
+        self.scores = np.asarray([candidate['score'] for candidate in candidates], dtype=np.float32)
+        shown_ids = {rec['product']['id'] for rec in shown}
+        self.seen = np.fromiter((i in shown_ids for i in ids), dtype=bool, count=len(ids))
+        self.matched_celebrities = [
+            {key: celeb.get(key) for key in ('id', 'name', 'similarity_score')} for celeb in matched_celebrities
+        ]
+        self.params = params
+        self.catalog_version = catalog_version
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.scores.nbytes + self.seen.nbytes
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def page(self, offset: int, limit: int) -> Tuple[np.ndarray, int]:
+        """
+        Next `limit` unseen positions at or after `offset`
+
+        Returns:
+            (positions, next offset) — next offset is len(self) when the list is exhausted
+        """
+        unseen = np.flatnonzero(~self.seen[offset:]) + offset
+        positions = unseen[:limit]
+        next_offset = int(positions[-1]) + 1 if len(positions) == limit else len(self)
+        return positions, next_offset
+
+    def remaining(self, offset: int) -> int:
+        """Unseen positions at or after `offset`"""
+        return int(np.count_nonzero(~self.seen[offset:]))
+
+
+def make_cursor(token: str, offset: int) -> str:
+    return f"{token}.{offset}"
+
+
+def parse_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    token, _, offset = cursor.rpartition('.')
+    if not token or not offset.isdigit():
+        raise ValueError(f"malformed cursor: {cursor!r}")
+    return token, int(offset)
@@ -0,0 +1,411 @@
+"""
+Catalog Sharding
+Scatter-gather recommendations over product shards served by separate processes or nodes
+"""
+
+import argparse
+import heapq
+import http.client
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from catalog import merge_facet_counts
+from instrumentation import timed_stage, trace_count
+from lexical import LexicalQuery, merge_term_stats, query_terms
+from recommender_engine import CelebrityProductRecommender, HashingEncoder, DEFAULT_MODEL_NAME, SentenceTransformer
+
+logger = logging.getLogger(__name__)
+
+SHARD_PATH = '/internal/shard/candidates'
+TERM_STATS_PATH = '/internal/shard/term-stats'
+FACETS_PATH = '/internal/shard/facets'
+
+# Celebrity fields shards need to score (taxonomy, occasion vibes)
+_CELEBRITY_FIELDS = ('id', 'name', 'similarity_score', 'primary_vibe_tags', 'secondary_vibe_tags')
+
+
+class ShardError(RuntimeError):
+    """A shard could not be reached or returned an error"""
+
+
+# ==================== Shard Protocol ====================
+
+def build_shard_query(user_embedding: np.ndarray,
+                      matched_celebrities: List[Dict],
+                      user_occasions: List[str],
+                      user_budget: str,
+                      k: int,
+                      explain: bool = False,
+                      weights: Optional[Dict[str, float]] = None,
+                      lexical_query: Optional[LexicalQuery] = None,
+                      filters: Optional[Dict] = None) -> Dict:
+    """JSON-serializable query a shard answers with its local top-k"""
+    return {
+        'user_embedding': [float(x) for x in user_embedding],
+        'celebrities': [{key: celeb.get(key) for key in _CELEBRITY_FIELDS} for celeb in matched_celebrities],
+        'occasions': list(user_occasions),
+        'budget': user_budget,
+        'k': k,
+        'explain': explain,
+        'weights': weights,
+        'lexical': lexical_query.to_dict() if lexical_query is not None else None,
+        'filters': filters
+    }
+
+
+def serve_shard_query(engine: CelebrityProductRecommender, query: Dict) -> Dict:
+    """
+    Answer a shard query from the local catalog
+
+    Returns:
+        Dict with this shard's best `k` candidates (best first) and bookkeeping
+    """
+    candidates = engine.top_candidates(
+        np.asarray(query['user_embedding'], dtype=np.float32),
+        query['celebrities'],
+        query.get('occasions') or [],
+        query.get('budget', 'moderate'),
+        k=int(query['k']),
+        explain=bool(query.get('explain')),
+        weights=engine.resolve_weights(query.get('weights')),
+        lexical_query=LexicalQuery.from_dict(query['lexical']) if query.get('lexical') else None,
+        filters=query.get('filters')
+    )
+    # Explainers reference local columns, so shards explain their own top-k before replying
+    engine.explain(candidates)
+    # The coordinator diversifies by embedding similarity without holding the catalog
+    for candidate, embedding in zip(candidates, engine.candidate_embeddings(candidates).tolist()):
+        candidate['embedding'] = embedding
+    return {
+        'shard': list(engine.shard) if engine.shard else None,
+        'catalog_version': engine.version,
+        'products_scored': (len(engine.catalog.filter_rows(query['filters'])) if query.get('filters')
+                            else engine.catalog.live_count),
+        'candidates': candidates
+    }
+
+
+def serve_term_stats(engine: CelebrityProductRecommender, terms: List[str]) -> Dict:
+    """Live products, total text length and document frequencies of `terms` in the local catalog"""
+    return engine.catalog.lexical.term_stats(terms)
+
+
+def serve_facets(engine: CelebrityProductRecommender, filters: Optional[Dict]) -> Dict:
+    """Facet counts of the local products passing `filters`"""
+    return engine.facet_counts(filters)
+
+
+def merge_candidates(responses: List[Dict], k: int) -> List[Dict]:
+    """
+    Global top-k from per-shard top-k lists
+
+    Ties are broken by shard order then local rank, which for contiguous
+    shards is the catalog order a single process would use.
+    """
+    streams = [
+        ((-candidate['score'], shard, rank, candidate) for rank, candidate in enumerate(response['candidates']))
+        for shard, response in enumerate(responses)
+    ]
+    merged = heapq.merge(*streams, key=lambda entry: entry[:3])
+    return [entry[3] for _, entry in zip(range(k), merged)]
+
+
+# ==================== Shard Clients ====================
+
+class LocalShardClient:
+    """In-process shard (tests, benchmarks, single-node fallback)"""
+
+    def __init__(self, engine: CelebrityProductRecommender):
+        self.engine = engine
+        self.name = f"local:{engine.shard}"
+
+    def candidates(self, query: Dict) -> Dict:
+        return serve_shard_query(self.engine, query)
+
+    def term_stats(self, terms: List[str]) -> Dict:
+        return serve_term_stats(self.engine, terms)
+
+    def facets(self, filters: Optional[Dict]) -> Dict:
+        return serve_facets(self.engine, filters)
+
+    def healthy(self) -> bool:
+        return True
+
+
+class HttpShardClient:
+    """
+    Shard served by another API process (`SHARD_INDEX`/`SHARD_COUNT`) over HTTP
+
+    One keep-alive connection per calling thread; dependency-free.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        parts = urlsplit(url)
+        self.name = url
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self, fresh: bool = False) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or fresh:
+            if conn is not None:
+                conn.close()
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        for attempt in range(2):
+            # A pooled connection may have been closed by the server; retry once on a fresh one
+            conn = self._connection(fresh=attempt > 0)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError) as e:
+                error = e
+            except OSError as e:
+                conn.close()
+                raise ShardError(f"shard {self.name}: {e}") from e
+        raise ShardError(f"shard {self.name}: {error}")
+
+    def candidates(self, query: Dict) -> Dict:
+        return self._post(SHARD_PATH, query)
+
+    def term_stats(self, terms: List[str]) -> Dict:
+        return self._post(TERM_STATS_PATH, {'terms': terms})
+
+    def facets(self, filters: Optional[Dict]) -> Dict:
+        return self._post(FACETS_PATH, {'filters': filters})
+
+    def _post(self, path: str, payload: Dict) -> Dict:
+        status, body = self._request('POST', path, json.dumps(payload).encode('utf-8'))
+        if status != 200:
+            raise ShardError(f"shard {self.name} returned HTTP {status}: {body[:200]!r}")
+        return json.loads(body)
+
+    def healthy(self) -> bool:
+        try:
+            status, body = self._request('GET', '/health')
+            return status == 200 and json.loads(body).get('recommender_loaded', False)
+        except (ShardError, ValueError):
+            return False
+
+
+# ==================== Coordinator ====================
+
+class ShardedRecommender(CelebrityProductRecommender):
+    """
+    Coordinator: encodes the user and matches celebrities once, fans the
+    query out to every shard and merges their local top-k lists
+
+    Holds no products itself, so the catalog can be larger than one
+    instance's memory. Diversity selection runs on the merged candidates
+    exactly as in the single-process engine.
+    """
+
+    def __init__(self, data_dir: str = '.', shards: List = (), encoder=None, startup_timeout: float = 60.0):
+        """
+        Args:
+            data_dir: Directory with the celebrity data files
+            shards: Shard clients, in catalog order
+            encoder: Optional query encoder (see CelebrityProductRecommender)
+            startup_timeout: Seconds to wait for every shard to report healthy
+        """
+        if not shards:
+            raise ValueError("ShardedRecommender needs at least one shard")
+        self.data_dir = Path(data_dir)
+        self.shard = None
+        self.shards = list(shards)
+        self._init_weights()
+
+        logger.info("Initializing sharded recommender over %d shards...", len(self.shards))
+        self._load_projection()
+        self._load_celebrities()
+        self._load_encoder(encoder)
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix='shard-fanout')
+        self.wait_for_shards(startup_timeout)
+        logger.info("✓ Recommender ready!")
+
+    def wait_for_shards(self, timeout: float):
+        deadline = time.perf_counter() + timeout
+        pending = list(self.shards)
+        while pending:
+            pending = [shard for shard in pending if not shard.healthy()]
+            if not pending:
+                break
+            if time.perf_counter() > deadline:
+                raise ShardError(f"shards not ready after {timeout:.0f}s: {', '.join(s.name for s in pending)}")
+            time.sleep(0.5)
+
+    def product_similarity(self, user_embedding: np.ndarray, rows: Optional[np.ndarray] = None) -> None:
+        """Products live on the shards, so there is no local similarity column"""
+        return None
+
+    def candidate_embeddings(self, candidates: List[Dict]) -> np.ndarray:
+        """Embeddings the shards sent along with their candidates"""
+        return np.asarray([candidate['embedding'] for candidate in candidates], dtype=np.float32)
+
+    def lexical_query(self, text: Optional[str]) -> Optional[LexicalQuery]:
+        """
+        Analyze free text with corpus statistics summed over every shard
+
+        BM25 idf and the average length depend on the whole catalog, so the
+        shards' term counts are gathered first; each shard then scores its
+        products exactly as one process holding the full catalog would.
+        """
+        terms = query_terms(text)
+        if not terms:
+            return None
+        responses = list(self._pool.map(lambda shard: shard.term_stats(terms), self.shards))
+        stats = merge_term_stats(responses)
+        return LexicalQuery(terms, stats['documents'], stats['total_length'], stats['df'])
+
+    def facet_counts(self, filters: Optional[Dict] = None) -> Dict[str, Dict[str, int]]:
+        """Facet counts summed over every shard's products passing `filters`"""
+        responses = list(self._pool.map(lambda shard: shard.facets(filters), self.shards))
+        return merge_facet_counts(responses)
+
+    def top_candidates(self,
+                       user_embedding: np.ndarray,
+                       matched_celebrities: List[Dict],
+                       user_occasions: List[str],
+                       user_budget: str,
+                       k: int,
+                       explain: bool = False,
+                       product_similarity: Optional[np.ndarray] = None,
+                       weights: Optional[Dict[str, float]] = None,
+                       lexical_query: Optional[LexicalQuery] = None,
+                       filters: Optional[Dict] = None) -> List[Dict]:
+        """Scatter the query to every shard and gather the global top-k (each shard computes its own similarity)"""
+        query = build_shard_query(user_embedding, matched_celebrities, user_occasions, user_budget, k, explain,
+                                  weights=weights if weights is not self.weights else None,
+                                  lexical_query=lexical_query, filters=filters)
+        with timed_stage('shard_fanout'):
+            responses = list(self._pool.map(lambda shard: shard.candidates(query), self.shards))
+        with timed_stage('shard_merge'):
+            candidates = merge_candidates(responses, k)
+        trace_count('shards', len(responses))
+        trace_count('products_scored', sum(r['products_scored'] for r in responses))
+        return candidates
+
+
+# ==================== CLI ====================
+
+def spawn_shards(count: int, base_port: int, stub_encoder: bool) -> List[subprocess.Popen]:
+    """Start one `uvicorn main:app` per shard on consecutive localhost ports"""
+    processes = []
+    for index in range(count):
+        env = dict(os.environ, SHARD_INDEX=str(index), SHARD_COUNT=str(count))
+        env.pop('SHARD_URLS', None)
+        if stub_encoder:
+            env['EVOL_STUB_ENCODER'] = '1'
+        env.setdefault('LOG_LEVEL', 'WARNING')
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1',
+             '--port', str(base_port + index), '--log-level', 'warning'],
+            env=env
+        ))
+    return processes
+
+
+def compare(shards: List, encoder, queries: int, top_n: int) -> Dict:
+    """Check that the sharded pipeline ranks exactly like a single process"""
+    from load_test import SurveyGenerator
+    from main import generate_lexical_text, generate_user_vibe_text, map_budget_to_tier, SurveyResponse
+
+    single = CelebrityProductRecommender('.', encoder=encoder)
+    sharded = ShardedRecommender('.', shards, encoder=encoder)
+    surveys = SurveyGenerator(repeat_ratio=0.0, seed=0)
+    identical = 0
+    timings = {'single': [], 'sharded': []}
+    for _ in range(queries):
+        survey = SurveyResponse(**surveys.survey())
+        args = (generate_user_vibe_text(survey), survey.occasions, map_budget_to_tier(survey.budget), top_n)
+        results = {}
+        for name, engine in (('single', single), ('sharded', sharded)):
+            started = time.perf_counter()
+            recommendations, _ = engine.recommend_products(*args, lexical_text=generate_lexical_text(survey))
+            timings[name].append((time.perf_counter() - started) * 1000.0)
+            results[name] = [rec['product']['id'] for rec in recommendations]
+        identical += results['single'] == results['sharded']
+    return {
+        'queries': queries,
+        'identical': identical,
+        'p50_ms': {name: float(np.percentile(values, 50)) for name, values in timings.items()}
+    }
+
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Sharded catalog tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    spawn = sub.add_parser('spawn', help="Run N local shard servers until interrupted")
+    spawn.add_argument('--count', type=int, default=2, help="Number of shards")
+    spawn.add_argument('--base-port', type=int, default=8101, help="Port of shard 0 (shard i uses base+i)")
+    spawn.add_argument('--stub-encoder', action='store_true', help="Use the offline HashingEncoder")
+
+    check = sub.add_parser('compare', help="Compare sharded vs single-process rankings")
+    check.add_argument('--shards', default=None,
+                       help="Comma-separated shard URLs (default: --count in-process shards)")
+    check.add_argument('--count', type=int, default=4, help="In-process shards when --shards is not given")
+    check.add_argument('--queries', type=int, default=50, help="Generated surveys to compare")
+    check.add_argument('--top-n', type=int, default=10, help="top_n per query")
+    check.add_argument('--stub-encoder', action='store_true', help="Use the offline HashingEncoder")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Catalog Sharding")
+    print("=" * 60)
+
+    if args.command == 'spawn':
+        processes = spawn_shards(args.count, args.base_port, args.stub_encoder)
+        # Stop the shards on `kill` as well as Ctrl-C
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        urls = ','.join(f"http://127.0.0.1:{args.base_port + i}" for i in range(args.count))
+        print(f"✓ Started {args.count} shard servers")
+        print(f"\nRun the coordinator with:\n  SHARD_URLS={urls} uvicorn main:app")
+        try:
+            for process in processes:
+                process.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=30)
+        return
+
+    # One query encoder shared by every in-process engine
+    encoder = HashingEncoder() if args.stub_encoder else SentenceTransformer(DEFAULT_MODEL_NAME)
+    if args.shards:
+        shards = [HttpShardClient(url) for url in args.shards.split(',')]
+    else:
+        shards = [LocalShardClient(CelebrityProductRecommender('.', encoder=encoder, shard=(i, args.count)))
+                  for i in range(args.count)]
+    report = compare(shards, encoder, args.queries, args.top_n)
+    print(f"✓ Identical rankings: {report['identical']}/{report['queries']}")
+    print(f"  p50 single: {report['p50_ms']['single']:.2f} ms, sharded: {report['p50_ms']['sharded']:.2f} ms")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
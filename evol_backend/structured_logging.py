@@ -0,0 +1,105 @@
+"""
+Structured Logging
+JSON log lines written off the request thread through a queue handler
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Attribute on a LogRecord carrying structured fields (pass via ``extra``)
+FIELDS_ATTR = 'fields'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line
+
+    Uses the ``severity`` / ``message`` keys Cloud Logging understands, so
+    entries are indexed as structured payloads instead of plain text.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'severity': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        fields = getattr(record, FIELDS_ATTR, None)
+        if fields:
+            payload.update(fields)
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development; structured fields appended as JSON"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, FIELDS_ATTR, None)
+        if fields:
+            line = f"{line} {json.dumps(fields, ensure_ascii=False, default=str)}"
+        return line
+
+
+def setup_logging(level: Optional[str] = None,
+                  fmt: Optional[str] = None) -> logging.handlers.QueueListener:
+    """
+    Route the root logger through a queue so request threads never block on stdout
+
+    Args:
+        level: Log level name (default: LOG_LEVEL env var, else INFO)
+        fmt: 'json' or 'text' (default: LOG_FORMAT env var, else json)
+
+    Returns:
+        The running QueueListener (stopped automatically at exit)
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.environ.get('LOG_FORMAT', 'json')).lower()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_event(logger: logging.Logger, message: str, level: int = logging.INFO, **fields):
+    """Emit a single structured log line (skipped entirely if the level is disabled)"""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={FIELDS_ATTR: fields})
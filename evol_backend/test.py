@@ -3,6 +3,7 @@ Main Recommendation System
 End-to-end workflow for generating jewelry recommendations
 """
 
+import logging
 import sys
 from pathlib import Path
 
@@ -135,6 +136,7 @@ def main():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     try:
         main()
     except KeyboardInterrupt:
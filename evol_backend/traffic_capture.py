@@ -0,0 +1,168 @@
+"""
+Traffic Capture
+Samples sanitized API requests and their outcomes into rotating JSONL files for replay
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Survey fields that hold free text typed by the customer
+FREE_TEXT_FIELDS = ('celebrity_inspiration', 'additional_preferences')
+MAX_FREE_TEXT_LENGTH = 200
+
+_EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_URL_RE = re.compile(r'https?://\S+')
+_PHONE_RE = re.compile(r'\+?\d[\d\s().-]{6,}\d')
+
+
+def scrub_text(text: Optional[str]) -> Optional[str]:
+    """Remove e-mail addresses, URLs and phone numbers from free text and cap its length"""
+    if not text:
+        return text
+    text = _EMAIL_RE.sub('[email]', text)
+    text = _URL_RE.sub('[url]', text)
+    text = _PHONE_RE.sub('[phone]', text)
+    return text[:MAX_FREE_TEXT_LENGTH]
+
+
+def sanitize_survey(survey: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a survey dict with free-text answers scrubbed"""
+    clean = dict(survey)
+    for name in FREE_TEXT_FIELDS:
+        if name in clean:
+            clean[name] = scrub_text(clean[name])
+    return clean
+
+
+def sanitize_request(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Sanitize a request payload that is either a survey or wraps one under 'survey'"""
+    clean = dict(payload)
+    if 'survey' in clean and isinstance(clean['survey'], dict):
+        clean['survey'] = sanitize_survey(clean['survey'])
+    else:
+        clean = sanitize_survey(clean)
+    return clean
+
+
+class TrafficRecorder:
+    """
+    Writes a sample of requests to rotating JSONL files
+
+    Records are handed to a background listener thread through a queue,
+    so a sampled request only pays for building one dict.
+    """
+
+    def __init__(self,
+                 directory: str = 'captures',
+                 sample_rate: float = 0.0,
+                 max_bytes: int = 50 * 1024 * 1024,
+                 backup_count: int = 10):
+        """
+        Args:
+            directory: Output directory (capture.jsonl, capture.jsonl.1, ...)
+            sample_rate: Fraction of requests to record (0 disables capture)
+            max_bytes: Rotate the active file once it exceeds this size
+            backup_count: Number of rotated files to keep
+        """
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.recorded = 0
+        self._logger: Optional[logging.Logger] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+
+    @classmethod
+    def from_env(cls) -> 'TrafficRecorder':
+        """Build a recorder from CAPTURE_* environment variables"""
+        return cls(
+            directory=os.environ.get('CAPTURE_DIR', 'captures'),
+            sample_rate=float(os.environ.get('CAPTURE_SAMPLE_RATE', '0')),
+            max_bytes=int(os.environ.get('CAPTURE_MAX_BYTES', str(50 * 1024 * 1024))),
+            backup_count=int(os.environ.get('CAPTURE_BACKUP_COUNT', '10'))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def should_record(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _ensure_started(self):
+        if self._logger is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            self.directory / 'capture.jsonl',
+            maxBytes=self.max_bytes,
+            backupCount=self.backup_count,
+            encoding='utf-8'
+        )
+        file_handler.setFormatter(logging.Formatter('%(message)s'))
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._listener = logging.handlers.QueueListener(log_queue, file_handler)
+        self._listener.start()
+
+        capture_logger = logging.getLogger('evol.capture')
+        capture_logger.propagate = False
+        capture_logger.setLevel(logging.INFO)
+        capture_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        self._logger = capture_logger
+
+    def record(self,
+               endpoint: str,
+               payload: Dict[str, Any],
+               status_code: int,
+               latency_ms: float,
+               product_ids: Optional[List[Any]] = None,
+               celebrity_ids: Optional[List[Any]] = None,
+               params: Optional[Dict[str, Any]] = None):
+        """Queue one capture record (call only for sampled requests)"""
+        self._ensure_started()
+        record = {
+            'ts': time.time(),
+            'endpoint': endpoint,
+            'params': params or {},
+            'request': sanitize_request(payload),
+            'status': status_code,
+            'latency_ms': round(latency_ms, 3),
+            'product_ids': product_ids or [],
+            'celebrity_ids': celebrity_ids or []
+        }
+        self._logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        self.recorded += 1
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        if self._logger is not None:
+            for handler in list(self._logger.handlers):
+                self._logger.removeHandler(handler)
+            self._logger = None
+
+
+def read_capture(paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Load capture records from one or more JSONL files, ordered by timestamp
+
+    Rotated files (capture.jsonl.N) can be passed in any order.
+    """
+    records = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    records.sort(key=lambda r: r.get('ts', 0.0))
+    return records